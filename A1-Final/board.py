@@ -168,15 +168,27 @@ def read_from_file(filename: str) -> Board:
     """
 
     puzzle_file = open(filename, "r")
-    counter = 0
-    width = -1
-    height = -1
-    name = ""
+    board = read_from_lines(puzzle_file)
+    puzzle_file.close()
+    return board
+
 
+def read_from_lines(lines) -> Board:
+    """
+    Reads in the puzzle from the given lines, in the same format
+    as a puzzle file, and returns a Board
+
+    :param lines: The lines of the puzzle.
+    :type lines: Iterable[str]
+    :return: the loaded Board
+    :rtype: Board
+    """
+
+    counter = 0
     row = 0
     board = Board("", -1, -1, [], [], [], [])
 
-    for line in puzzle_file:
+    for line in lines:
 
         if counter == 0: # first line has name of puzzle
             board.name = line.strip()
@@ -205,5 +217,4 @@ def read_from_file(filename: str) -> Board:
 
         counter += 1
 
-    puzzle_file.close()
-    return board
\ No newline at end of file
+    return board
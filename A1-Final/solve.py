@@ -9,7 +9,12 @@ import heapq
 from heapq import heappush, heappop
 import time
 import argparse
+import json
 import math # for infinity
+import os
+import random
+import socket
+import sys
 
 from board import *
 
@@ -20,6 +25,29 @@ DIRECTIONS = [
     (-1, 0),  # up
 ]
 
+# Outcomes of a search run with a budget
+STATUS_SOLVED = 'solved'
+STATUS_NO_SOLUTION = 'no_solution'
+STATUS_TIME = 'time'
+STATUS_NODES = 'nodes'
+STATUS_MEMORY = 'memory'
+
+# The current memory usage of the process is read from here, which only Linux has
+STATM_PATH = '/proc/self/statm'
+
+
+def get_memory_usage():
+    """
+    Return the resident memory of the process in megabytes.
+
+    :rtype: float
+    """
+
+    with open(STATM_PATH) as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
 def is_goal(state):
     """
     Returns True if the state is the goal state and False otherwise.
@@ -116,6 +144,98 @@ def get_successors(state):
     return successors
 
 
+class SearchBudget:
+    """
+    Limits on how much work a search may do before it gives up.
+
+    Any limit left as None is not enforced. The node limit is checked before
+    every node is expanded; the time and memory limits are checked every
+    check_every nodes, since reading the clock and the process memory is
+    comparatively slow. The memory limit applies to the memory the process
+    gained since the search started, so searches in a long-lived process each
+    get the whole limit.
+    """
+
+    def __init__(self, time_limit=None, node_limit=None, memory_limit=None, check_every=1000):
+        """
+        :param time_limit: the wall time limit in seconds.
+        :type time_limit: Optional[float]
+        :param node_limit: the maximum number of nodes to expand.
+        :type node_limit: Optional[int]
+        :param memory_limit: the memory in megabytes the process may gain during the search.
+        :type memory_limit: Optional[float]
+        :param check_every: how many nodes to expand between time and memory checks.
+        :type check_every: int
+        """
+        if memory_limit is not None and not os.path.exists(STATM_PATH):
+            raise RuntimeError("Memory limits need {}, which this platform lacks".format(STATM_PATH))
+
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.memory_limit = memory_limit
+        self.check_every = check_every
+        self.start()
+
+    def start(self):
+        """
+        Start the clock for the time limit and measure the memory
+        the memory limit is counted from.
+        """
+        self.time_start = time.time()
+        if self.memory_limit is not None:
+            self.memory_start = get_memory_usage()
+
+    def exhausted(self, nodes):
+        """
+        Return the name of the exhausted budget after expanding the given
+        number of nodes, before expanding the next one, or None if the
+        search may continue.
+
+        :param nodes: the number of nodes expanded so far.
+        :type nodes: int
+        :rtype: Optional[str]
+        """
+        if self.node_limit is not None and nodes >= self.node_limit:
+            return STATUS_NODES
+        if nodes % self.check_every != 0:
+            return None
+
+        if self.time_limit is not None and time.time() - self.time_start >= self.time_limit:
+            return STATUS_TIME
+        if self.memory_limit is not None:
+            if get_memory_usage() - self.memory_start >= self.memory_limit:
+                return STATUS_MEMORY
+        return None
+
+
+class SearchResult:
+    """
+    The outcome of a search run with a budget.
+
+    status is one of STATUS_SOLVED, STATUS_NO_SOLUTION or the exhausted budget
+    (STATUS_TIME, STATUS_NODES, STATUS_MEMORY). path and cost describe the
+    solution when there is one, and are [] and -1 otherwise. best_state is the
+    expanded state with the lowest heuristic value, which lets a preempted
+    search still report how far it got.
+    """
+
+    def __init__(self, status, path, cost, best_state, best_h, nodes):
+        self.status = status
+        self.path = path
+        self.cost = cost
+        self.best_state = best_state
+        self.best_h = best_h
+        self.nodes = nodes
+
+    def partial_path(self):
+        """
+        Return the path from the initial state to the best state reached.
+
+        :rtype: List[State]
+        """
+        return get_path(self.best_state)
+
+
 def dfs(init_board):
     """
     Run the DFS algorithm given an initial board.
@@ -130,7 +250,35 @@ def dfs(init_board):
     :return: (the path to goal state, solution cost)
     :rtype: List[State], int
     """
-    
+
+    result = dfs_search(init_board)
+    return result.path, result.cost
+
+
+def dfs_search(init_board, budget=None, hfn=None):
+    """
+    Run the DFS algorithm given an initial board, stopping early
+    if the given budget runs out.
+
+    DFS does not use a heuristic to choose nodes, but hfn is used to
+    pick the best state reached if the search is stopped early.
+
+    :param init_board: The initial board.
+    :type init_board: Board
+    :param budget: The search budget, or None for no limits.
+    :type budget: Optional[SearchBudget]
+    :param hfn: The heuristic function used to rank the states reached.
+        Defaults to the basic heuristic.
+    :type hfn: Optional[Heuristic]
+    :return: the outcome of the search
+    :rtype: SearchResult
+    """
+
+    if hfn is None:
+        hfn = heuristic_basic
+    if budget is not None:
+        budget.start()
+
     hashed_board = init_board.__hash__()
     frontier = [hashed_board]
     explored = set()
@@ -138,13 +286,29 @@ def dfs(init_board):
     states = {}
     states[hashed_board] = State(init_board, heuristic_zero, 0, 0, None)
 
+    best_state, best_h = states[hashed_board], hfn(init_board)
+    nodes = 0
+
     while frontier:
         current = frontier.pop()
         explored.add(current)
 
         current_state = states[current]
         if is_goal(current_state):
-            return get_path(current_state), current_state.depth
+            return SearchResult(STATUS_SOLVED, get_path(current_state), current_state.depth,
+                                current_state, 0, nodes)
+
+        if budget is not None:
+            # Ranking states costs a heuristic call, so only do it
+            # when the search can be stopped early
+            h = hfn(current_state.board)
+            if h < best_h:
+                best_state, best_h = current_state, h
+
+            status = budget.exhausted(nodes)
+            if status is not None:
+                return SearchResult(status, [], -1, best_state, best_h, nodes)
+        nodes += 1
         
         successor_states = get_successors(current_state)
         for state in successor_states:
@@ -155,7 +319,7 @@ def dfs(init_board):
             states[hashed_board] = state
             frontier.append(hashed_board)
 
-    return [], -1
+    return SearchResult(STATUS_NO_SOLUTION, [], -1, best_state, best_h, nodes)
 
 
 def a_star(init_board, hfn):
@@ -175,6 +339,28 @@ def a_star(init_board, hfn):
     :rtype: List[State], int
     """
 
+    result = a_star_search(init_board, hfn)
+    return result.path, result.cost
+
+
+def a_star_search(init_board, hfn, budget=None):
+    """
+    Run the A_star search algorithm given an initial board and a heuristic function,
+    stopping early if the given budget runs out.
+
+    :param init_board: The initial starting board.
+    :type init_board: Board
+    :param hfn: The heuristic function.
+    :type hfn: Heuristic (a function that consumes a Board and produces a numeric heuristic value)
+    :param budget: The search budget, or None for no limits.
+    :type budget: Optional[SearchBudget]
+    :return: the outcome of the search
+    :rtype: SearchResult
+    """
+
+    if budget is not None:
+        budget.start()
+
     frontier = []
     init_state = State(init_board, hfn, hfn(init_board), 0, None)
     heappush(frontier, init_state)
@@ -185,12 +371,26 @@ def a_star(init_board, hfn):
     hashed_board = init_board.__hash__()
     states[hashed_board] = init_state
 
+    best_state, best_h = init_state, init_state.f
+    nodes = 0
+
     while frontier:
         current_state = heappop(frontier)
         explored.add(current_state.board.__hash__())
 
         if is_goal(current_state):
-            return get_path(current_state), current_state.depth
+            return SearchResult(STATUS_SOLVED, get_path(current_state), current_state.depth,
+                                current_state, 0, nodes)
+
+        h = current_state.f - current_state.depth
+        if h < best_h:
+            best_state, best_h = current_state, h
+
+        if budget is not None:
+            status = budget.exhausted(nodes)
+            if status is not None:
+                return SearchResult(status, [], -1, best_state, best_h, nodes)
+        nodes += 1
 
         successor_states = get_successors(current_state)
         for state in successor_states:
@@ -206,7 +406,7 @@ def a_star(init_board, hfn):
                 states[hashed_board] = state
                 heappush(frontier, state)
 
-    return [], -1
+    return SearchResult(STATUS_NO_SOLUTION, [], -1, best_state, best_h, nodes)
 
 
 
@@ -306,7 +506,7 @@ def heuristic_advanced(board):
     return total_heuristic
 
 
-def solve_puzzle(board: Board, algorithm: str, hfn):
+def solve_puzzle(board: Board, algorithm: str, hfn, budget=None):
     """
     Solve the given puzzle using the given type of algorithm.
 
@@ -314,9 +514,12 @@ def solve_puzzle(board: Board, algorithm: str, hfn):
     :type algorithm: str
     :param hfn: The heuristic function
     :type hfn: Optional[Heuristic]
+    :param budget: The search budget, or None for no limits.
+    :type budget: Optional[SearchBudget]
 
-    :return: the path from the initial state to the goal state
-    :rtype: List[State]
+    :return: the path from the initial state to the goal state, or to the
+        best state reached if the budget ran out, and the search status
+    :rtype: List[State], str
     """
 
     print("Initial board")
@@ -326,20 +529,30 @@ def solve_puzzle(board: Board, algorithm: str, hfn):
 
     if algorithm == 'a_star':
         print("Executing A* search")
-        path, step = a_star(board, hfn)
+        result = a_star_search(board, hfn, budget)
     elif algorithm == 'dfs':
         print("Executing DFS")
-        path, step = dfs(board)
+        result = dfs_search(board, budget, hfn)
     else:
         raise NotImplementedError
+    path, step = result.path, result.cost
 
     time_end = time.time()
     time_elapsed = time_end - time_start
 
-    if not path:
+    if result.status not in (STATUS_SOLVED, STATUS_NO_SOLUTION):
+
+        print('Search stopped, {} budget exhausted after {} nodes'.format(result.status, result.nodes))
+        print('Best state reached (h = {}, depth {}):'.format(result.best_h, result.best_state.depth))
+        result.best_state.board.display()
+        print('Time taken: {:.2f}s'.format(time_elapsed))
+        # keep the progress so a preempted run can still be recorded
+        return result.partial_path(), result.status
+
+    elif not path:
 
         print('No solution for this puzzle')
-        return []
+        return [], result.status
 
     else:
 
@@ -358,10 +571,557 @@ def solve_puzzle(board: Board, algorithm: str, hfn):
         print('Solution cost: {}'.format(step))
         print('Time taken: {:.2f}s'.format(time_elapsed))
 
-        return path
+        return path, result.status
+
+
+def save_solution(path, filename, status=STATUS_SOLVED):
+    """
+    Write the given solution path to a file, one numbered board per state.
+    The partial path of a search stopped by its budget is written after a
+    line naming the exhausted budget.
+
+    :param path: the path from the initial state to the goal state
+    :type path: List[State]
+    :param filename: The name of the output file.
+    :type filename: str
+    :param status: the status of the search that found the path
+    :type status: str
+    """
+
+    outputfile = open(filename, "w")
+    if status not in (STATUS_SOLVED, STATUS_NO_SOLUTION):
+        print('Partial path, search stopped: {} budget exhausted'.format(status), file=outputfile)
+    counter = 1
+    for state in path:
+        print(counter, file=outputfile)
+        print(state.board, file=outputfile)
+        counter += 1
+    outputfile.close()
+
+
+############################################################
+## Level generator
+############################################################
+
+def carve_floor(width, height, wall_density, rng):
+    """
+    Return the set of floor cells for a width x height level surrounded by walls.
+
+    Interior cells become walls with probability wall_density. Only the largest
+    connected region of floor is kept so every floor cell is reachable.
+
+    :param width: the width of the level
+    :type width: int
+    :param height: the height of the level
+    :type height: int
+    :param wall_density: probability that an interior cell is a wall
+    :type wall_density: float
+    :param rng: the random number generator
+    :type rng: random.Random
+    :return: the reachable floor cells
+    :rtype: Set[tuple]
+    """
 
+    floor = set()
+    for y in range(1, height - 1):
+        for x in range(1, width - 1):
+            if rng.random() >= wall_density:
+                floor.add((x, y))
+
+    # Keep the largest connected region, visiting cells in a fixed order
+    # so that the result only depends on the seed
+    best_region = set()
+    unvisited = set(floor)
+    for cell in sorted(floor):
+        if cell not in unvisited:
+            continue
+        region = {cell}
+        unvisited.discard(cell)
+        stack = [cell]
+        while stack:
+            x, y = stack.pop()
+            for dx, dy in DIRECTIONS:
+                neighbour = (x + dx, y + dy)
+                if neighbour in unvisited:
+                    unvisited.discard(neighbour)
+                    region.add(neighbour)
+                    stack.append(neighbour)
+        if len(region) > len(best_region):
+            best_region = region
+
+    return best_region
+
+
+def reverse_play(floor, boxes, robots, steps, pull_bias, rng):
+    """
+    Scramble a solved level by playing the first robot backwards.
+
+    Every reverse step either walks the robot to a free neighbouring cell or
+    pulls the box behind it along, which undoes a push. The other robots never
+    move, matching get_successors which only moves the first robot,
+    so the forward level is solvable in at most `steps` moves as long as the
+    first robot is still the first one read back from the level file (see
+    is_first_robot).
+
+    :param floor: the reachable floor cells
+    :type floor: Set[tuple]
+    :param boxes: the box positions, modified in place
+    :type boxes: List[tuple]
+    :param robots: the robot positions, modified in place
+    :type robots: List[tuple]
+    :param steps: the number of reverse moves to play
+    :type steps: int
+    :param pull_bias: probability of preferring a pull over a plain walk
+    :type pull_bias: float
+    :param rng: the random number generator
+    :type rng: random.Random
+    """
+
+    previous = None
+    for _ in range(steps):
+        robot = robots[0]
+        occupied = set(boxes) | set(robots)
+
+        walks = []
+        pulls = []
+        backtrack = []
+        for dx, dy in DIRECTIONS:
+            target = (robot[0] + dx, robot[1] + dy)
+            if target not in floor or target in occupied:
+                continue
+            behind = (robot[0] - dx, robot[1] - dy)
+            if behind in boxes:
+                pulls.append((target, behind))
+            # Walking straight back just undoes the last move
+            if target == previous:
+                backtrack.append((target, None))
+            else:
+                walks.append((target, None))
+
+        if not walks:
+            walks = backtrack
+        if not walks and not pulls:
+            return
+
+        if pulls and (not walks or rng.random() < pull_bias):
+            target, box = rng.choice(pulls)
+            boxes[boxes.index(box)] = robot
+        else:
+            target, _ = rng.choice(walks)
+        previous = robot
+        robots[0] = target
+
+
+def row_major(cell):
+    """
+    Return the sort key of a cell in the order read_from_file reads cells in.
+    """
+    return cell[1], cell[0]
+
+
+def is_first_robot(robots):
+    """
+    Return True if the first robot comes first in the order read_from_file
+    reads robots in, so that it is the robot get_successors moves.
+    """
+    return min(robots, key=row_major) == robots[0]
+
+
+def is_solvable(board):
+    """
+    Return True if the level, as written by write_to_file and read back,
+    can be solved by A* search.
+
+    :param board: the generated board
+    :type board: Board
+    :rtype: bool
+    """
 
-if __name__ == "__main__":
+    lines = [board.name + "\n", str(board.width) + "\n", str(board.height) + "\n"]
+    lines += str(board).splitlines(True)
+    path, _ = a_star(read_from_lines(lines), heuristic_basic)
+    return len(path) > 0
+
+
+def box_displacement(boxes, storage):
+    """
+    Return the sum of the Manhattan distances between each box and its
+    closest storage point, which is how far the scramble moved the level
+    away from its goal state.
+    """
+
+    total = 0
+    for box in boxes:
+        total += min(abs(box[0] - point[0]) + abs(box[1] - point[1]) for point in storage)
+    return total
+
+
+def generate_level(width, height, box_count, robot_count=1, steps=50, seed=None,
+                   wall_density=0.1, pull_bias=0.7, attempts=10, name=None):
+    """
+    Generate a solvable Sokoban level by reverse play from a goal state.
+
+    Boxes start on their storage points and the first robot pulls them away,
+    so the same arguments and seed always produce the same level. `steps` is
+    the target solution length: the level can be solved in at most that many
+    moves, and a larger value generally produces a harder level. Out of
+    `attempts` scrambles, the one that moves the boxes furthest from storage
+    is kept.
+
+    With several robots, the solver only moves the robot that comes first in
+    the level file, so scrambles that leave another robot first are dropped,
+    and the level is read back and solved before it is returned.
+
+    :param width: the width of the level, including the outer walls
+    :type width: int
+    :param height: the height of the level, including the outer walls
+    :type height: int
+    :param box_count: the number of boxes (and storage points)
+    :type box_count: int
+    :param robot_count: the number of robots
+    :type robot_count: int
+    :param steps: the number of reverse moves to scramble the level with
+    :type steps: int
+    :param seed: the random seed
+    :type seed: Optional[int]
+    :param wall_density: probability that an interior cell is a wall
+    :type wall_density: float
+    :param pull_bias: probability of preferring a pull over a plain walk
+    :type pull_bias: float
+    :param attempts: the number of scrambles to pick the hardest from
+    :type attempts: int
+    :param name: the name of the level, derived from the arguments if None
+    :type name: Optional[str]
+    :return: the generated board
+    :rtype: Board
+    :raises ValueError: if no scramble gives a solvable level
+    """
+
+    if width < 3 or height < 3:
+        raise ValueError("A level needs to be at least 3x3 to fit its outer walls")
+    if box_count < 1 or robot_count < 1:
+        raise ValueError("A level needs at least one box and one robot")
+
+    rng = random.Random(seed)
+    floor = carve_floor(width, height, wall_density, rng)
+    if len(floor) < box_count + robot_count + 1:
+        raise ValueError("Not enough floor for {} boxes and {} robots".format(box_count, robot_count))
+
+    cells = rng.sample(sorted(floor), box_count + robot_count)
+    storage = cells[:box_count]
+
+    best_boxes, best_robots, best_displacement = None, None, -1
+    for _ in range(max(1, attempts)):
+        boxes = list(storage)
+        # the robot that plays backwards is the one the solver moves
+        robots = sorted(cells[box_count:], key=row_major)
+        reverse_play(floor, boxes, robots, steps, pull_bias, rng)
+        if not is_first_robot(robots):
+            continue
+
+        displacement = box_displacement(boxes, storage)
+        if displacement > best_displacement:
+            best_boxes, best_robots, best_displacement = boxes, robots, displacement
+    if best_robots is None:
+        raise ValueError("No scramble kept the moving robot first, try another seed")
+    boxes, robots = best_boxes, sorted(best_robots, key=row_major)
+
+    obstacles = []
+    for y in range(height):
+        for x in range(width):
+            if (x, y) not in floor:
+                obstacles.append((x, y))
+
+    if name is None:
+        name = "generated-{}x{}-b{}-r{}-s{}-seed{}".format(width, height, box_count, robot_count, steps, seed)
+
+    board = Board(name, width, height, robots, boxes, storage, obstacles)
+    if robot_count > 1 and not is_solvable(board):
+        raise ValueError("The generated level is not solvable, try another seed")
+    return board
+
+
+def write_to_file(board, filename):
+    """
+    Write the board to the given file in the format read by read_from_file.
+
+    :param board: the board to write.
+    :type board: Board
+    :param filename: The name of the output file.
+    :type filename: str
+    """
+
+    with open(filename, "w") as output_file:
+        print(board.name, file=output_file)
+        print(board.width, file=output_file)
+        print(board.height, file=output_file)
+        output_file.write(str(board))
+
+
+def run_generator(argv):
+    """
+    Generate levels from the command line, as "python solve.py generate ...".
+
+    :param argv: the arguments after "generate"
+    :type argv: List[str]
+    """
+
+    parser = argparse.ArgumentParser(prog="solve.py generate")
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The file to write the level to. With --count, a number is added before the extension."
+    )
+    parser.add_argument("--width", type=int, default=8, help="The width of the level.")
+    parser.add_argument("--height", type=int, default=8, help="The height of the level.")
+    parser.add_argument("--boxes", type=int, default=2, help="The number of boxes.")
+    parser.add_argument("--robots", type=int, default=1, help="The number of robots.")
+    parser.add_argument("--steps", type=int, default=50, help="The target solution length.")
+    parser.add_argument("--walls", type=float, default=0.1, help="The density of interior walls.")
+    parser.add_argument("--seed", type=int, default=0, help="The random seed.")
+    parser.add_argument("--count", type=int, default=1, help="The number of levels to generate.")
+    args = parser.parse_args(argv)
+
+    for i in range(args.count):
+        try:
+            board = generate_level(args.width, args.height, args.boxes, args.robots,
+                                   args.steps, args.seed + i, args.walls)
+        except ValueError as error:
+            print("Skipping seed {}: {}".format(args.seed + i, error))
+            continue
+        filename = args.outputfile
+        if args.count > 1:
+            stem, dot, extension = filename.rpartition(".")
+            if not dot:
+                stem, extension = filename, ""
+            filename = "{}_{}{}{}".format(stem, i, dot, extension)
+        write_to_file(board, filename)
+
+
+############################################################
+## Persistent solver
+############################################################
+
+DEFAULT_SOCKET = "/tmp/sokoban_solver.sock"
+DEFAULT_CACHE_SIZE = 256
+
+
+class SolverServer:
+    """
+    A long-lived solver that answers one JSON request per line.
+
+    A request is either a plain level path, or an object with
+    "path" (a level file) or "level" (the level file contents), plus optional
+    "algorithm" ('a_star' or 'dfs'), "heuristic" ('zero', 'basic' or 'advanced'),
+    "outputfile" (where to save the solution in the solve.py format) and
+    "timelimit", "nodelimit" or "memorylimit" (see SearchBudget).
+
+    The response is an object with the level name, the search status, the
+    solution cost, the solution boards, the node count, the time taken to
+    answer and whether the answer came from the cache, or an object with an
+    "error". When there is no solution, the response also
+    has the best state's heuristic value, null if it is infinite, and the
+    partial path to it.
+    Solutions are cached by level contents, algorithm and heuristic, so
+    repeated levels are answered without searching again. A cache size of 0
+    or less turns the cache off.
+    """
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        self.heuristics = {
+            'zero': heuristic_zero,
+            'basic': heuristic_basic,
+            'advanced': heuristic_advanced,
+        }
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def handle_line(self, line):
+        """
+        Answer a single request line and return the response line.
+        """
+        line = line.strip()
+        if not line:
+            return None
+
+        try:
+            if line.startswith("{"):
+                request = json.loads(line)
+            else:
+                request = {"path": line}
+            response = self.handle(request)
+        except Exception as e:
+            response = {"error": "{}: {}".format(type(e).__name__, e)}
+
+        return json.dumps(response, allow_nan=False)
+
+    def handle(self, request):
+        """
+        Solve the level described by the request and return the response.
+        """
+        if "level" in request:
+            text = request["level"]
+        elif "path" in request:
+            with open(request["path"], "r") as f:
+                text = f.read()
+        else:
+            raise ValueError("Request needs a 'path' or a 'level'")
+
+        algorithm = request.get("algorithm", "a_star")
+        heuristic = request.get("heuristic", "advanced")
+        if algorithm not in ('a_star', 'dfs'):
+            raise ValueError("Unknown algorithm {}".format(algorithm))
+        if heuristic not in self.heuristics:
+            raise ValueError("Unknown heuristic {}".format(heuristic))
+
+        budget = None
+        if "timelimit" in request or "nodelimit" in request or "memorylimit" in request:
+            budget = SearchBudget(request.get("timelimit"), request.get("nodelimit"),
+                                             request.get("memorylimit"))
+
+        key = (text, algorithm, heuristic)
+        cached = key in self.cache
+        time_start = time.time()
+        if cached:
+            # Move the entry to the back so the oldest one is evicted first
+            result = self.cache.pop(key)
+        else:
+            board = read_from_lines(text.splitlines(True))
+            if algorithm == 'a_star':
+                result = a_star_search(board, self.heuristics[heuristic], budget)
+            else:
+                result = dfs_search(board, budget, self.heuristics[heuristic])
+        # for a cached answer this is the lookup time, not the original search's
+        elapsed = time.time() - time_start
+
+        # A search stopped by its budget may finish with a bigger one, so only
+        # complete searches are cached
+        if self.cache_size > 0 and result.status in (STATUS_SOLVED, STATUS_NO_SOLUTION):
+            if not cached and len(self.cache) >= self.cache_size:
+                del self.cache[next(iter(self.cache))]
+            self.cache[key] = result
+
+        if "outputfile" in request:
+            if result.status in (STATUS_SOLVED, STATUS_NO_SOLUTION):
+                save_solution(result.path, request["outputfile"], result.status)
+            else:
+                save_solution(result.partial_path(), request["outputfile"], result.status)
+
+        response = {
+            "name": text.split("\n", 1)[0].strip(),
+            "status": result.status,
+            "cost": result.cost,
+            "solution": [str(state.board) for state in result.path],
+            "nodes": result.nodes,
+            "time": elapsed,
+            "cached": cached,
+        }
+        if not result.path:
+            # best_h is infinite when no state was ranked, which JSON cannot hold
+            response["best_h"] = result.best_h if math.isfinite(result.best_h) else None
+            response["partial"] = [str(state.board) for state in result.partial_path()]
+        return response
+
+    def serve_stdin(self):
+        """
+        Answer requests from stdin until it is closed, writing one
+        response line per request to stdout.
+        """
+        for line in sys.stdin:
+            response = self.handle_line(line)
+            if response is not None:
+                print(response, flush=True)
+
+    def serve_socket(self, socket_path):
+        """
+        Answer requests from clients connecting to a Unix socket.
+        Clients are served one at a time; each can send many requests.
+        """
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen()
+        try:
+            while True:
+                connection, _ = server.accept()
+                with connection, connection.makefile("rw") as stream:
+                    for line in stream:
+                        response = self.handle_line(line)
+                        if response is not None:
+                            stream.write(response + "\n")
+                            stream.flush()
+        finally:
+            server.close()
+            os.remove(socket_path)
+
+
+def run_client(socket_path, requests):
+    """
+    Send the request lines to a running server and print the responses.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    with client, client.makefile("rw") as stream:
+        for line in requests:
+            if not line.strip():
+                continue
+            stream.write(line.strip() + "\n")
+            stream.flush()
+            print(stream.readline(), end="", flush=True)
+
+
+def run_server(argv):
+    """
+    Run the persistent solver from the command line, as "python solve.py serve ...".
+
+    :param argv: the arguments after "serve"
+    :type argv: List[str]
+    """
+
+    parser = argparse.ArgumentParser(prog="solve.py serve")
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=None,
+        help="Serve on (or, with --client, connect to) this Unix socket instead of stdin."
+    )
+    parser.add_argument(
+        "--client",
+        action="store_true",
+        help="Send request lines from stdin to a running server."
+    )
+    parser.add_argument(
+        "--cachesize",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="The number of solutions the server keeps, 0 to keep none."
+    )
+    args = parser.parse_args(argv)
+
+    if args.client:
+        run_client(args.socket or DEFAULT_SOCKET, sys.stdin)
+    elif args.socket:
+        SolverServer(args.cachesize).serve_socket(args.socket)
+    else:
+        SolverServer(args.cachesize).serve_stdin()
+
+
+# Tools run as "python solve.py <tool> ...". They live in this file
+# because solve.py is the only file submitted for this assignment.
+TOOLS = {
+    'generate': run_generator,
+    'serve': run_server,
+}
+
+
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] in TOOLS:
+
+    TOOLS[sys.argv[1]](sys.argv[2:])
+
+elif __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -391,6 +1151,27 @@ if __name__ == "__main__":
         choices=['zero', 'basic', 'advanced'],
         help="The heuristic used for any heuristic search."
     )
+    parser.add_argument(
+        "--timelimit",
+        type=float,
+        required=False,
+        default=None,
+        help="Stop searching after this many seconds."
+    )
+    parser.add_argument(
+        "--nodelimit",
+        type=int,
+        required=False,
+        default=None,
+        help="Stop searching after expanding this many nodes."
+    )
+    parser.add_argument(
+        "--memorylimit",
+        type=float,
+        required=False,
+        default=None,
+        help="Stop searching once the process uses this many more megabytes than when the search started."
+    )
     args = parser.parse_args()
 
     # set the heuristic function
@@ -399,21 +1180,23 @@ if __name__ == "__main__":
         heuristic = heuristic_basic
     elif args.heuristic == 'advanced':
         heuristic = heuristic_advanced
+    elif args.heuristic is None and args.algorithm == 'dfs':
+        # DFS only uses a heuristic to rank the states it reached, by default the basic one
+        heuristic = None
 
     # read the boards from the file
     board = read_from_file(args.inputfile)
 
+    # set the search budget
+    budget = None
+    if args.timelimit is not None or args.nodelimit is not None or args.memorylimit is not None:
+        budget = SearchBudget(args.timelimit, args.nodelimit, args.memorylimit)
+
     # solve the puzzles
-    path = solve_puzzle(board, args.algorithm, heuristic)
+    path, status = solve_puzzle(board, args.algorithm, heuristic, budget)
 
     # save solution in output file
-    outputfile = open(args.outputfile, "w")
-    counter = 1
-    for state in path:
-        print(counter, file=outputfile)
-        print(state.board, file=outputfile)
-        counter += 1
-    outputfile.close()
+    save_solution(path, args.outputfile, status)
 
 # if __name__ == "__main__":
 
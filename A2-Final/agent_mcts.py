@@ -0,0 +1,400 @@
+###############################################################################
+# This file implements a Monte Carlo Tree Search (UCT) agent.
+#
+# Every iteration walks down the tree by the UCT rule, adds one new node, and
+# plays random games (rollouts) from it. The rollouts of many new nodes are
+# played together: the nodes are chosen first, each counting its rollouts as
+# losses until they are played (a "virtual loss"), so the choices spread out.
+# With numpy, a batch is played on an array with one board per row, so it
+# costs about as much as a few games in Python. Without numpy, the rollouts
+# are played one at a time on a MancalaState.
+#
+# The subtree of the move played is kept for the next move, and with more
+# than one process each worker grows its own tree and the root statistics
+# are added up (root parallelism).
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+import math
+import multiprocessing
+import random
+import time
+
+from deadline import search_deadline
+from mancala_game import get_sowing_paths
+from mancala_state import as_state
+from utils import *
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Exploration constant of the UCT rule
+UCT_EXPLORATION = 1.4
+# New nodes whose rollouts are played together in one batch
+DEFAULT_BATCH_LEAVES = 32
+# Rollouts played from each new node
+DEFAULT_LEAF_ROLLOUTS = 8
+# Plies below the previous root searched for the current position when reusing the tree
+REUSE_DEPTH = 4
+
+
+class MctsNode(object):
+    """
+    A node of the search tree.
+
+    reward is the total score, for the player who made the move into this node,
+    of the rollouts through it: 1 for a win and 0.5 for a tie.
+    """
+
+    def __init__(self, key, player, moves, parent=None, move=None):
+        """
+        :param key: the position's key, from MancalaState.key
+        :param player: the player to move
+        :param moves: the legal moves
+        :param parent: the parent node
+        :param move: the move from the parent to this node
+        """
+        self.key = key
+        self.player = player
+        self.untried = moves
+        self.parent = parent
+        self.move = move
+        self.children = {}
+        self.visits = 0
+        self.reward = 0.0
+
+    def select_child(self):
+        """
+        Return the child with the highest UCT value.
+        """
+        log_visits = math.log(self.visits)
+        best_value, best_child = float('-inf'), None
+        for child in self.children.values():
+            value = child.reward / child.visits + UCT_EXPLORATION * math.sqrt(log_visits / child.visits)
+            if value > best_value:
+                best_value, best_child = value, child
+        return best_child
+
+    def add_visits(self, count):
+        """
+        Add visits to the node and all its ancestors.
+        """
+        node = self
+        while node is not None:
+            node.visits += count
+            node = node.parent
+
+    def add_reward(self, top_score, count):
+        """
+        Add the score of count rollouts to the node and all its ancestors,
+        for the player who moved into each.
+        """
+        node = self
+        while node.parent is not None:
+            node.reward += top_score if node.parent.player == TOP else count - top_score
+            node = node.parent
+
+    def get_move_stats(self):
+        """
+        Return a dictionary from each root move to its visits and reward.
+        """
+        return {move: (child.visits, child.reward) for move, child in self.children.items()}
+
+
+class BatchRollout(object):
+    """
+    Plays random games on many boards at once.
+    The boards are the rows of an array laid out like MancalaState.cells.
+    """
+
+    def __init__(self, dimension, extra_turn, rng):
+        d = dimension
+        self.dimension = d
+        self.extra_turn = extra_turn
+        self.rng = rng
+
+        self.paths = np.array(get_sowing_paths(d))
+        self.path_length = self.paths.shape[2]
+        self.rows = np.array([np.arange(d), np.arange(d, 2 * d)])
+
+    def play(self, cells, players, moves):
+        """
+        Play one move on each of the boards, with the same rules as MancalaState.make.
+        Modifies the cells. Return the players to move next and which games are over.
+
+        :param cells: the boards, one per row
+        :param players: the player to move on each board
+        :param moves: the move to play on each board
+        """
+        d = self.dimension
+        n = len(cells)
+        index = np.arange(n)
+
+        pockets = players * d + moves
+        stones = cells[index, pockets]
+        cells[index, pockets] = 0
+
+        path = self.paths[players, moves]
+        laps, remainder = np.divmod(stones, self.path_length)
+        cells[index[:, None], path] += laps[:, None] + (np.arange(self.path_length) < remainder[:, None])
+        last = path[index, (stones - 1) % self.path_length]
+
+        # captures
+        captures = (last < 2 * d) & (last // d == players)
+        captures &= cells[index, last] == 1
+        if captures.any():
+            which = index[captures]
+            opposite = np.where(players[captures] == TOP, last[captures] + d, last[captures] - d)
+            cells[which, 2 * d + players[captures]] += cells[which, opposite]
+            cells[which, opposite] = 0
+
+        # end the games that are done
+        top_stones = cells[:, 0:d].sum(axis=1)
+        bottom_stones = cells[:, d:2 * d].sum(axis=1)
+        over = (top_stones == 0) | (bottom_stones == 0)
+        if over.any():
+            cells[over, 2 * d] += top_stones[over]
+            cells[over, 2 * d + 1] += bottom_stones[over]
+            cells[over, 0:2 * d] = 0
+
+        again = (last == 2 * d + players) & ~over if self.extra_turn else np.zeros(n, dtype=bool)
+        return np.where(again, players, 1 - players), over
+
+    def run(self, starts, start_players, count):
+        """
+        Play count random games from each of the boards and return
+        TOP's total score for each of them.
+
+        :param starts: the boards to start from, as lists of cells
+        :param start_players: the player to move on each board
+        """
+        d = self.dimension
+        boards = np.repeat(np.array(starts, dtype=np.int32), count, axis=0)
+        players = np.repeat(np.array(start_players), count)
+        active = np.arange(len(boards))
+
+        while len(active) > 0:
+            current = boards[active]
+            own = current[np.arange(len(active))[:, None], self.rows[players[active]]]
+            choice = (self.rng.random(own.shape) * (own > 0)).argmax(axis=1)
+            next_players, over = self.play(current, players[active], choice)
+            boards[active] = current
+            players[active] = next_players
+            active = active[~over]
+
+        difference = boards[:, 2 * d] - boards[:, 2 * d + 1]
+        scores = (difference > 0) + 0.5 * (difference == 0)
+        return scores.reshape(len(starts), count).sum(axis=1)
+
+
+def python_rollouts(state, player, count, rng):
+    """
+    Play count random games from the state, one at a time,
+    and return TOP's total score. The state is left unchanged.
+    """
+    score = 0.0
+    for _ in range(count):
+        undos = []
+        curr_player = player
+        moves = state.get_possible_moves(curr_player)
+        while moves:
+            undo = state.make(curr_player, rng.choice(moves))
+            undos.append(undo)
+            curr_player = undo[-1]
+            moves = state.get_possible_moves(curr_player)
+
+        score += get_terminal_score(state)
+
+        for undo in reversed(undos):
+            state.unmake(undo)
+    return score
+
+
+def get_terminal_score(state):
+    """
+    Return TOP's score for a finished game.
+    """
+    d = state.dimension
+    difference = state.cells[2 * d] - state.cells[2 * d + 1]
+    return 1.0 if difference > 0 else 0.5 if difference == 0 else 0.0
+
+
+def find_subtree(root, key, player):
+    """
+    Return the node for the position and player to move in the first plies
+    below the root, or None.
+    """
+    level = [root]
+    for _ in range(REUSE_DEPTH + 1):
+        next_level = []
+        for node in level:
+            if node.key == key and node.player == player:
+                return node
+            next_level.extend(node.children.values())
+        level = next_level
+    return None
+
+
+def mcts_search(board, curr_player, time_budget, iteration_limit, batch_leaves, leaf_rollouts, rng, root=None):
+    """
+    Grow a search tree from the board until the time budget is spent or
+    iteration_limit nodes have been added (no limit if it is negative).
+    Return the root of the tree.
+
+    :param batch_leaves: the number of new nodes whose rollouts are played together
+    :param leaf_rollouts: the number of rollouts played from each new node
+    :param root: a node for the same position to continue from, from an earlier search
+    """
+
+    state = as_state(board).copy()
+    if np is not None:
+        batch = BatchRollout(state.dimension, state.extra_turn, np.random.default_rng(rng.getrandbits(32)))
+
+    if root is None:
+        root = MctsNode(state.key(), curr_player, state.get_possible_moves(curr_player))
+    root.parent = None
+
+    deadline = time.perf_counter() + time_budget
+    iterations = 0
+    while time.perf_counter() < deadline and (iteration_limit < 0 or iterations < iteration_limit):
+        leaves, starts, players = [], [], []
+        for _ in range(batch_leaves):
+            if 0 <= iteration_limit <= iterations:
+                break
+            iterations += 1
+            node = root
+            undos = []
+
+            # selection
+            while not node.untried and node.children:
+                node = node.select_child()
+                undos.append(state.make(node.parent.player, node.move))
+
+            # expansion
+            if node.untried:
+                move = node.untried.pop(rng.randrange(len(node.untried)))
+                undo = state.make(node.player, move)
+                undos.append(undo)
+                next_player = undo[-1]
+                child = MctsNode(state.key(), next_player, state.get_possible_moves(next_player), node, move)
+                node.children[move] = child
+                node = child
+
+            # the visits count before the rollouts are played, as a virtual loss
+            node.add_visits(leaf_rollouts)
+            if not node.untried and not node.children:
+                node.add_reward(leaf_rollouts * get_terminal_score(state), leaf_rollouts)
+            elif np is None:
+                node.add_reward(python_rollouts(state, node.player, leaf_rollouts, rng), leaf_rollouts)
+            else:
+                leaves.append(node)
+                starts.append(list(state.cells))
+                players.append(node.player)
+
+            for undo in reversed(undos):
+                state.unmake(undo)
+
+        # simulation and backpropagation of the batch
+        if leaves:
+            scores = batch.run(starts, players, leaf_rollouts)
+            for node, top_score in zip(leaves, scores):
+                node.add_reward(float(top_score), leaf_rollouts)
+
+    return root
+
+
+def _mcts_worker(board, curr_player, time_budget, iteration_limit, batch_leaves, leaf_rollouts, seed):
+    root = mcts_search(board, curr_player, time_budget, iteration_limit, batch_leaves, leaf_rollouts, random.Random(seed))
+    return root.get_move_stats()
+
+
+def get_mcts_pool(optimizations):
+    """
+    Return the worker pool kept in the optimizations dictionary, creating it the first time.
+    """
+    if "mcts_pool" not in optimizations:
+        optimizations["mcts_pool"] = multiprocessing.Pool(optimizations["processes"])
+    return optimizations["mcts_pool"]
+
+
+def close_mcts_pool(optimizations):
+    """
+    Shut down the worker pool kept in the optimizations dictionary, if any.
+    """
+    if "mcts_pool" in optimizations:
+        pool = optimizations.pop("mcts_pool")
+        pool.terminate()
+        pool.join()
+
+
+def mcts_choose_move(board, curr_player, time_budget, iteration_limit, optimizations):
+    """
+    Perform Monte Carlo Tree Search and return the most visited move and its
+    estimated chance of winning for the current player.
+
+    With optimizations["processes"] above 1, each worker grows its own tree and
+    the visits of the root moves are added up. Otherwise the tree is kept under
+    "mcts_root" and the part below the move played is reused for the next move.
+
+    :param board: the current board
+    :param curr_player: the current player
+    :param time_budget: the time budget in seconds
+    :param iteration_limit: the largest number of nodes to add to the tree, -1 for no limit
+    :param optimizations: a dictionary to contain any data structures for optimizations.
+    :return the best move and its estimated chance of winning.
+    """
+
+    state = as_state(board)
+    moves = state.get_possible_moves(curr_player)
+    if len(moves) == 0:
+        return None, get_terminal_score(state) if curr_player == TOP else 1 - get_terminal_score(state)
+
+    batch_leaves = optimizations.get("batch_leaves", DEFAULT_BATCH_LEAVES)
+    leaf_rollouts = optimizations.get("leaf_rollouts", DEFAULT_LEAF_ROLLOUTS)
+    rng = optimizations.setdefault("mcts_rng", random.Random(0))
+    processes = optimizations.get("processes") or 1
+
+    if processes > 1:
+        pool = get_mcts_pool(optimizations)
+        tasks = [(state.to_board(), curr_player, time_budget, iteration_limit, batch_leaves, leaf_rollouts, rng.getrandbits(32))
+                 for _ in range(processes)]
+        stats = {}
+        for worker_stats in pool.starmap(_mcts_worker, tasks):
+            for move, (visits, reward) in worker_stats.items():
+                total_visits, total_reward = stats.get(move, (0, 0.0))
+                stats[move] = total_visits + visits, total_reward + reward
+    else:
+        root = None
+        if "mcts_root" in optimizations:
+            root = find_subtree(optimizations["mcts_root"], state.key(), curr_player)
+        root = mcts_search(state, curr_player, time_budget, iteration_limit, batch_leaves, leaf_rollouts, rng, root)
+        stats = root.get_move_stats()
+
+    if not stats:
+        return moves[0], 0.5
+
+    best_move = max(stats, key=lambda move: stats[move][0])
+    visits, reward = stats[best_move]
+    if processes <= 1:
+        # keep only the subtree of the move played
+        subtree = root.children[best_move]
+        subtree.parent = None
+        optimizations["mcts_root"] = subtree
+    return best_move, reward / visits
+
+
+@search_deadline(TIMEOUT)
+def run_mcts(curr_board, player, limit, optimizations, hfunc):
+    """
+    The limit is the largest number of nodes added to the tree, and the heuristic is not used.
+    """
+    if optimizations is None:
+        optimizations = {}
+
+    time_budget = optimizations.get("time_budget", DEFAULT_MOVE_TIME)
+    move, value = mcts_choose_move(curr_board, player, time_budget, limit, optimizations)
+
+    return move, value
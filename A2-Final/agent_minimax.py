@@ -4,9 +4,9 @@
 # CSC 384 Assignment 2 Starter Code
 # version 2.0
 ###############################################################################
-from wrapt_timeout_decorator import timeout
-
-from mancala_game import play_move
+from canonical import get_key_function
+from deadline import search_deadline
+from mancala_state import as_state
 from utils import *
 
 def minimax_max_basic(board, curr_player, heuristic_func):
@@ -21,14 +21,19 @@ def minimax_max_basic(board, curr_player, heuristic_func):
     :return the best move and its minimax value according to minimax search.
     """
 
+    board = as_state(board)
+
     moves = board.get_possible_moves(curr_player)
     if len(moves) == 0:
         return None, heuristic_func(board, curr_player)
 
     best_value, best_move = float('-inf'), None
     for move in moves:
-        new_board = play_move(board, curr_player, move)
-        _, value = minimax_min_basic(new_board, get_opponent(curr_player), heuristic_func)
+        undo = board.make(curr_player, move)
+        next_player = undo[-1]
+        search = minimax_max_basic if next_player == curr_player else minimax_min_basic
+        _, value = search(board, next_player, heuristic_func)
+        board.unmake(undo)
         if value > best_value:
             best_value, best_move = value, move
 
@@ -47,14 +52,19 @@ def minimax_min_basic(board, curr_player, heuristic_func):
     :return the best move and its minimax value according to minimax search.
     """
 
+    board = as_state(board)
+
     moves = board.get_possible_moves(curr_player)
     if len(moves) == 0:
         return None, heuristic_func(board, get_opponent(curr_player))
     
     best_value, best_move = float('inf'), None
     for move in moves:
-        new_board = play_move(board, curr_player, move)
-        _, value = minimax_max_basic(new_board, get_opponent(curr_player), heuristic_func)
+        undo = board.make(curr_player, move)
+        next_player = undo[-1]
+        search = minimax_min_basic if next_player == curr_player else minimax_max_basic
+        _, value = search(board, next_player, heuristic_func)
+        board.unmake(undo)
         if value < best_value:
             best_value, best_move = value, move
 
@@ -75,6 +85,8 @@ def minimax_max_limit(board, curr_player, heuristic_func, depth_limit):
     :return the best move and its minimmax value estimated by our heuristic function.
     """
 
+    board = as_state(board)
+
     if depth_limit == 0:
         return None, heuristic_func(board, curr_player)
 
@@ -84,8 +96,11 @@ def minimax_max_limit(board, curr_player, heuristic_func, depth_limit):
 
     best_value, best_move = float('-inf'), None
     for move in moves:
-        new_board = play_move(board, curr_player, move)
-        _, value = minimax_min_limit(new_board, get_opponent(curr_player), heuristic_func, depth_limit - 1)
+        undo = board.make(curr_player, move)
+        next_player = undo[-1]
+        search = minimax_max_limit if next_player == curr_player else minimax_min_limit
+        _, value = search(board, next_player, heuristic_func, depth_limit - 1)
+        board.unmake(undo)
         if value > best_value:
             best_value, best_move = value, move
 
@@ -105,6 +120,8 @@ def minimax_min_limit(board, curr_player, heuristic_func, depth_limit):
     :return the best move and its minimmax value estimated by our heuristic function.
     """
 
+    board = as_state(board)
+
     if depth_limit == 0:
         return None, heuristic_func(board, get_opponent(curr_player))
 
@@ -114,8 +131,11 @@ def minimax_min_limit(board, curr_player, heuristic_func, depth_limit):
     
     best_value, best_move = float('inf'), None
     for move in moves:
-        new_board = play_move(board, curr_player, move)
-        _, value = minimax_max_limit(new_board, get_opponent(curr_player), heuristic_func, depth_limit - 1)
+        undo = board.make(curr_player, move)
+        next_player = undo[-1]
+        search = minimax_min_limit if next_player == curr_player else minimax_max_limit
+        _, value = search(board, next_player, heuristic_func, depth_limit - 1)
+        board.unmake(undo)
         if value < best_value:
             best_value, best_move = value, move
 
@@ -134,9 +154,13 @@ def minimax_max_limit_opt(board, curr_player, heuristic_func, depth_limit, optim
     :param depth_limit: the depth limit
     :param optimizations: a dictionary to contain any data structures for optimizations.
         You can use a dictionary called "cache" to implement caching.
+        If a SearchStats is kept under "stats", the cache lookups are counted in it.
+        Values are cached under the canonical key for the heuristic (see canonical.py).
     :return the best move and its minimmax value estimated by our heuristic function.
     """
 
+    board = as_state(board)
+
     if depth_limit == 0:
         return None, heuristic_func(board, curr_player)
 
@@ -145,21 +169,34 @@ def minimax_max_limit_opt(board, curr_player, heuristic_func, depth_limit, optim
         return None, heuristic_func(board, curr_player)
 
     cache = optimizations['cache']
+    stats = optimizations.get('stats')
+    key_func = get_key_function(optimizations, heuristic_func)
     best_value, best_move = float('-inf'), None
     for move in moves:
-        new_board = play_move(board, curr_player, move)
-        ck = new_board.__hash__()
+        undo = board.make(curr_player, move)
+        next_player = undo[-1]
+        ck, _, negated = key_func(board, next_player, curr_player)
 
         value = None
         if ck in cache:
             depth, cached_value = cache[ck]
             if depth >= depth_limit - 1:
-                value = cached_value
-        
+                value = -cached_value if negated else cached_value
+
+        if stats is not None:
+            if value is not None:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+                if ck in cache:
+                    stats.cache_overwrites += 1
+
         if value is None:
-            _, value = minimax_min_limit_opt(new_board, get_opponent(curr_player), heuristic_func, depth_limit - 1, optimizations)
-            cache[ck] = depth_limit - 1, value
+            search = minimax_max_limit_opt if next_player == curr_player else minimax_min_limit_opt
+            _, value = search(board, next_player, heuristic_func, depth_limit - 1, optimizations)
+            cache[ck] = depth_limit - 1, -value if negated else value
     
+        board.unmake(undo)
         if value > best_value:
             best_value, best_move = value, move
     
@@ -177,9 +214,13 @@ def minimax_min_limit_opt(board, curr_player, heuristic_func, depth_limit, optim
     :param depth_limit: the depth limit
     :param optimizations: a dictionary to contain any data structures for optimizations.
         You can use a dictionary called "cache" to implement caching.
+        If a SearchStats is kept under "stats", the cache lookups are counted in it.
+        Values are cached under the canonical key for the heuristic (see canonical.py).
     :return the best move and its minimmax value estimated by our heuristic function.
     """
 
+    board = as_state(board)
+
     if depth_limit == 0:
         return None, heuristic_func(board, get_opponent(curr_player))
 
@@ -188,21 +229,34 @@ def minimax_min_limit_opt(board, curr_player, heuristic_func, depth_limit, optim
         return None, heuristic_func(board, get_opponent(curr_player))
     
     cache = optimizations['cache']
+    stats = optimizations.get('stats')
+    key_func = get_key_function(optimizations, heuristic_func)
     best_value, best_move = float('inf'), None
     for move in moves:
-        new_board = play_move(board, curr_player, move)
-        ck = new_board.__hash__()
+        undo = board.make(curr_player, move)
+        next_player = undo[-1]
+        ck, _, negated = key_func(board, next_player, get_opponent(curr_player))
 
         value = None
         if ck in cache:
             depth, cached_value = cache[ck]
             if depth >= depth_limit - 1:
-                value = cached_value
-        
+                value = -cached_value if negated else cached_value
+
+        if stats is not None:
+            if value is not None:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+                if ck in cache:
+                    stats.cache_overwrites += 1
+
         if value is None:
-            _, value = minimax_max_limit_opt(new_board, get_opponent(curr_player), heuristic_func, depth_limit - 1, optimizations)
-            cache[ck] = depth_limit - 1, value
+            search = minimax_min_limit_opt if next_player == curr_player else minimax_max_limit_opt
+            _, value = search(board, next_player, heuristic_func, depth_limit - 1, optimizations)
+            cache[ck] = depth_limit - 1, -value if negated else value
 
+        board.unmake(undo)
         if value < best_value:
             best_value, best_move = value, move
             
@@ -213,7 +267,7 @@ def minimax_min_limit_opt(board, curr_player, heuristic_func, depth_limit, optim
 ## DO NOT MODIFY THE CODE BELOW.
 ###############################################################################
 
-@timeout(TIMEOUT, timeout_exception=AiTimeoutError)
+@search_deadline(TIMEOUT)
 def run_minimax(curr_board, player, limit, optimizations, hfunc):
     if optimizations is not None:
         opt = True
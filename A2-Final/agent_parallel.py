@@ -0,0 +1,307 @@
+###############################################################################
+# This file implements a parallel alpha-beta agent that splits the root moves
+# across a pool of worker processes.
+#
+# The first root move is searched on its own, which sets alpha for the rest
+# (the "eldest brother" of Young Brothers Wait). The remaining root moves are
+# then searched in parallel. Workers share alpha through a multiprocessing
+# Value: every task reads the best value found so far before each move of
+# the root's child, and raises it when it finds a better one.
+#
+# Each worker keeps its own transposition table between tasks, and uses the
+# quiescence and endgame database settings of the player. The entries a
+# worker kept depend on which tasks it happened to get, so the best move is
+# searched again with a fresh table to give the same value on every run.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+import math
+import multiprocessing
+import os
+import time
+
+from agent_alphabeta import DEFAULT_GROWTH, MAX_SEARCH_DEPTH, alphabeta_max_limit_opt, alphabeta_min_limit_opt, get_move_orderer, get_transposition_table
+from deadline import Deadline, search_deadline
+from endgame_db import EndgameDatabase
+from mancala_state import as_state
+from move_ordering import MoveOrderer
+from transposition import TranspositionTable
+from utils import *
+
+# Alpha shared by the workers of a pool, set by _init_worker
+_shared_alpha = None
+# Each worker keeps its own transposition table, history and killer moves
+_worker_optimizations = None
+# The generation of the player's table the worker's table was last aged for
+_worker_generation = 0
+
+
+def _init_worker(shared_alpha, quiescence, egdb_file):
+    global _shared_alpha, _worker_optimizations
+    _shared_alpha = shared_alpha
+    _worker_optimizations = {"tt": TranspositionTable(), "ordering": MoveOrderer()}
+    if quiescence is not None:
+        _worker_optimizations["quiescence"] = quiescence
+    # the database is memory-mapped, so each worker opens the file itself
+    if egdb_file is not None:
+        _worker_optimizations["egdb"] = EndgameDatabase(egdb_file)
+
+
+def _get_shared_alpha():
+    """
+    Return the alpha to search with: just below the shared alpha, so a move as
+    good as the best one so far still gets its exact value, and a worse move
+    fails low.
+    """
+    return math.nextafter(_shared_alpha.value, float("-Inf"))
+
+
+def _search_root_child(board, curr_player, max_player, alpha, heuristic_func, depth_limit, optimizations):
+    """
+    Search the position after a root move for the current player, reading
+    the shared alpha again before each move, so the window narrows as soon as
+    another worker finds a better root move.
+    Return the value and the last alpha it was searched with: the value is
+    exact if it is above that alpha, and an upper bound otherwise.
+    """
+
+    moves = board.get_possible_moves(curr_player)
+    max_node = curr_player == max_player
+    egdb = optimizations.get("egdb")
+    if depth_limit == 0 or len(moves) == 0 or (egdb is not None and egdb.covers(board)):
+        search = alphabeta_max_limit_opt if max_node else alphabeta_min_limit_opt
+        _, value = search(board, curr_player, alpha, float("Inf"), heuristic_func, depth_limit, optimizations)
+        return value, alpha
+
+    moves = get_move_orderer(optimizations).order(board, curr_player, moves, depth_limit)
+
+    best_value = float('-inf') if max_node else float('inf')
+    for move in moves:
+        alpha = max(alpha, _get_shared_alpha())
+        if not max_node and best_value <= alpha:
+            break
+
+        undo = board.make(curr_player, move)
+        next_player = undo[-1]
+        search = alphabeta_max_limit_opt if next_player == max_player else alphabeta_min_limit_opt
+        if max_node:
+            _, value = search(board, next_player, max(alpha, best_value), float("Inf"), heuristic_func, depth_limit - 1, optimizations)
+            best_value = max(best_value, value)
+        else:
+            _, value = search(board, next_player, alpha, best_value, heuristic_func, depth_limit - 1, optimizations)
+            best_value = min(best_value, value)
+        board.unmake(undo)
+
+    return best_value, alpha
+
+
+def _search_root_move(board, curr_player, move, heuristic_func, depth_limit, deadline, generation):
+    """
+    Search one root move in a worker process.
+    Return the move, its value, and whether the value is exact.
+
+    :param generation: the generation of the player's transposition table,
+        the worker's table starts a new one when it changes
+    """
+    global _worker_generation
+
+    board = as_state(board)
+    optimizations = _worker_optimizations
+    if generation != _worker_generation:
+        optimizations["tt"].new_generation()
+        _worker_generation = generation
+    if deadline is not None:
+        board.deadline = Deadline(deadline)
+
+    undo = board.make(curr_player, move)
+    value, alpha = _search_root_child(board, undo[-1], curr_player, _get_shared_alpha(), heuristic_func, depth_limit - 1, optimizations)
+
+    exact = value > alpha
+    if exact:
+        with _shared_alpha.get_lock():
+            if value > _shared_alpha.value:
+                _shared_alpha.value = value
+    return move, value, exact
+
+
+def get_search_pool(optimizations):
+    """
+    Return the worker pool and shared alpha kept in the optimizations dictionary,
+    creating them the first time. The number of workers is optimizations["processes"],
+    or the number of CPUs. The workers search with the "quiescence" and "egdb"
+    of the optimizations.
+    """
+    if "pool" not in optimizations:
+        processes = optimizations.get("processes") or os.cpu_count() or 1
+        shared_alpha = multiprocessing.Value("d", float("-Inf"))
+        egdb = optimizations.get("egdb")
+        egdb_file = egdb.file.name if egdb is not None else None
+        pool = multiprocessing.Pool(processes, _init_worker, (shared_alpha, optimizations.get("quiescence"), egdb_file))
+        optimizations["pool"] = pool, shared_alpha
+    return optimizations["pool"]
+
+
+def close_search_pool(optimizations):
+    """
+    Shut down the worker pool kept in the optimizations dictionary, if any.
+    """
+    if "pool" in optimizations:
+        pool, _ = optimizations.pop("pool")
+        pool.terminate()
+        pool.join()
+
+
+def alphabeta_parallel(board, curr_player, heuristic_func, depth_limit, optimizations, first_move=None, deadline=None):
+    """
+    Perform Alpha-Beta Search for MAX player up to the given depth limit,
+    with the root moves split across the worker pool.
+    Return the best move and its estimated minimax value.
+    If the board is a terminal state, return None as its best move.
+
+    The best move is the first, in root order, of the moves with the highest
+    exact value. Its value is then searched again in this process with a fresh
+    transposition table, so it does not depend on the timing of the workers.
+
+    :param board: the current board
+    :param curr_player: the current player
+    :param heuristic_func: the heuristic function
+    :param depth_limit: the depth limit
+    :param optimizations: a dictionary to contain any data structures for optimizations.
+        The worker pool is kept under "pool".
+    :param first_move: the move to search first, usually the best move of a shallower search
+    :param deadline: the perf_counter time at which the workers raise SearchTimeout,
+        by default that of the board's Deadline, if any
+    :return the best move and its estimated minimax value.
+    """
+
+    board = as_state(board)
+    if deadline is None and board.deadline is not None:
+        deadline = board.deadline.time
+
+    if depth_limit == 0:
+        return None, heuristic_func(board, curr_player)
+
+    moves = board.get_possible_moves(curr_player)
+    if len(moves) == 0:
+        return None, heuristic_func(board, curr_player)
+
+    moves = get_move_orderer(optimizations).order(board, curr_player, moves, depth_limit, first_move)
+
+    pool, shared_alpha = get_search_pool(optimizations)
+    shared_alpha.value = float("-Inf")
+
+    task = board.to_board(), curr_player
+    settings = heuristic_func, depth_limit, deadline, get_transposition_table(optimizations).generation
+    results = [pool.apply(_search_root_move, task + (moves[0],) + settings)]
+    results += pool.starmap(_search_root_move, [task + (move,) + settings for move in moves[1:]], 1)
+
+    best_value, best_move = float('-inf'), None
+    for move, value, exact in results:
+        if exact and value > best_value:
+            best_value, best_move = value, move
+
+    return best_move, _resolve_move(board, curr_player, best_move, heuristic_func, depth_limit, optimizations, deadline)
+
+
+def _resolve_move(board, curr_player, move, heuristic_func, depth_limit, optimizations, deadline):
+    """
+    Search the root move again in this process with a fresh transposition
+    table and return its exact value. The board is put back as it was if the
+    search is stopped by the deadline.
+    """
+
+    resolve = {"tt": TranspositionTable(), "ordering": get_move_orderer(optimizations)}
+    for key in ("quiescence", "egdb"):
+        if key in optimizations:
+            resolve[key] = optimizations[key]
+
+    cells = board.cells[:]
+    outer = board.deadline
+    if deadline is not None:
+        board.deadline = Deadline(deadline)
+    try:
+        undo = board.make(curr_player, move)
+        next_player = undo[-1]
+        search = alphabeta_max_limit_opt if next_player == curr_player else alphabeta_min_limit_opt
+        _, value = search(board, next_player, float("-Inf"), float("Inf"), heuristic_func, depth_limit - 1, resolve)
+        board.unmake(undo)
+    except SearchTimeout:
+        board.restore(cells)
+        raise
+    finally:
+        board.deadline = outer
+    return value
+
+
+def alphabeta_parallel_iterative_deepening(board, curr_player, heuristic_func, time_budget, max_depth, optimizations):
+    """
+    Perform the parallel Alpha-Beta Search with increasing depth limits until
+    the time budget is close to spent, like alphabeta_iterative_deepening.
+    Each iteration searches the previous best move first.
+
+    :param board: the current board
+    :param curr_player: the current player
+    :param heuristic_func: the heuristic function
+    :param time_budget: the time budget in seconds
+    :param max_depth: the largest depth limit to search to, -1 for no limit
+    :param optimizations: a dictionary to contain any data structures for optimizations.
+    :return the best move and its estimated minimax value.
+    """
+
+    board = as_state(board)
+    time_start = time.perf_counter()
+    deadline = time_start + time_budget
+    if board.deadline is not None:
+        deadline = min(deadline, board.deadline.time)
+
+    moves = board.get_possible_moves(curr_player)
+    best_move, best_value = (moves[0] if moves else None), None
+
+    depth = 1
+    last_iteration_time = None
+    while max_depth < 0 or depth <= max_depth:
+        iteration_start = time.perf_counter()
+        try:
+            move, value = alphabeta_parallel(board, curr_player, heuristic_func, depth, optimizations, best_move, deadline)
+        except SearchTimeout:
+            break
+        best_move, best_value = move, value
+
+        if depth >= MAX_SEARCH_DEPTH:
+            break
+
+        now = time.perf_counter()
+        iteration_time = now - iteration_start
+        growth = iteration_time / last_iteration_time if last_iteration_time else DEFAULT_GROWTH
+        if now - time_start + iteration_time * max(growth, 1) > time_budget:
+            break
+        last_iteration_time = max(iteration_time, 1e-6)
+        depth += 1
+
+    return best_move, best_value
+
+
+@search_deadline(TIMEOUT)
+def run_alphabeta_parallel(curr_board, player, limit, optimizations, hfunc):
+    """
+    Search to the depth limit, or with iterative deepening if the
+    optimizations have a "time_budget". Without optimizations, the
+    worker pool only lasts for this move.
+    """
+    if optimizations is None:
+        optimizations = {}
+        keep_pool = False
+    else:
+        keep_pool = True
+
+    try:
+        if "time_budget" in optimizations:
+            move, value = alphabeta_parallel_iterative_deepening(curr_board, player, hfunc, optimizations["time_budget"], limit, optimizations)
+        else:
+            move, value = alphabeta_parallel(curr_board, player, hfunc, limit, optimizations)
+    finally:
+        if not keep_pool:
+            close_search_pool(optimizations)
+
+    return move, value
@@ -0,0 +1,226 @@
+###############################################################################
+# This file implements a principal variation search (NegaScout) agent.
+#
+# The search is written in negamax form: values are from the point of view
+# of the player to move, so one function serves both players. The first move
+# at each node is searched with the full window and the others with a null
+# window, which only proves whether they are worse; a move that turns out
+# better is searched again. Iterative deepening seeds an aspiration window
+# around the previous iteration's value.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+import time
+
+from agent_alphabeta import DEFAULT_GROWTH, MAX_SEARCH_DEPTH, get_move_orderer, get_principal_variation, get_transposition_table
+from deadline import Deadline, search_deadline
+from mancala_state import as_state
+from transposition import *
+from utils import *
+
+# Half width of the first aspiration window, in heuristic units
+ASPIRATION_WINDOW = 8
+# Factor the aspiration window grows by after a failed search
+ASPIRATION_GROWTH = 4
+
+
+def evaluate(board, curr_player, max_player, heuristic_func):
+    """
+    Return the heuristic value of the board from the point of view of the current player.
+    The heuristic is always computed for the MAX player and negated for the other,
+    so the values agree with the minimax agents even if the heuristic is not symmetric.
+    """
+    value = heuristic_func(board, max_player)
+    return value if curr_player == max_player else -value
+
+
+def pvs_search(board, curr_player, max_player, alpha, beta, heuristic_func, depth_limit, optimizations):
+    """
+    Perform Principal Variation Search up to the given depth limit.
+    Return the best move and its value for the current player.
+
+    If the board is a terminal state,
+    return None as the best move and the heuristic value of the board as the best value.
+
+    :param board: the current board
+    :param curr_player: the current player
+    :param max_player: the player at the root, whose heuristic is used
+    :param alpha: current alpha value, for the current player
+    :param beta: current beta value, for the current player
+    :param heuristic_func: the heuristic function
+    :param depth_limit: the depth limit
+    :param optimizations: a dictionary to contain any data structures for optimizations.
+        The transposition table is kept under "tt", the move orderer under "ordering"
+        and an EndgameDatabase, if any, under "egdb".
+        The table's values are for the player to move in each position.
+    :return the best move and its value for the current player.
+    """
+
+    board = as_state(board)
+
+    egdb = optimizations.get("egdb")
+    if egdb is not None:
+        move, value = egdb.lookup(board, curr_player, max_player, heuristic_func)
+        if value is not None:
+            return move, (value if curr_player == max_player else -value)
+
+    if depth_limit == 0:
+        return None, evaluate(board, curr_player, max_player, heuristic_func)
+
+    moves = board.get_possible_moves(curr_player)
+    if len(moves) == 0:
+        return None, evaluate(board, curr_player, max_player, heuristic_func)
+
+    table = get_transposition_table(optimizations)
+    key = (board.key(), curr_player)
+
+    hash_move = None
+    entry = table.probe(key)
+    if entry is not None:
+        _, depth, value, bound, hash_move = entry
+        if depth >= depth_limit:
+            if bound == EXACT:
+                return hash_move, value
+            elif bound == LOWER_BOUND and value > alpha:
+                alpha = value
+            elif bound == UPPER_BOUND and value < beta:
+                beta = value
+            if alpha >= beta:
+                return hash_move, value
+    alpha_orig, beta_orig = alpha, beta
+
+    pv_move = optimizations["pv"].get(key) if "pv" in optimizations else None
+    orderer = get_move_orderer(optimizations)
+    moves = orderer.order(board, curr_player, moves, depth_limit, hash_move, pv_move)
+
+    best_value, best_move = float('-inf'), None
+    for i, move in enumerate(moves):
+        undo = board.make(curr_player, move)
+        next_player = undo[-1]
+        if i == 0:
+            value = search_child(board, curr_player, next_player, max_player, alpha, beta, heuristic_func, depth_limit - 1, optimizations)
+        else:
+            # prove the move is no better than alpha, and search it properly if not
+            value = search_child(board, curr_player, next_player, max_player, alpha, alpha + 1, heuristic_func, depth_limit - 1, optimizations)
+            if alpha < value < beta:
+                value = search_child(board, curr_player, next_player, max_player, alpha, beta, heuristic_func, depth_limit - 1, optimizations)
+        board.unmake(undo)
+
+        if value > best_value:
+            best_value, best_move = value, move
+
+            if value > alpha:
+                alpha = value
+
+            if alpha >= beta:
+                orderer.record_cutoff(curr_player, move, depth_limit, i)
+                break
+
+    table.store(key, depth_limit, best_value, get_bound(best_value, alpha_orig, beta_orig), best_move)
+    return best_move, best_value
+
+
+def search_child(board, curr_player, next_player, max_player, alpha, beta, heuristic_func, depth_limit, optimizations):
+    """
+    Search the board after a move by the current player and return its value
+    for the current player. The window is negated only if the turn passes to
+    the opponent: after an extra turn the same player moves again.
+    """
+    if next_player == curr_player:
+        _, value = pvs_search(board, next_player, max_player, alpha, beta, heuristic_func, depth_limit, optimizations)
+        return value
+    _, value = pvs_search(board, next_player, max_player, -beta, -alpha, heuristic_func, depth_limit, optimizations)
+    return -value
+
+
+def pvs_aspiration(board, curr_player, heuristic_func, depth_limit, guess, optimizations):
+    """
+    Perform Principal Variation Search at the root with a window around the guessed value.
+    If the value falls outside the window, the search is repeated with the window
+    widened on that side until the value is inside it.
+    Return the best move and its estimated minimax value.
+
+    :param guess: the expected value, usually from the previous iteration, or None for a full window
+    """
+
+    if guess is None:
+        return pvs_search(board, curr_player, curr_player, float("-Inf"), float("Inf"), heuristic_func, depth_limit, optimizations)
+
+    window = ASPIRATION_WINDOW
+    alpha, beta = guess - window, guess + window
+    while True:
+        move, value = pvs_search(board, curr_player, curr_player, alpha, beta, heuristic_func, depth_limit, optimizations)
+        if value <= alpha:
+            window *= ASPIRATION_GROWTH
+            alpha = value - window
+        elif value >= beta:
+            window *= ASPIRATION_GROWTH
+            beta = value + window
+        else:
+            return move, value
+
+
+def pvs_iterative_deepening(board, curr_player, heuristic_func, time_budget, max_depth, optimizations):
+    """
+    Perform Principal Variation Search with increasing depth limits until the time
+    budget is close to spent, like alphabeta_iterative_deepening. Every iteration
+    after the first searches with an aspiration window around the previous value.
+
+    :param board: the current board
+    :param curr_player: the current player
+    :param heuristic_func: the heuristic function
+    :param time_budget: the time budget in seconds
+    :param max_depth: the largest depth limit to search to, -1 for no limit
+    :param optimizations: a dictionary to contain any data structures for optimizations.
+    :return the best move and its estimated minimax value.
+    """
+
+    board = as_state(board)
+    time_start = time.perf_counter()
+    outer_deadline = board.deadline
+    board.deadline = Deadline.after(time_budget, outer_deadline)
+    cells = board.cells[:]
+    get_move_orderer(optimizations).new_search()
+
+    moves = board.get_possible_moves(curr_player)
+    best_move, best_value = (moves[0] if moves else None), None
+
+    depth = 1
+    last_iteration_time = None
+    try:
+        while max_depth < 0 or depth <= max_depth:
+            iteration_start = time.perf_counter()
+            try:
+                move, value = pvs_aspiration(board, curr_player, heuristic_func, depth, best_value, optimizations)
+            except SearchTimeout:
+                board.restore(cells)
+                break
+            best_move, best_value = move, value
+            optimizations["pv"] = get_principal_variation(board, curr_player, get_transposition_table(optimizations), depth)
+
+            if depth >= MAX_SEARCH_DEPTH:
+                break
+
+            now = time.perf_counter()
+            iteration_time = now - iteration_start
+            growth = iteration_time / last_iteration_time if last_iteration_time else DEFAULT_GROWTH
+            if now - time_start + iteration_time * max(growth, 1) > time_budget:
+                break
+            last_iteration_time = max(iteration_time, 1e-6)
+            depth += 1
+    finally:
+        board.deadline = outer_deadline
+
+    return best_move, best_value
+
+
+@search_deadline(TIMEOUT)
+def run_pvs(curr_board, player, limit, optimizations, hfunc):
+    if optimizations is None:
+        optimizations = {}
+
+    time_budget = optimizations.get("time_budget", DEFAULT_MOVE_TIME)
+    move, value = pvs_iterative_deepening(curr_board, player, hfunc, time_budget, limit, optimizations)
+
+    return move, value
@@ -13,15 +13,19 @@
 
 import random
 import time
-from wrapt_timeout_decorator import timeout
-
+from deadline import search_deadline
 from utils import *
 
+# Seconds the random agent waits before each move, set to 0 for headless games
+MOVE_DELAY = 0.5
+
 
-def select_move(board, player):
+def select_move(board, player, delay=None):
     """
     Given a board and a player, decide on a move. 
     The return value is an integer i.
+
+    :param delay: seconds to wait before answering, MOVE_DELAY if None
     """
 
     # We just get a list of all permitted moves in this state and select a random one!
@@ -30,11 +34,13 @@ def select_move(board, player):
     if (len(moves) > 0):
         i = random.choice(moves)
 
-    time.sleep(0.5) # Delay, so the random agent doesn't look as simple as it really is.  
+    if delay is None:
+        delay = MOVE_DELAY
+    time.sleep(delay) # Delay, so the random agent doesn't look as simple as it really is.  
     return i
 
 
-@timeout(TIMEOUT, timeout_exception=AiTimeoutError)
+@search_deadline(TIMEOUT)
 def run_random(curr_board, player, limit, cache, hfunc):
     move = select_move(curr_board, player)
     value = None
@@ -0,0 +1,333 @@
+###############################################################################
+# Benchmarks of the search engine.
+#
+# deadline: what stopping the searches in time costs. It times a fixed-depth
+# search with and without a Deadline polled at different intervals, how
+# late a search stops after its deadline, and the per-call overhead of
+# search_deadline against @timeout from wrapt_timeout_decorator, if that
+# is installed.
+#
+# scaling: how the engine copes as the board grows, over a grid of board
+# dimensions and stones per pocket. For each board it measures moves made
+# and undone per second in random playouts, and for each agent the nodes
+# searched per second and the depth reached in the time budget of a move.
+# The depth-first agents search depth 1, 2, ... under a Deadline, keeping
+# their tables between depths when the agent does; for mcts the depth is
+# that of the deepest node in its tree. alphabeta_parallel counts its
+# nodes in worker processes, so it is left out. The report can be written
+# to a JSON file, to compare the engine's performance across versions.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+import argparse
+import json
+import platform
+import random
+import time
+
+from agent_alphabeta import MAX_SEARCH_DEPTH, alphabeta_max_limit_opt
+from agent_mcts import DEFAULT_BATCH_LEAVES, DEFAULT_LEAF_ROLLOUTS, mcts_search
+from agent_minimax import minimax_max_limit_opt
+from agent_pvs import pvs_aspiration
+from deadline import DEADLINE_CHECK_INTERVAL, Deadline, search_deadline
+from mancala_game import *
+from mancala_state import MancalaState
+from move_ordering import MoveOrderer
+from search_stats import InstrumentedState, SearchStats
+from transposition import TranspositionTable
+from utils import *
+
+try:
+    from wrapt_timeout_decorator import timeout
+except ImportError:
+    timeout = None
+
+BENCHMARKS = ("deadline", "scaling")
+
+# Polling intervals compared by the deadline benchmark
+DEADLINE_INTERVALS = (1, 16, DEADLINE_CHECK_INTERVAL, 4096)
+# Depth of the searches benchmark_stop_latency stops, far more than finishes in time
+MAX_BENCHMARK_DEPTH = 40
+
+# Default grid of the scaling benchmark
+SCALING_DIMENSIONS = (4, 6, 8, 12, 16)
+SCALING_STONES = (3, 4, 6, 8, 12)
+# Default time in seconds per agent and per board of the scaling benchmark
+SCALING_MOVE_TIME = 0.5
+SCALING_AGENTS = ("minimax", "alphabeta", "alphabeta_id", "pvs", "mcts")
+
+
+def time_search(state, player, heuristic_func, depth, repeats):
+    """
+    Return the best time of repeated fixed-depth searches of the state,
+    each with new tables, and the number of nodes searched.
+    """
+    best_time, nodes = None, 0
+    for _ in range(repeats):
+        optimizations = {"tt": TranspositionTable(), "ordering": MoveOrderer()}
+        time_start = time.perf_counter()
+        alphabeta_max_limit_opt(state, player, float("-Inf"), float("Inf"), heuristic_func, depth, optimizations)
+        elapsed = time.perf_counter() - time_start
+        nodes = optimizations["ordering"].get_stats()["nodes"]
+        if best_time is None or elapsed < best_time:
+            best_time = elapsed
+    return best_time, nodes
+
+
+def benchmark_poll_overhead(dimension, depth, repeats, intervals=DEADLINE_INTERVALS):
+    """
+    Time a fixed-depth search without a deadline, then with a deadline that
+    does not expire, polled at each interval.
+    """
+    state = MancalaState.from_board(create_initial_board(dimension))
+    # a first search warms up the caches of the interpreter
+    time_search(state, TOP, heuristic_advanced, depth, 1)
+    baseline, nodes = time_search(state, TOP, heuristic_advanced, depth, repeats)
+
+    results = {"depth": depth, "nodes": nodes, "baseline_time": baseline, "intervals": []}
+    for interval in intervals:
+        state.deadline = Deadline(float("Inf"), interval)
+        elapsed, _ = time_search(state, TOP, heuristic_advanced, depth, repeats)
+        results["intervals"].append({"interval": interval, "time": elapsed, "overhead": elapsed / baseline - 1})
+    state.deadline = None
+    return results
+
+
+def benchmark_stop_latency(dimension, seconds, repeats, intervals=DEADLINE_INTERVALS):
+    """
+    Stop a search too deep to finish with search_deadline, and return how
+    long after the deadline the move was returned, for each interval.
+    """
+    board = create_initial_board(dimension)
+    results = []
+    for interval in intervals:
+        def run(curr_board, player, limit, optimizations, hfunc):
+            # search_deadline has set a deadline with the default interval
+            curr_board.deadline.interval = curr_board.deadline.countdown = interval
+            return alphabeta_max_limit_opt(curr_board, player, float("-Inf"), float("Inf"), hfunc, limit, optimizations)
+
+        run = search_deadline(seconds)(run)
+        latencies = []
+        for _ in range(repeats):
+            # the tables are freed after the timing, which takes milliseconds once they are full
+            optimizations = {"tt": TranspositionTable(), "ordering": MoveOrderer()}
+            time_start = time.perf_counter()
+            run(board, TOP, MAX_BENCHMARK_DEPTH, optimizations, heuristic_advanced)
+            latencies.append(time.perf_counter() - time_start - seconds)
+        results.append({"interval": interval, "mean_latency": sum(latencies) / repeats, "max_latency": max(latencies)})
+    return results
+
+
+def benchmark_call_overhead(calls):
+    """
+    Return the time per call that search_deadline, and @timeout if
+    installed, add to an entry point that returns at once.
+    """
+    board = create_initial_board(6)
+
+    def run(curr_board, player, limit, optimizations, hfunc):
+        return None, None
+
+    results = {}
+    wrappers = [("none", run), ("search_deadline", search_deadline(TIMEOUT)(run))]
+    if timeout is not None:
+        wrappers.append(("wrapt_timeout", timeout(TIMEOUT, timeout_exception=AiTimeoutError)(run)))
+    for name, wrapper in wrappers:
+        time_start = time.perf_counter()
+        for _ in range(calls):
+            wrapper(board, TOP, 1, None, heuristic_basic)
+        results[name] = (time.perf_counter() - time_start) / calls
+    return results
+
+
+def benchmark_deadline(dimension=6, depth=9, repeats=3, stop_seconds=0.1, calls=200):
+    return {
+        "poll_overhead": benchmark_poll_overhead(dimension, depth, repeats),
+        "stop_latency": benchmark_stop_latency(dimension, stop_seconds, repeats),
+        "call_overhead": benchmark_call_overhead(calls),
+    }
+
+
+def print_deadline_report(report):
+    poll = report["poll_overhead"]
+    print("depth {} search, {} nodes: {:.4f}s without a deadline".format(poll["depth"], poll["nodes"], poll["baseline_time"]))
+    print("{:>10} {:>10} {:>10} {:>14}".format("interval", "time", "overhead", "stop latency"))
+    for row, stop in zip(poll["intervals"], report["stop_latency"]):
+        print("{:>10} {:>10.4f} {:>9.1%} {:>13.2f}ms".format(
+            row["interval"], row["time"], row["overhead"], 1000 * stop["mean_latency"]))
+    for name, seconds in report["call_overhead"].items():
+        print("call overhead {:<16} {:>10.1f}us".format(name, 1e6 * seconds))
+
+
+def benchmark_move_generation(board, seconds, rng):
+    """
+    Play random games from the board on a MancalaState for the given time,
+    undoing each game once it is over. Return the moves made per second.
+    """
+    state = MancalaState.from_board(board)
+    moves_made = 0
+    time_start = time.perf_counter()
+    deadline = time_start + seconds
+    while time.perf_counter() < deadline:
+        player = TOP
+        undos = []
+        moves = state.get_possible_moves(player)
+        while moves:
+            undo = state.make(player, rng.choice(moves))
+            undos.append(undo)
+            player = undo[-1]
+            moves = state.get_possible_moves(player)
+        for undo in reversed(undos):
+            state.unmake(undo)
+        moves_made += len(undos)
+    return moves_made / (time.perf_counter() - time_start)
+
+
+def search_to_depth(agent, state, heuristic_func, depth, guess, optimizations):
+    """
+    Search the state to the depth with a depth-first agent. Return the value.
+
+    :param guess: the value of the previous depth, for the aspiration window of pvs
+    """
+    if agent == "minimax":
+        return minimax_max_limit_opt(state, TOP, heuristic_func, depth, optimizations)[1]
+    if agent == "pvs":
+        return pvs_aspiration(state, TOP, heuristic_func, depth, guess, optimizations)[1]
+    return alphabeta_max_limit_opt(state, TOP, float("-Inf"), float("Inf"), heuristic_func, depth, optimizations)[1]
+
+
+def deepen(board, agent, heuristic_func, seconds):
+    """
+    Search the board to depth 1, 2, ... with a depth-first agent until the
+    time is up. Return the deepest depth completed, the time each depth was
+    completed at, and the nodes searched per second.
+    """
+    stats = SearchStats()
+    state = InstrumentedState(board, stats)
+    cells = state.cells[:]
+    optimizations = {"cache": {}} if agent == "minimax" else {}
+    time_start = time.perf_counter()
+    state.deadline = Deadline(time_start + seconds)
+
+    depth, value, depth_times = 0, None, []
+    while depth < MAX_SEARCH_DEPTH:
+        # the fixed-depth agent starts every search with new tables
+        if agent == "alphabeta":
+            optimizations = {}
+        try:
+            value = search_to_depth(agent, state, heuristic_func, depth + 1, value, optimizations)
+        except SearchTimeout:
+            state.restore(cells)
+            break
+        depth += 1
+        depth_times.append(time.perf_counter() - time_start)
+    elapsed = time.perf_counter() - time_start
+
+    return {"depth_reached": depth, "depth_times": depth_times, "nodes": stats.nodes,
+            "nodes_per_second": stats.nodes / elapsed}
+
+
+def grow_mcts_tree(board, seconds, rng):
+    """
+    Grow an MCTS tree from the board for the given time. Return the depth of
+    its deepest node and the nodes added per second.
+    """
+    root = mcts_search(board, TOP, seconds, -1, DEFAULT_BATCH_LEAVES, DEFAULT_LEAF_ROLLOUTS, rng)
+    nodes, depth = 0, 0
+    level = [root]
+    while level:
+        nodes += len(level)
+        level = [child for node in level for child in node.children.values()]
+        if level:
+            depth += 1
+    return {"depth_reached": depth, "nodes": nodes - 1, "nodes_per_second": (nodes - 1) / seconds}
+
+
+def benchmark_scaling(dimensions=SCALING_DIMENSIONS, stones=SCALING_STONES, agents=SCALING_AGENTS,
+                      seconds=SCALING_MOVE_TIME, extra_turn=False, seed=0):
+    """
+    Measure move generation and the agents on every board of the grid,
+    from the starting position. Return a report that can be saved as JSON.
+    """
+    rng = random.Random(seed)
+    results = []
+    for dimension in dimensions:
+        for stone_count in stones:
+            board = create_initial_board(dimension, extra_turn=extra_turn, stones=stone_count)
+            result = {
+                "dimension": dimension,
+                "stones": stone_count,
+                "moves_per_second": benchmark_move_generation(board, seconds, rng),
+                "agents": {},
+            }
+            for agent in agents:
+                if agent == "mcts":
+                    result["agents"][agent] = grow_mcts_tree(board, seconds, rng)
+                else:
+                    result["agents"][agent] = deepen(board, agent, heuristic_advanced, seconds)
+            results.append(result)
+
+    return {
+        "benchmark": "scaling",
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "move_time": seconds,
+        "extra_turn": extra_turn,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def print_scaling_report(report):
+    agents = list(report["results"][0]["agents"]) if report["results"] else []
+    print("{:>4} {:>6} {:>12}".format("d", "stones", "moves/s") +
+          "".join(" {:>22}".format(agent + " nodes/s,depth") for agent in agents))
+    for result in report["results"]:
+        print("{:>4} {:>6} {:>12.0f}".format(result["dimension"], result["stones"], result["moves_per_second"]) +
+              "".join(" {:>16.0f} {:>5}".format(result["agents"][agent]["nodes_per_second"],
+                                                result["agents"][agent]["depth_reached"]) for agent in agents))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="MancalaBenchmarks",
+        description="Benchmark the Mancala search engine"
+    )
+    parser.add_argument("benchmark", choices=BENCHMARKS,
+                        help="The benchmark to run.")
+    parser.add_argument("-d", "--dimension", type=int, default=6,
+                        help="Dimension of mancala board. Default is 6.")
+    parser.add_argument("-l", "--limit", type=int, default=9,
+                        help="Depth of the timed searches. Default is 9.")
+    parser.add_argument("-r", "--repeats", type=int, default=3,
+                        help="Times each measurement is repeated. Default is 3.")
+    parser.add_argument("--dimensions", type=int, nargs="+", default=SCALING_DIMENSIONS,
+                        help="Board dimensions of the scaling benchmark. Default is {}.".format(" ".join(map(str, SCALING_DIMENSIONS))))
+    parser.add_argument("--stones", type=int, nargs="+", default=SCALING_STONES,
+                        help="Stones per pocket of the scaling benchmark. Default is {}.".format(" ".join(map(str, SCALING_STONES))))
+    parser.add_argument("-a", "--agents", nargs="+", default=SCALING_AGENTS, choices=SCALING_AGENTS,
+                        help="Agents of the scaling benchmark. Default is all of them.")
+    parser.add_argument("-m", "--moveTime", type=float, default=SCALING_MOVE_TIME,
+                        help="Seconds per agent and board in the scaling benchmark. Default is {}.".format(SCALING_MOVE_TIME))
+    parser.add_argument("-x", "--extraTurn", action="store_true",
+                        help="Use flag to play with the extra-turn rule.")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="Seed for the random playouts. Default is 0.")
+    parser.add_argument("-j", "--json", type=str,
+                        help="(Optional) File to write the report to.")
+    args = parser.parse_args()
+
+    if args.benchmark == "deadline":
+        report = benchmark_deadline(args.dimension, args.limit, args.repeats)
+        print_deadline_report(report)
+    elif args.benchmark == "scaling":
+        report = benchmark_scaling(args.dimensions, args.stones, args.agents, args.moveTime, args.extraTurn, args.seed)
+        print_scaling_report(report)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,181 @@
+###############################################################################
+# This file manages the search caches an AI player keeps between moves.
+#
+# The minimax cache is a SearchCache: a dictionary with a cap on its size,
+# which forgets the entries used longest ago first, and can also drop
+# entries that have not been used for a number of moves. The transposition
+# table already has a fixed size, and its generations let old entries be
+# replaced.
+#
+# Both can be saved to a snapshot file at the end of a game and loaded at
+# the start of the next, so games from the same openings start with the
+# positions already searched. A snapshot file holds one snapshot per player
+# configuration, since the values depend on the algorithm, the heuristic,
+# the side played and the rules. Saves hold a lock on a ".lock" file next
+# to the snapshot file, so players saving at the same time, for example the
+# games of a tournament, do not drop each other's snapshots.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+import os
+import pickle
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from transposition import TranspositionTable
+from utils import *
+
+SNAPSHOT_MAGIC = "MCACHE1"
+
+# Approximate memory of one cache entry in bytes, measured with tracemalloc
+# for 6 pocket boards
+CACHE_ENTRY_BYTES = 400
+# Default memory cap of a SearchCache in bytes
+DEFAULT_CACHE_BYTES = 256 << 20
+
+
+class SearchCache(object):
+    """
+    The minimax cache, used like a dictionary from keys to (depth, value).
+
+    Entries are kept in the order they were last used, so the oldest can be
+    dropped in constant time when the cache is full, and each remembers the
+    generation (the move) it was last used in.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, max_age=None):
+        """
+        :param max_bytes: the memory cap, in bytes
+        :param max_age: the number of generations an unused entry is kept for,
+            or None to keep entries until the cache is full. Entries from the
+            opening are only in a snapshot saved at the end of the game if
+            they are kept that long.
+        """
+        self.max_entries = max(1, max_bytes // CACHE_ENTRY_BYTES)
+        self.max_age = max_age
+        self.generation = 0
+        self.entries = OrderedDict()
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __getitem__(self, key):
+        depth, value, _ = self.entries[key]
+        self.entries[key] = depth, value, self.generation
+        self.entries.move_to_end(key)
+        return depth, value
+
+    def __setitem__(self, key, entry):
+        depth, value = entry
+        entries = self.entries
+        entries[key] = depth, value, self.generation
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def items(self):
+        return [(key, (depth, value)) for key, (depth, value, _) in self.entries.items()]
+
+    def new_generation(self):
+        """
+        Start a new search, and drop the entries not used in the last max_age generations.
+        """
+        self.generation += 1
+        if self.max_age is None:
+            return
+        oldest = self.generation - self.max_age
+        entries = self.entries
+        while entries:
+            key = next(iter(entries))
+            if entries[key][2] >= oldest:
+                break
+            del entries[key]
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+
+def new_generation(optimizations):
+    """
+    Age the caches in the optimizations dictionary before a new search.
+    """
+    cache = optimizations.get("cache")
+    if isinstance(cache, SearchCache):
+        cache.new_generation()
+    table = optimizations.get("tt")
+    if isinstance(table, TranspositionTable):
+        table.new_generation()
+
+
+def get_snapshot_key(algorithm, heuristic_func, player, extra_turn, quiescence):
+    """
+    Return the key of a player configuration in a snapshot file.
+    """
+    return (algorithm.__name__, heuristic_func.__name__, tuple(getattr(heuristic_func, "weights", ())),
+            player, bool(extra_turn), quiescence or 0)
+
+
+def _read_snapshots(filename):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, "rb") as f:
+        data = pickle.load(f)
+    if data.get("magic") != SNAPSHOT_MAGIC:
+        raise ValueError("{} is not a cache snapshot".format(filename))
+    return data["snapshots"]
+
+
+def save_snapshot(filename, key, optimizations):
+    """
+    Save the caches in the optimizations dictionary to the snapshot file,
+    under the key from get_snapshot_key. Snapshots of other configurations
+    in the file are kept. Without fcntl (on Windows) the file is not locked.
+    """
+    snapshot = {
+        "cache": list(optimizations["cache"].items()) if "cache" in optimizations else [],
+        "tt": optimizations["tt"].entries() if "tt" in optimizations else [],
+    }
+
+    with open(filename + ".lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        snapshots = _read_snapshots(filename)
+        snapshots[key] = snapshot
+
+        # write to another file first, so a failed write keeps the old snapshots
+        temporary = "{}.{}.tmp".format(filename, os.getpid())
+        with open(temporary, "wb") as f:
+            pickle.dump({"magic": SNAPSHOT_MAGIC, "snapshots": snapshots}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, filename)
+
+
+def load_snapshot(filename, key, optimizations):
+    """
+    Load the snapshot saved under the key into the caches in the
+    optimizations dictionary. Return whether there was one.
+    """
+    snapshot = _read_snapshots(filename).get(key)
+    if snapshot is None:
+        return False
+
+    if "cache" in optimizations:
+        cache = optimizations["cache"]
+        for cache_key, entry in snapshot["cache"]:
+            cache[cache_key] = entry
+    if "tt" in optimizations:
+        table = optimizations["tt"]
+        for entry in snapshot["tt"]:
+            table.store(*entry)
+    return True
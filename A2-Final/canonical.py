@@ -0,0 +1,127 @@
+###############################################################################
+# This file implements canonical keys for the minimax cache and the
+# alpha-beta transposition table, so that equivalent positions share one entry.
+#
+# The rules never look at the mancalas, so positions with the same pockets
+# play out the same way. For a heuristic that only depends on the mancalas
+# through their difference (score_difference), positions with the same
+# pockets and the same difference have the same value. Within one game the
+# pockets also fix the sum of the mancalas, so this joins positions from
+# games with different numbers of stones, whose tables are shared in the
+# engine service or through cache snapshots.
+#
+# A symmetric heuristic also gives the opponent the opposite value,
+# h(board, player) == -h(board, opponent), and gives the board turned around
+# (rows swapped and reversed) the value the board has for the other player.
+# A position with BOTTOM to move is then keyed as its mirror image with TOP
+# to move, whose moves are numbered from the other end of the row. Values
+# are stored for the player to move rather than for MAX, which is the value
+# negated at MIN nodes (bounds swap), so the same entry serves both sides:
+# the searches of both players of a game can share one table.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+from transposition import EXACT, LOWER_BOUND, UPPER_BOUND
+from utils import *
+
+# The bound of a value once it is negated
+NEGATED_BOUNDS = {EXACT: EXACT, LOWER_BOUND: UPPER_BOUND, UPPER_BOUND: LOWER_BOUND}
+
+
+def get_plain_key(state, player, max_player):
+    """
+    Return the key of the position, the same for no other position, whether
+    it is the key of the mirror image and whether the value stored under it
+    is negated. The key is never mirrored nor the value negated.
+    """
+    return (state.key(), player), False, False
+
+
+def get_score_difference_key(state, player, max_player):
+    """
+    Return a key that is the same for positions with the same pockets, the
+    same player to move and the same difference between the mancalas, like
+    get_plain_key.
+    """
+    cells = state.cells
+    d = state.dimension
+    key = cells[0:2 * d]
+    key.append(cells[2 * d] - cells[2 * d + 1])
+    return (tuple(key), player), False, False
+
+
+def get_mirrored_key(state, player, max_player):
+    """
+    Return the score difference key of the position with TOP to move: for
+    BOTTOM to move, that of its mirror image. Also return whether the key is
+    of the mirror image, and whether the value stored under it is negated,
+    which it is when the player to move is not MAX.
+    """
+    cells = state.cells
+    d = state.dimension
+    if player == TOP:
+        key = cells[0:2 * d]
+        key.append(cells[2 * d] - cells[2 * d + 1])
+        return tuple(key), False, player != max_player
+
+    key = cells[2 * d - 1:d - 1:-1] + cells[d - 1::-1]
+    key.append(cells[2 * d + 1] - cells[2 * d])
+    return tuple(key), True, player != max_player
+
+
+def choose_key_function(heuristic_func):
+    """
+    Return the key function that joins the most positions the heuristic
+    cannot tell apart, from its score_difference and symmetric attributes.
+    """
+    if getattr(heuristic_func, "score_difference", False):
+        if getattr(heuristic_func, "symmetric", False):
+            return get_mirrored_key
+        return get_score_difference_key
+    return get_plain_key
+
+
+def get_key_function(optimizations, heuristic_func):
+    """
+    Return the key function kept in the optimizations dictionary,
+    choosing it for the heuristic the first time.
+    """
+    if "key_func" not in optimizations:
+        optimizations["key_func"] = choose_key_function(heuristic_func)
+    return optimizations["key_func"]
+
+
+def mirror_move(move, dimension, mirrored):
+    """
+    Return the move as it is numbered in the mirror image, if mirrored.
+    Turning the board around twice gives it back, so this also turns a move
+    of the mirror image back.
+    """
+    if not mirrored or move is None:
+        return move
+    return dimension - 1 - move
+
+
+def probe_entry(table, key, mirrored, negated, dimension):
+    """
+    Return the transposition table entry for a canonical key, as
+    (key, depth, value, bound, best_move) for the position itself, or None.
+    """
+    entry = table.probe(key)
+    if entry is None or not (mirrored or negated):
+        return entry
+    key, depth, value, bound, best_move = entry
+    if negated:
+        value, bound = -value, NEGATED_BOUNDS[bound]
+    return key, depth, value, bound, mirror_move(best_move, dimension, mirrored)
+
+
+def store_entry(table, key, mirrored, negated, dimension, depth, value, bound, best_move):
+    """
+    Store a search result for the position under its canonical key.
+    """
+    if negated:
+        value, bound = -value, NEGATED_BOUNDS[bound]
+    table.store(key, depth, value, bound, mirror_move(best_move, dimension, mirrored))
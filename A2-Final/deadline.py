@@ -0,0 +1,123 @@
+###############################################################################
+# This file implements the deadlines that stop the searches in time.
+#
+# A Deadline is set on the MancalaState a search runs on, and make polls it
+# before every move. The clock is only read every DEADLINE_CHECK_INTERVAL
+# polls, so a poll usually costs a counter decrement. Once the time is up,
+# the poll raises SearchTimeout, which unwinds the search to the code that
+# set the deadline: iterative deepening keeps its deepest completed
+# iteration, and the run_* entry points answer with the best move known.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+import functools
+import time
+
+from canonical import get_plain_key, probe_entry
+from mancala_state import as_state
+from utils import *
+
+# Polls between two reads of the clock. The searches make about 100000
+# moves per second, so they stop within about a millisecond of the deadline.
+DEADLINE_CHECK_INTERVAL = 64
+
+
+class Deadline(object):
+    """
+    A perf_counter time a search must stop at.
+    """
+
+    def __init__(self, end_time, interval=DEADLINE_CHECK_INTERVAL):
+        """
+        :param end_time: the perf_counter time of the deadline. perf_counter
+            is a system-wide clock, so the time can be sent to worker processes.
+        :param interval: the number of polls between two reads of the clock
+        """
+        self.time = end_time
+        self.interval = interval
+        self.countdown = interval
+
+    @classmethod
+    def after(cls, seconds, parent=None, interval=DEADLINE_CHECK_INTERVAL):
+        """
+        Return a deadline the given number of seconds from now,
+        or at the parent deadline if that is earlier.
+        """
+        end_time = time.perf_counter() + seconds
+        if parent is not None:
+            end_time = min(end_time, parent.time)
+        return cls(end_time, interval)
+
+    def poll(self):
+        """
+        Raise SearchTimeout if the deadline has passed, reading the clock
+        only every interval calls.
+        """
+        self.countdown -= 1
+        if self.countdown <= 0:
+            self.countdown = self.interval
+            if time.perf_counter() >= self.time:
+                raise SearchTimeout
+
+    def expired(self):
+        return time.perf_counter() >= self.time
+
+    def remaining(self):
+        return max(0.0, self.time - time.perf_counter())
+
+
+def get_fallback_move(state, player, optimizations, heuristic_func):
+    """
+    Return a move and its value for a search stopped by its deadline before
+    it returned one. A search to a fixed depth has no best move until it
+    is done, so this is the best move the transposition table has for the
+    position, if any, and otherwise the best move by the heuristic one ply ahead.
+    The value is the heuristic value one ply ahead.
+    """
+    moves = state.get_possible_moves(player)
+    table = optimizations.get("tt") if optimizations is not None else None
+    entry = None
+    if table is not None:
+        key, mirrored, negated = optimizations.get("key_func", get_plain_key)(state, player, player)
+        entry = probe_entry(table, key, mirrored, negated, state.dimension)
+    if entry is not None and entry[4] in moves:
+        moves = [entry[4]]
+
+    best_move, best_value = None, None
+    for move in moves:
+        undo = state.make(player, move)
+        value = heuristic_func(state, player)
+        state.unmake(undo)
+        if best_value is None or value > best_value:
+            best_move, best_value = move, value
+    return best_move, best_value
+
+
+def search_deadline(seconds):
+    """
+    Decorate a run_* entry point, called as (curr_board, player, limit,
+    optimizations, hfunc), so its search stops after the given number of
+    seconds and the best move known by then is played (see get_fallback_move).
+    The search runs on a MancalaState, which is put back to the starting
+    position if the search is stopped between a make and its unmake.
+    """
+    def decorate(run):
+        @functools.wraps(run)
+        def run_with_deadline(curr_board, player, limit, optimizations, hfunc):
+            state = as_state(curr_board)
+            cells = state.cells[:]
+            outer = state.deadline
+            state.deadline = Deadline.after(seconds, outer)
+            try:
+                return run(state, player, limit, optimizations, hfunc)
+            except SearchTimeout:
+                pass
+            finally:
+                state.deadline = outer
+
+            state.restore(cells)
+            return get_fallback_move(state, player, optimizations, hfunc)
+        return run_with_deadline
+    return decorate
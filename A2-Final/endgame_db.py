@@ -0,0 +1,275 @@
+###############################################################################
+# This file builds and reads an endgame database for Mancala.
+#
+# Once stones are in a mancala they never leave, so the rest of the game only
+# depends on the stones still in the pockets: the database stores, for every
+# distribution of up to max_stones stones over the pockets and each player to
+# move, how many more stones that player ends up with than the opponent under
+# perfect play.
+#
+# The values are solved from the smallest positions up. Every move either
+# puts a stone in a mancala, or moves all the stones it sows closer to their
+# own row's mancala, so the pair (stones in pockets, total distance to the
+# mancalas) goes down with every move and each position is solved after all
+# the positions it leads to.
+#
+# The file is a short header followed by one signed byte per position and
+# player. A position's index is the rank of its stone distribution in the
+# combinatorial number system, which is a perfect hash: every distribution
+# of up to max_stones stones has its own index and no index is unused.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+import argparse
+import itertools
+import mmap
+import struct
+from array import array
+
+from mancala_game import Board
+from mancala_state import MancalaState, as_state
+from utils import *
+
+HEADER = struct.Struct("<6sBBB7x")
+MAGIC = b"MEGDB1"
+
+# Values are stored in signed bytes
+MAX_STONES_LIMIT = 127
+
+
+def get_binomials(n):
+    """
+    Return the table of binomial coefficients C[i][j] for 0 <= i <= n and
+    0 <= j <= n + 1, which is 0 for j > i.
+    """
+    table = [[1] + [0] * (n + 1)]
+    for i in range(1, n + 1):
+        row = [1] + [0] * (n + 1)
+        for j in range(1, i + 1):
+            row[j] = table[i - 1][j - 1] + table[i - 1][j]
+        table.append(row)
+    return table
+
+
+def get_position_count(dimension, max_stones):
+    """
+    Return the number of stone distributions over 2 * dimension pockets
+    with at most max_stones stones.
+    """
+    cells = 2 * dimension
+    return get_binomials(max_stones + cells)[max_stones + cells][cells]
+
+
+def rank_position(pockets, binomials):
+    """
+    Return the index of a stone distribution among all distributions over the
+    same number of pockets, ordered by stone count first.
+
+    A distribution of s stones over m pockets corresponds to placing m - 1
+    separators among s + m - 1 slots, and the rank of those separator positions
+    in the combinatorial number system numbers the distributions of s stones
+    from 0. The C(s + m - 1, m) distributions with fewer stones come before them.
+
+    :param pockets: the stones in each pocket, top row then bottom row
+    :param binomials: a table from get_binomials, large enough for the stone count
+    """
+    stones = 0
+    rank = 0
+    for i in range(len(pockets) - 1):
+        stones += pockets[i]
+        rank += binomials[stones + i][i + 1]
+    stones += pockets[-1]
+    cells = len(pockets)
+    return binomials[stones + cells - 1][cells] + rank
+
+
+def get_potential(pockets, dimension):
+    """
+    Return the total distance of the stones to their own row's mancala,
+    which goes down with every move that does not reach a mancala.
+    """
+    potential = 0
+    for i in range(dimension):
+        potential += pockets[i] * (i + 1)
+        potential += pockets[dimension + i] * (dimension - i)
+    return potential
+
+
+def generate_endgame_db(dimension, max_stones, extra_turn=False, filename=None):
+    """
+    Solve every position with up to max_stones stones in the pockets and
+    return the values, indexed by 2 * rank_position + player to move.
+    If a filename is given, also write the database to it.
+
+    :param dimension: the number of pockets per player
+    :param max_stones: the largest number of stones in the pockets
+    :param extra_turn: whether positions are solved with the extra-turn rule
+    :param filename: the file to write the database to
+    """
+    if not 0 <= max_stones <= MAX_STONES_LIMIT:
+        raise ValueError("max_stones should be between 0 and {}".format(MAX_STONES_LIMIT))
+
+    d = dimension
+    cells = 2 * d
+    binomials = get_binomials(max_stones + cells)
+    values = array('b', bytes(2 * binomials[max_stones + cells][cells]))
+
+    state = MancalaState([[0] * d, [0] * d], [0, 0], extra_turn)
+    state_cells = state.cells
+
+    for stones in range(max_stones + 1):
+        # every distribution of this many stones, from the separator positions
+        layer = []
+        for separators in itertools.combinations(range(stones + cells - 1), cells - 1):
+            pockets = []
+            previous = -1
+            for separator in separators:
+                pockets.append(separator - previous - 1)
+                previous = separator
+            pockets.append(stones + cells - 2 - previous)
+            layer.append(pockets)
+        layer.sort(key=lambda pockets: get_potential(pockets, d))
+
+        for pockets in layer:
+            index = 2 * rank_position(pockets, binomials)
+            top_stones, bottom_stones = sum(pockets[0:d]), sum(pockets[d:cells])
+
+            if top_stones == 0 or bottom_stones == 0:
+                # the game is over and both rows are swept into their mancalas
+                values[index + TOP] = top_stones - bottom_stones
+                values[index + BOTTOM] = bottom_stones - top_stones
+                continue
+
+            state_cells[0:cells] = pockets
+            state.update_row_sums()
+            for player in (TOP, BOTTOM):
+                opponent = get_opponent(player)
+                best_value = None
+                for move in state.get_possible_moves(player):
+                    undo = state.make(player, move)
+                    value = state_cells[cells + player] - state_cells[cells + opponent]
+                    if undo[5] is None:
+                        successor = 2 * rank_position(state_cells[0:cells], binomials)
+                        if undo[-1] == player:
+                            value += values[successor + player]
+                        else:
+                            value -= values[successor + opponent]
+                    state.unmake(undo)
+                    if best_value is None or value > best_value:
+                        best_value = value
+                values[index + player] = best_value
+
+    if filename is not None:
+        with open(filename, "wb") as f:
+            f.write(HEADER.pack(MAGIC, dimension, max_stones, int(extra_turn)))
+            values.tofile(f)
+
+    return values
+
+
+class EndgameDatabase(object):
+    """
+    A memory-mapped endgame database written by generate_endgame_db.
+    Lookups rank the position and read one byte, so they take constant time
+    for a given board dimension.
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.dimension, self.max_stones, extra_turn = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{} is not an endgame database".format(filename))
+        self.extra_turn = bool(extra_turn)
+        self.binomials = get_binomials(self.max_stones + 2 * self.dimension)
+        self.values = memoryview(self.map)[HEADER.size:].cast('b')
+
+    def close(self):
+        if hasattr(self, "values"):
+            self.values.release()
+        self.map.close()
+        self.file.close()
+
+    def covers(self, board):
+        """
+        Return whether the database has the position, for a board of the
+        same dimension and rules with few enough stones in the pockets.
+        """
+        d = self.dimension
+        if board.dimension != d or board.extra_turn != self.extra_turn:
+            return False
+        return sum(board.pockets[TOP]) + sum(board.pockets[BOTTOM]) <= self.max_stones
+
+    def probe(self, board, player):
+        """
+        Return how many more of the remaining stones the player to move
+        gets than the opponent under perfect play, or None if the database
+        does not have the position.
+        """
+        if not self.covers(board):
+            return None
+        pockets = list(board.pockets[TOP]) + list(board.pockets[BOTTOM])
+        return self.values[2 * rank_position(pockets, self.binomials) + player]
+
+    def lookup(self, board, curr_player, max_player, heuristic_func):
+        """
+        Return the best move for the current player and the value of the
+        position, or None, None if the database does not have the position.
+
+        The value is the heuristic value, for the MAX player, of the final
+        board reached under perfect play, so it is on the same scale as the
+        values the search computes at terminal boards.
+        """
+        if not self.covers(board):
+            return None, None
+
+        state = as_state(board)
+        cells = state.cells
+        d = self.dimension
+        opponent = get_opponent(curr_player)
+        store_diff = cells[2 * d + curr_player] - cells[2 * d + opponent]
+        remaining = sum(cells[0:2 * d])
+        best_gain = self.probe(state, curr_player)
+
+        # the best move is the first one that achieves the stored value
+        best_move = None
+        for move in state.get_possible_moves(curr_player):
+            undo = state.make(curr_player, move)
+            gain = cells[2 * d + curr_player] - cells[2 * d + opponent] - store_diff
+            if undo[5] is None:
+                next_player = undo[-1]
+                value = self.probe(state, next_player)
+                gain += value if next_player == curr_player else -value
+            state.unmake(undo)
+            if gain == best_gain:
+                best_move = move
+                break
+
+        # the remaining stones are split so that the current player ends up best_gain ahead
+        mancalas = list(cells[2 * d:])
+        mancalas[curr_player] += (remaining + best_gain) // 2
+        mancalas[opponent] += (remaining - best_gain) // 2
+        final = Board([(0,) * d, (0,) * d], mancalas, self.extra_turn)
+        return best_move, heuristic_func(final, max_player)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The file to write the endgame database to."
+    )
+    parser.add_argument("--dimension", type=int, default=6, help="The number of pockets per player.")
+    parser.add_argument("--stones", type=int, default=10, help="The largest number of stones left in the pockets.")
+    parser.add_argument("--extraTurn", action="store_true", help="Solve positions with the extra-turn rule.")
+    args = parser.parse_args()
+
+    values = generate_endgame_db(args.dimension, args.stones, args.extraTurn, args.outputfile)
+    print("Solved {} positions".format(len(values)))
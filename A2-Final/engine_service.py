@@ -0,0 +1,290 @@
+###############################################################################
+# This file implements an asyncio engine service that plays moves for many
+# Mancala games at once, and a simulated client load to try it locally.
+#
+# Move requests are queued per game and handed to a shared pool of worker
+# processes in round-robin order over the games, so a game that sends many
+# requests does not hold up the others, and each game has at most one search
+# running. Every search is an iterative deepening alpha-beta search with the
+# same time budget, so each request gets an equal slice of a worker.
+#
+# Each worker keeps its transposition tables for all the games it searches.
+# Alpha-beta values are for the player at the root, so a worker has one
+# table per heuristic, root player and rule set rather than a single one.
+# With a symmetric heuristic the entries serve both players (see
+# canonical.py), so both share one table.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from agent_alphabeta import alphabeta_iterative_deepening
+from evaluation import WeightedHeuristic
+from mancala_game import *
+from move_ordering import MoveOrderer
+from transposition import TranspositionTable
+from utils import *
+
+HEURISTICS = {
+    "basic": heuristic_basic,
+    "advanced": heuristic_advanced,
+    "weighted": WeightedHeuristic(),
+}
+
+# Default time budget of one search in seconds
+DEFAULT_SERVICE_MOVE_TIME = 0.1
+# Default mean think time of a simulated client in seconds
+DEFAULT_THINK_TIME = 0.05
+
+# Search tables of a worker process, by (heuristic, root player or None, extra-turn rule)
+_worker_optimizations = None
+
+
+def _init_worker():
+    global _worker_optimizations
+    _worker_optimizations = {}
+
+
+def _search_move(board, player, heuristic, time_budget, max_depth):
+    """
+    Search a move in a worker process with the worker's tables.
+    Return the move, its value and the time the search took.
+    """
+    key = heuristic, None if getattr(HEURISTICS[heuristic], "symmetric", False) else player, board.extra_turn
+    if key not in _worker_optimizations:
+        _worker_optimizations[key] = {"tt": TranspositionTable(), "ordering": MoveOrderer()}
+    optimizations = _worker_optimizations[key]
+    optimizations["tt"].new_generation()
+    # the principal variation is from another position, possibly of another game
+    optimizations.pop("pv", None)
+
+    time_start = time.perf_counter()
+    move, value = alphabeta_iterative_deepening(board, player, HEURISTICS[heuristic], time_budget, max_depth, optimizations)
+    return move, value, time.perf_counter() - time_start
+
+
+class EngineService(object):
+    """
+    Plays moves for many games on a shared pool of worker processes.
+
+    Use it as an async context manager, and request moves with request_move,
+    or submit, which returns a future for the (move, value).
+    """
+
+    def __init__(self, processes=None, time_budget=DEFAULT_SERVICE_MOVE_TIME, max_depth=-1, heuristic="advanced"):
+        """
+        :param processes: the number of worker processes, the number of CPUs if None
+        :param time_budget: the default time budget of a search in seconds
+        :param max_depth: the largest depth to search to, -1 for no limit
+        :param heuristic: the default heuristic, one of HEURISTICS
+        """
+        self.processes = processes or os.cpu_count()
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.heuristic = heuristic
+
+        self.executor = None
+        self.dispatcher = None
+        self.wakeup = None
+        # pending requests by game, in the order the games are served in
+        self.queues = OrderedDict()
+        self.busy = set()
+        self.searches = 0
+        self.search_time = 0.0
+
+    async def start(self):
+        self.executor = ProcessPoolExecutor(self.processes, initializer=_init_worker)
+        self.wakeup = asyncio.Event()
+        self.dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self):
+        self.dispatcher.cancel()
+        try:
+            await self.dispatcher
+        except asyncio.CancelledError:
+            pass
+        for queue in self.queues.values():
+            for request in queue:
+                request[-1].cancel()
+        self.queues.clear()
+        self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def submit(self, game_id, board, player, time_budget=None, heuristic=None):
+        """
+        Queue a move request and return a future for the move and its value.
+
+        :param game_id: any hashable id of the game the request is for
+        :param board: the current Board
+        :param player: the player to move
+        :param time_budget: the time budget of the search, the service's default if None
+        :param heuristic: the heuristic to search with, the service's default if None
+        """
+        heuristic = heuristic or self.heuristic
+        if heuristic not in HEURISTICS:
+            raise ValueError("Heuristic not recognized. Options are {}.".format(sorted(HEURISTICS)))
+
+        future = asyncio.get_running_loop().create_future()
+        request = board, player, heuristic, time_budget or self.time_budget, future
+        self.queues.setdefault(game_id, deque()).append(request)
+        self.wakeup.set()
+        return future
+
+    async def request_move(self, game_id, board, player, time_budget=None, heuristic=None):
+        """
+        Return the move and its value for the board, once it has been searched.
+        """
+        return await self.submit(game_id, board, player, time_budget, heuristic)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+
+            while len(self.busy) < self.processes:
+                game_id = self._next_game()
+                if game_id is None:
+                    break
+                board, player, heuristic, time_budget, future = self.queues[game_id].popleft()
+                if future.cancelled():
+                    continue
+
+                # the game goes to the back of the line
+                self.queues.move_to_end(game_id)
+                self.busy.add(game_id)
+                search = loop.run_in_executor(self.executor, _search_move, board, player, heuristic,
+                                              time_budget, self.max_depth)
+                search.add_done_callback(lambda search, game_id=game_id, future=future: self._finish(game_id, future, search))
+
+    def _next_game(self):
+        """
+        Return the first game in line with a pending request and no search
+        running, dropping games with nothing pending, or None if there is none.
+        """
+        for game_id in list(self.queues):
+            if not self.queues[game_id]:
+                if game_id not in self.busy:
+                    del self.queues[game_id]
+                continue
+            if game_id not in self.busy:
+                return game_id
+        return None
+
+    def _finish(self, game_id, future, search):
+        self.busy.discard(game_id)
+        self.wakeup.set()
+        if future.cancelled():
+            return
+        if search.exception() is not None:
+            future.set_exception(search.exception())
+            return
+        move, value, search_time = search.result()
+        self.searches += 1
+        self.search_time += search_time
+        future.set_result((move, value))
+
+
+async def simulate_client(service, game_id, dimension, extra_turn, think_time, rng, latencies):
+    """
+    Play a game against the service: the client plays random moves after a
+    random think time, and the service plays the other side.
+    Return the final board and the side the service played.
+    """
+    board = create_initial_board(dimension, extra_turn=extra_turn)
+    player = TOP
+    engine_player = game_id % 2
+
+    while board.get_possible_moves(player):
+        if player == engine_player:
+            time_start = time.perf_counter()
+            move, _ = await service.request_move(game_id, board, player)
+            latencies.append(time.perf_counter() - time_start)
+        else:
+            if think_time > 0:
+                await asyncio.sleep(rng.expovariate(1 / think_time))
+            move = rng.choice(board.get_possible_moves(player))
+        board, player = play_turn(board, player, move)
+
+    return board, engine_player
+
+
+async def run_load_test(games, processes=None, time_budget=DEFAULT_SERVICE_MOVE_TIME, dimension=6,
+                        extra_turn=False, think_time=DEFAULT_THINK_TIME, seed=0):
+    """
+    Play simulated games against an EngineService at the same time and
+    return statistics on how the service kept up.
+    """
+    rng = random.Random(seed)
+    latencies = [[] for _ in range(games)]
+
+    time_start = time.perf_counter()
+    async with EngineService(processes, time_budget) as service:
+        results = await asyncio.gather(*(
+            simulate_client(service, game_id, dimension, extra_turn, think_time,
+                            random.Random(rng.getrandbits(32)), latencies[game_id])
+            for game_id in range(games)))
+        search_time = service.search_time
+    elapsed = time.perf_counter() - time_start
+
+    all_latencies = sorted(latency for game_latencies in latencies for latency in game_latencies)
+    game_means = [statistics.mean(game_latencies) for game_latencies in latencies if game_latencies]
+    engine_wins = sum(1 for board, engine_player in results
+                      if board.mancalas[engine_player] > board.mancalas[get_opponent(engine_player)])
+    return {
+        "games": games,
+        "moves": len(all_latencies),
+        "elapsed": elapsed,
+        "moves_per_second": len(all_latencies) / elapsed,
+        "search_time": search_time,
+        "latency_mean": statistics.mean(all_latencies),
+        "latency_p50": all_latencies[len(all_latencies) // 2],
+        "latency_p95": all_latencies[min(len(all_latencies) - 1, int(0.95 * len(all_latencies)))],
+        "latency_max": all_latencies[-1],
+        "slowest_game_mean": max(game_means),
+        "fastest_game_mean": min(game_means),
+        "engine_wins": engine_wins,
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="MancalaEngineService",
+        description="Serve simulated Mancala games from a pool of search processes and report latency"
+    )
+    parser.add_argument("-g", "--games", type=int, default=16,
+                        help="Simulated games played at the same time. Default is 16.")
+    parser.add_argument("-p", "--processes", type=int,
+                        help="Worker processes. Default is the number of CPUs.")
+    parser.add_argument("-m", "--moveTime", type=float, default=DEFAULT_SERVICE_MOVE_TIME,
+                        help="Time budget in seconds per search. Default is {}.".format(DEFAULT_SERVICE_MOVE_TIME))
+    parser.add_argument("-d", "--dimension", type=int, default=6,
+                        help="Dimension of mancala board. Default is 6.")
+    parser.add_argument("-x", "--extraTurn", action="store_true",
+                        help="Use flag to play with the extra-turn rule.")
+    parser.add_argument("-t", "--thinkTime", type=float, default=DEFAULT_THINK_TIME,
+                        help="Mean think time in seconds of the simulated clients. Default is {}.".format(DEFAULT_THINK_TIME))
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="Seed for the simulated clients. Default is 0.")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args.games, args.processes, args.moveTime, args.dimension,
+                                       args.extraTurn, args.thinkTime, args.seed))
+    for name, value in report.items():
+        print("{:<20} {}".format(name, round(value, 4) if isinstance(value, float) else value))
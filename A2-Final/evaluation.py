@@ -0,0 +1,407 @@
+###############################################################################
+# This file implements a weighted evaluation function for Mancala and the
+# offline training of its weights.
+#
+# A position is described, for one player, by a vector of features:
+#   mancala_diff       stones in own mancala minus the opponent's
+#   stone_diff         stones in own pockets minus the opponent's
+#   capture_potential  the capture term of heuristic_advanced
+#   mobility           own legal moves minus the opponent's
+#   extra_turn_moves   own moves ending in own mancala minus the opponent's
+#   stones_at_risk     own stones the opponent can capture with one move
+# and its value is the weighted sum of the features. The default weights
+# give the same values as heuristic_advanced.
+#
+# The weights are learned from games the evaluation plays against itself.
+# Positions are labelled with TD(lambda) targets: lambda = 1 uses the final
+# result of the game (plain logistic regression), smaller values mix in the
+# current prediction for the positions that followed. The weights are fitted
+# to the targets by logistic regression, so they are in log-odds of winning.
+# The games are played and the features extracted with numpy, many positions
+# at a time, so millions of positions take minutes.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+import argparse
+import json
+
+from agent_mcts import BatchRollout
+from mancala_game import create_initial_board, get_sowing_paths
+from mancala_state import as_state
+from utils import *
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FEATURES = ("mancala_diff", "stone_diff", "capture_potential", "mobility", "extra_turn_moves", "stones_at_risk")
+# Weights that give the values of heuristic_advanced
+DEFAULT_WEIGHTS = (3, 2, 5, 0, 0, 0)
+# Evaluation units per unit of learned weight (log-odds of winning), so
+# that learned evaluations are integers like the other heuristics
+DEFAULT_SCALE = 100
+
+# Chance of playing a random move in the training games
+DEFAULT_EPSILON = 0.1
+# TD(lambda) parameter, 1 trains on the game results only
+DEFAULT_TD_LAMBDA = 0.7
+# L2 regularization of the logistic regression
+DEFAULT_L2 = 1e-3
+# Newton steps per fit
+DEFAULT_NEWTON_STEPS = 10
+# Fits per round, each with targets from the previous fit
+DEFAULT_TD_SWEEPS = 3
+
+
+def get_features(board, player):
+    """
+    Return the feature vector of the board for the player, in the order of FEATURES.
+
+    :param board: the current board or MancalaState
+    :param player: the player the features are for
+    """
+    state = as_state(board)
+    opponent = get_opponent(player)
+    cells = state.cells
+    d = state.dimension
+    paths = state.paths
+    length = 2 * d + 1
+    own_base, opp_base = player * d, opponent * d
+
+    capture_potential = 0
+    for i in range(d):
+        stones = cells[own_base + i]
+        if stones == 0:
+            continue
+        end = (i + stones) % length
+        if end < d and cells[own_base + end] == 0 and cells[opp_base + end] > capture_potential:
+            capture_potential = cells[opp_base + end]
+
+    mobility = 0
+    extra_turn_moves = 0
+    at_risk = set()
+    for side, sign in ((player, 1), (opponent, -1)):
+        base = side * d
+        for move in range(d):
+            stones = cells[base + move]
+            if stones == 0:
+                continue
+            mobility += sign
+            last = paths[side][move][(stones - 1) % length]
+            if last == 2 * d + side:
+                extra_turn_moves += sign
+            elif side == opponent and stones < length and base <= last < base + d and cells[last] == 0:
+                at_risk.add(last + d if side == TOP else last - d)
+
+    return [
+        cells[2 * d + player] - cells[2 * d + opponent],
+        state.row_sums[player] - state.row_sums[opponent],
+        capture_potential,
+        mobility,
+        extra_turn_moves,
+        sum(cells[pocket] for pocket in at_risk),
+    ]
+
+
+def extract_features(cells, players, dimension):
+    """
+    Return the feature vectors of many positions at once, as an array with
+    one row per position, the same as get_features gives for each.
+
+    :param cells: the positions, one per row, laid out like MancalaState.cells
+    :param players: the player the features are for, for each position
+    :param dimension: the number of pockets per player
+    """
+    if np is None:
+        raise RuntimeError("numpy is needed to extract features in batches")
+
+    d = dimension
+    cells = np.asarray(cells)
+    players = np.asarray(players)
+    opponents = 1 - players
+    n = len(cells)
+    index = np.arange(n)[:, None]
+    rows = np.array([np.arange(d), np.arange(d, 2 * d)])
+    paths = np.array(get_sowing_paths(d))
+    length = 2 * d + 1
+    pocket = np.arange(d)
+
+    own = cells[index, rows[players]]
+    opp = cells[index, rows[opponents]]
+    features = np.empty((n, len(FEATURES)))
+    features[:, 0] = cells[index[:, 0], 2 * d + players] - cells[index[:, 0], 2 * d + opponents]
+    features[:, 1] = own.sum(axis=1) - opp.sum(axis=1)
+
+    end = (pocket + own) % length
+    inside = (own > 0) & (end < d)
+    end = np.minimum(end, d - 1)
+    own_end = np.take_along_axis(own, end, axis=1)
+    opp_end = np.take_along_axis(opp, end, axis=1)
+    features[:, 2] = np.where(inside & (own_end == 0), opp_end, 0).max(axis=1)
+
+    features[:, 3] = (own > 0).sum(axis=1) - (opp > 0).sum(axis=1)
+
+    # the cell each move's last stone lands in
+    own_last = paths[players[:, None], pocket, (own - 1) % length]
+    opp_last = paths[opponents[:, None], pocket, (opp - 1) % length]
+    own_extra = (own > 0) & (own_last == (2 * d + players)[:, None])
+    opp_extra = (opp > 0) & (opp_last == (2 * d + opponents)[:, None])
+    features[:, 4] = own_extra.sum(axis=1) - opp_extra.sum(axis=1)
+
+    opp_captures = (opp > 0) & (opp < length) & (opp_last < 2 * d) & (opp_last // d == opponents[:, None])
+    opp_captures &= cells[index, np.minimum(opp_last, 2 * d - 1)] == 0
+    opposite = np.where(opponents[:, None] == TOP, opp_last + d, opp_last - d)
+    at_risk = np.zeros((n, 2 * d), dtype=bool)
+    which, move = np.nonzero(opp_captures)
+    at_risk[which, opposite[which, move]] = True
+    features[:, 5] = (cells[:, 0:2 * d] * at_risk).sum(axis=1)
+
+    return features
+
+
+class WeightedHeuristic(object):
+    """
+    A heuristic function that is the weighted sum of the features, times the
+    scale and rounded to an integer. It is a class rather than a closure so it
+    can still be sent to worker processes.
+    """
+
+    # the mancalas are only in the features through their difference
+    score_difference = True
+
+    def __init__(self, weights=DEFAULT_WEIGHTS, scale=1):
+        if len(weights) != len(FEATURES):
+            raise ValueError("Expected {} weights, got {}".format(len(FEATURES), len(weights)))
+        self.weights = [float(weight) for weight in weights]
+        self.scale = scale
+        self.__name__ = "heuristic_weighted"
+
+    @property
+    def symmetric(self):
+        """
+        Whether the value for the opponent is the opposite, and the same on the
+        mirror image (see canonical.py): every feature but capture_potential
+        and stones_at_risk is the same for the player less for the opponent.
+        """
+        return (self.weights[FEATURES.index("capture_potential")] == 0
+                and self.weights[FEATURES.index("stones_at_risk")] == 0)
+
+    def __call__(self, board, player):
+        features = get_features(board, player)
+        return int(round(self.scale * sum(weight * feature for weight, feature in zip(self.weights, features))))
+
+    def evaluate_batch(self, cells, players, dimension):
+        """
+        Return the unrounded values of many positions at once, see extract_features.
+        """
+        return self.scale * (extract_features(cells, players, dimension) @ np.array(self.weights))
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump({"features": list(FEATURES), "weights": self.weights, "scale": self.scale}, f, indent=2)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Return the heuristic saved in the given file.
+        """
+        with open(filename) as f:
+            data = json.load(f)
+        if list(data["features"]) != list(FEATURES):
+            raise ValueError("{} has weights for other features: {}".format(filename, data["features"]))
+        return cls(data["weights"], data["scale"])
+
+
+def play_training_games(games, dimension, heuristic, extra_turn=False, epsilon=DEFAULT_EPSILON, rng=None):
+    """
+    Play games of the heuristic against itself, all at once. Each move is the
+    one after which the heuristic values the board most for the player who
+    moved, or with probability epsilon a random legal move.
+
+    Return the positions played through, in order of ply, as a dictionary of
+    arrays: "cells" and "players" (the player to move) for each position,
+    "games" the game it is from, "offsets" where each ply starts, and
+    "top_scores" TOP's result of each game (1 for a win, 0.5 for a tie).
+
+    :param heuristic: a WeightedHeuristic
+    :param rng: a numpy random Generator
+    """
+    if np is None:
+        raise RuntimeError("numpy is needed to play training games")
+    if rng is None:
+        rng = np.random.default_rng()
+
+    d = dimension
+    board = create_initial_board(d)
+    start = list(board.pockets[TOP]) + list(board.pockets[BOTTOM]) + list(board.mancalas)
+    boards = np.tile(np.array(start, dtype=np.int32), (games, 1))
+    players = np.zeros(games, dtype=np.int64)
+    over = np.zeros(games, dtype=bool)
+    rollout = BatchRollout(d, extra_turn, rng)
+    rows = np.array([np.arange(d), np.arange(d, 2 * d)])
+
+    recorded_cells, recorded_players, recorded_games, offsets = [], [], [], [0]
+    while not over.all():
+        active = np.flatnonzero(~over)
+        current = boards[active]
+        movers = players[active]
+        recorded_cells.append(current.copy())
+        recorded_players.append(movers.copy())
+        recorded_games.append(active)
+        offsets.append(offsets[-1] + len(active))
+
+        # value every move for the player making it
+        own = current[np.arange(len(active))[:, None], rows[movers]]
+        candidates = np.repeat(current, d, axis=0)
+        candidate_players = np.repeat(movers, d)
+        rollout.play(candidates, candidate_players, np.tile(np.arange(d), len(active)))
+        values = heuristic.evaluate_batch(candidates, candidate_players, d).reshape(len(active), d)
+        values[own == 0] = -np.inf
+
+        moves = values.argmax(axis=1)
+        explore = rng.random(len(active)) < epsilon
+        random_moves = (rng.random(own.shape) * (own > 0)).argmax(axis=1)
+        moves[explore] = random_moves[explore]
+
+        next_players, ended = rollout.play(current, movers, moves)
+        boards[active] = current
+        players[active] = next_players
+        over[active[ended]] = True
+
+    difference = boards[:, 2 * d] - boards[:, 2 * d + 1]
+    return {
+        "cells": np.concatenate(recorded_cells),
+        "players": np.concatenate(recorded_players),
+        "games": np.concatenate(recorded_games),
+        "offsets": np.array(offsets),
+        "top_scores": (difference > 0) + 0.5 * (difference == 0),
+    }
+
+
+def get_td_targets(positions, predictions, td_lambda):
+    """
+    Return the TD(lambda) target of each position, the chance of winning for
+    the player to move. The lambda-return is computed backwards from the end
+    of each game, as TOP's chance of winning:
+        R_t = (1 - lambda) * P_t+1 + lambda * R_t+1
+    where P is the prediction, and the last position's successor is the final result.
+
+    :param positions: positions from play_training_games
+    :param predictions: the predicted chance of winning of each position, for the player to move
+    :param td_lambda: 1 gives the game results, 0 the next position's prediction
+    """
+    players = positions["players"]
+    offsets = positions["offsets"]
+    top_predictions = np.where(players == TOP, predictions, 1 - predictions)
+
+    next_returns = positions["top_scores"].astype(float)
+    next_predictions = next_returns.copy()
+    top_targets = np.empty(len(players))
+    for ply in range(len(offsets) - 2, -1, -1):
+        span = slice(offsets[ply], offsets[ply + 1])
+        games = positions["games"][span]
+        returns = (1 - td_lambda) * next_predictions[games] + td_lambda * next_returns[games]
+        top_targets[span] = returns
+        next_returns[games] = returns
+        next_predictions[games] = top_predictions[span]
+
+    return np.where(players == TOP, top_targets, 1 - top_targets)
+
+
+def fit_weights(features, targets, weights=None, l2=DEFAULT_L2, steps=DEFAULT_NEWTON_STEPS):
+    """
+    Fit logistic regression weights, without an intercept, to soft targets
+    by Newton's method. Return the weights.
+
+    There is no intercept so that a position's value for one player is minus
+    its value for the other, as the search assumes.
+
+    :param features: the feature vectors, one per row
+    :param targets: the chance of winning to fit for each position
+    :param weights: the weights to start from, zero if None
+    """
+    n, k = features.shape
+    weights = np.zeros(k) if weights is None else np.array(weights, dtype=float)
+    for _ in range(steps):
+        predictions = 1 / (1 + np.exp(-(features @ weights)))
+        gradient = features.T @ (predictions - targets) / n + l2 * weights
+        hessian = (features.T * (predictions * (1 - predictions))) @ features / n + l2 * np.eye(k)
+        weights -= np.linalg.solve(hessian, gradient)
+    return weights
+
+
+def get_log_loss(features, targets, weights):
+    predictions = np.clip(1 / (1 + np.exp(-(features @ weights))), 1e-12, 1 - 1e-12)
+    return float(-np.mean(targets * np.log(predictions) + (1 - targets) * np.log(1 - predictions)))
+
+
+def train_weights(games, dimension, rounds=1, td_lambda=DEFAULT_TD_LAMBDA, epsilon=DEFAULT_EPSILON,
+                  extra_turn=False, seed=0, heuristic=None, verbose=False):
+    """
+    Learn weights from self-play and return them as a WeightedHeuristic.
+    Each round plays the games with the current heuristic and fits the
+    weights to the positions played, so later rounds learn from better play.
+
+    :param games: the number of games per round
+    :param rounds: the number of rounds
+    :param heuristic: the heuristic of the first round, a WeightedHeuristic
+        with the default weights if None
+    """
+    if np is None:
+        raise RuntimeError("numpy is needed to train the evaluation weights")
+
+    rng = np.random.default_rng(seed)
+    if heuristic is None:
+        heuristic = WeightedHeuristic()
+
+    weights = None
+    for round_number in range(rounds):
+        positions = play_training_games(games, dimension, heuristic, extra_turn, epsilon, rng)
+        features = extract_features(positions["cells"], positions["players"], dimension)
+
+        # the game results need no predictions, so each round is first fitted to
+        # them, which is all logistic regression (td_lambda 1) needs
+        targets = get_td_targets(positions, np.full(len(features), 0.5), 1)
+        weights = fit_weights(features, targets, weights)
+
+        # bootstrapped targets depend on the weights, so they are refined over a few fits
+        if td_lambda < 1:
+            for _ in range(DEFAULT_TD_SWEEPS):
+                predictions = 1 / (1 + np.exp(-(features @ weights)))
+                targets = get_td_targets(positions, predictions, td_lambda)
+                weights = fit_weights(features, targets, weights)
+
+        heuristic = WeightedHeuristic(weights, DEFAULT_SCALE)
+        if verbose:
+            print("round {}: {} positions, log loss {:.4f}, weights {}".format(
+                round_number + 1, len(features), get_log_loss(features, targets, weights),
+                " ".join("{}={:.4f}".format(name, weight) for name, weight in zip(FEATURES, weights))))
+
+    return heuristic
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The file to write the learned weights to."
+    )
+    parser.add_argument("--dimension", type=int, default=6, help="The number of pockets per player.")
+    parser.add_argument("--games", type=int, default=10000, help="The number of self-play games per round.")
+    parser.add_argument("--rounds", type=int, default=3, help="The number of rounds of self-play and fitting.")
+    parser.add_argument("--tdLambda", type=float, default=DEFAULT_TD_LAMBDA,
+                        help="The TD(lambda) parameter, 1 for logistic regression on the game results.")
+    parser.add_argument("--epsilon", type=float, default=DEFAULT_EPSILON, help="The chance of a random move in self-play.")
+    parser.add_argument("--seed", type=int, default=0, help="The random seed.")
+    parser.add_argument("--extraTurn", action="store_true", help="Train for the extra-turn rule.")
+    args = parser.parse_args()
+
+    heuristic = train_weights(args.games, args.dimension, args.rounds, args.tdLambda, args.epsilon,
+                              args.extraTurn, args.seed, verbose=True)
+    heuristic.save(args.outputfile)
@@ -0,0 +1,372 @@
+###############################################################################
+# This file implements a compact record of Mancala games and a batch
+# analyzer that searches every position of recorded games again.
+#
+# A record file holds one game per line, as JSON: the initial board and the
+# extra-turn rule, the agents, the moves, and for each move the value, the
+# nodes and the time of the search that chose it, or null for moves that
+# were not searched. The positions are not stored, since replaying the moves
+# gives them back. Files ending in .gz are gzip compressed, and records are
+# appended, so one file can log all the games of a day.
+#
+# The analyzer searches each position of a game to a fixed depth with
+# iterative deepening alpha-beta, and the position after the move played if
+# it was not the best move. The loss of a move is how much worse the move
+# played is than the best move, and a blunder is a move that loses at least
+# the blunder threshold. The drift of a move is the value recorded for it
+# minus the value found again, which shows how far off the agent's own
+# evaluation was; it only means that for agents with the analyzer's
+# heuristic. Losses and drift are in the units of the heuristic, stones
+# for heuristic_basic, the default. Games are analyzed in worker processes,
+# and the positions of a game in order, so each search starts from the
+# transposition table and move ordering the previous one left.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import time
+
+from agent_alphabeta import alphabeta_iterative_deepening, alphabeta_max_limit_opt, alphabeta_min_limit_opt
+from evaluation import WeightedHeuristic
+from mancala_game import Board
+from mancala_state import MancalaState
+from move_ordering import MoveOrderer
+from transposition import TranspositionTable
+from utils import *
+
+RECORD_VERSION = 1
+
+HEURISTICS = {
+    "basic": heuristic_basic,
+    "advanced": heuristic_advanced,
+    "weighted": WeightedHeuristic(),
+}
+
+DEFAULT_ANALYSIS_DEPTH = 8
+# Loss from which a move is a blunder, in stones with heuristic_basic
+DEFAULT_BLUNDER_THRESHOLD = 3
+# Games handed to a worker process at a time
+DEFAULT_CHUNK_SIZE = 8
+# Slots in the transposition tables of the workers, larger than an agent's
+# since the searches of a whole game go through them
+ANALYSIS_TT_SIZE = 1 << 20
+# Blunders listed in the report
+DEFAULT_REPORTED_BLUNDERS = 20
+
+# Heuristic and search tables of a worker process
+_worker_heuristic = None
+_worker_optimizations = None
+
+
+class GameRecord(object):
+    """
+    The moves of a game from its initial board, with the search statistics
+    of each move. The first opening moves were not chosen by the agents,
+    like the random openings of a tournament.
+    """
+
+    def __init__(self, board, agents=(None, None), opening=0, game_id=None):
+        """
+        :param board: the initial board
+        :param agents: the names of the TOP and BOTTOM agents, None for a human
+        :param opening: the number of moves at the start not chosen by the agents
+        :param game_id: a name for the game in reports, if any
+        """
+        self.pockets = [list(board.pockets[TOP]), list(board.pockets[BOTTOM])]
+        self.mancalas = list(board.mancalas)
+        self.extra_turn = board.extra_turn
+        self.agents = list(agents)
+        self.opening = opening
+        self.game_id = game_id
+        self.moves = []
+        self.stats = []
+
+    def __len__(self):
+        return len(self.moves)
+
+    def add_move(self, move, value=None, nodes=None, time=None):
+        """
+        Add the next move, with the value, nodes and time of the search that
+        chose it. A move without any of them was not searched.
+        """
+        self.moves.append(int(move))
+        if value is None and nodes is None and time is None:
+            self.stats.append(None)
+        else:
+            self.stats.append([value, nodes, None if time is None else round(time, 6)])
+
+    def get_initial_board(self):
+        return Board([tuple(self.pockets[TOP]), tuple(self.pockets[BOTTOM])], list(self.mancalas), self.extra_turn)
+
+    def replay(self):
+        """
+        Yield the ply, the MancalaState and the player to move before each
+        move, checking that the move is legal. The same state is played on
+        in place, so it is only valid until the next position is yielded.
+        """
+        state = MancalaState.from_board(self.get_initial_board())
+        player = TOP
+        for ply, move in enumerate(self.moves):
+            if move not in state.get_possible_moves(player):
+                raise ValueError("Illegal move {} at ply {} of game {}".format(move, ply, self.game_id))
+            yield ply, state, player
+            player = state.make(player, move)[-1]
+
+    def to_dict(self):
+        return {
+            "version": RECORD_VERSION,
+            "id": self.game_id,
+            "board": [self.pockets[TOP], self.pockets[BOTTOM], self.mancalas],
+            "extra_turn": self.extra_turn,
+            "agents": self.agents,
+            "opening": self.opening,
+            "moves": self.moves,
+            "stats": self.stats,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != RECORD_VERSION:
+            raise ValueError("Game record version {} is not supported".format(data.get("version")))
+        top, bottom, mancalas = data["board"]
+        record = cls(Board([top, bottom], mancalas, data["extra_turn"]), data["agents"], data["opening"], data["id"])
+        record.moves = data["moves"]
+        record.stats = data["stats"]
+        return record
+
+
+def _open_records(filename, mode):
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode + "t")
+    return open(filename, mode)
+
+
+def write_records(filename, records, append=True):
+    """
+    Write game records to a record file, after the records already in it if append.
+    """
+    with _open_records(filename, "a" if append else "w") as f:
+        for record in records:
+            f.write(json.dumps(record.to_dict(), separators=(",", ":")) + "\n")
+
+
+def read_records(filename):
+    """
+    Yield the game records of a record file in order. Games without an id
+    are named by the file and line they are on.
+    """
+    with _open_records(filename, "r") as f:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                record = GameRecord.from_dict(json.loads(line))
+                if record.game_id is None:
+                    record.game_id = "{}:{}".format(filename, number)
+                yield record
+
+
+def _init_worker(heuristic_func):
+    global _worker_heuristic, _worker_optimizations
+    _worker_heuristic = heuristic_func
+    _worker_optimizations = {}
+
+
+def _get_optimizations(player, extra_turn):
+    """
+    Return the worker's tables for searches for the player under the rule.
+    Values are for the player at the root, so the players have separate
+    tables unless the heuristic is symmetric (see canonical.py).
+    """
+    key = None if getattr(_worker_heuristic, "symmetric", False) else player, extra_turn
+    if key not in _worker_optimizations:
+        _worker_optimizations[key] = {"tt": TranspositionTable(ANALYSIS_TT_SIZE), "ordering": MoveOrderer()}
+    return _worker_optimizations[key]
+
+
+def search_played_move(state, player, move, depth, optimizations):
+    """
+    Return the value for the player of the move played in the position,
+    searched to the given depth, counting the move.
+    """
+    heuristic_func = _worker_heuristic
+    undo = state.make(player, move)
+    next_player = undo[-1]
+    if next_player == player:
+        _, value = alphabeta_max_limit_opt(state, player, float("-Inf"), float("Inf"), heuristic_func, depth - 1, optimizations)
+    else:
+        _, value = alphabeta_min_limit_opt(state, next_player, float("-Inf"), float("Inf"), heuristic_func, depth - 1, optimizations)
+    state.unmake(undo)
+    return value
+
+
+def analyze_game(record, depth, threshold):
+    """
+    Search every position of a game after its opening again, in a worker
+    process. Return a summary of the game per side, with its blunders.
+
+    :param record: the GameRecord
+    :param depth: the depth to search each position to
+    :param threshold: the loss from which a move is a blunder
+    """
+    sides = [{"agent": record.agents[player], "moves": 0, "loss": 0.0, "blunders": [],
+              "drift": 0.0, "abs_drift": 0.0, "max_drift": 0.0, "drift_moves": 0}
+             for player in (TOP, BOTTOM)]
+    # entries of earlier games can be replaced first
+    for optimizations in _worker_optimizations.values():
+        optimizations["tt"].new_generation()
+
+    for ply, state, player in record.replay():
+        if ply < record.opening:
+            continue
+        optimizations = _get_optimizations(player, record.extra_turn)
+        optimizations.pop("pv", None)
+
+        move = record.moves[ply]
+        best_move, best_value = alphabeta_iterative_deepening(state, player, _worker_heuristic, float("Inf"), depth, optimizations)
+        if move == best_move:
+            value = best_value
+        else:
+            value = search_played_move(state, player, move, depth, optimizations)
+
+        side = sides[player]
+        side["moves"] += 1
+        loss = best_value - value
+        side["loss"] += loss
+        if loss >= threshold:
+            side["blunders"].append({"game": record.game_id, "ply": ply, "player": player, "move": move,
+                                     "best_move": best_move, "loss": loss})
+
+        stats = record.stats[ply]
+        if stats is not None and stats[0] is not None:
+            drift = stats[0] - best_value
+            side["drift"] += drift
+            side["abs_drift"] += abs(drift)
+            side["max_drift"] = max(side["max_drift"], abs(drift))
+            side["drift_moves"] += 1
+
+    return sides
+
+
+def _analyze_task(task):
+    return analyze_game(*task)
+
+
+def analyze_records(records, heuristic_func=heuristic_basic, depth=DEFAULT_ANALYSIS_DEPTH,
+                    threshold=DEFAULT_BLUNDER_THRESHOLD, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Analyze game records in worker processes and return the summary of each
+    game from analyze_game, in the order the games finish. The records can
+    be a generator, such as read_records, and are read as the workers need them.
+
+    :param processes: the number of worker processes, the number of CPUs if
+        None, or 1 to analyze in this process
+    """
+    tasks = ((record, depth, threshold) for record in records)
+    if processes == 1:
+        _init_worker(heuristic_func)
+        return [_analyze_task(task) for task in tasks]
+
+    with multiprocessing.Pool(processes, _init_worker, (heuristic_func,)) as pool:
+        return list(pool.imap_unordered(_analyze_task, tasks, chunk_size))
+
+
+def summarize(games):
+    """
+    Return the per-agent totals and all blunders, worst first, of the game
+    summaries from analyze_records. Humans are counted as the agent "human".
+    """
+    totals = {}
+    blunders = []
+    for sides in games:
+        for side in sides:
+            name = side["agent"] or "human"
+            if name not in totals:
+                totals[name] = {"agent": name, "games": 0, "moves": 0, "loss": 0.0, "blunders": 0,
+                                "drift": 0.0, "abs_drift": 0.0, "max_drift": 0.0, "drift_moves": 0}
+            agent = totals[name]
+            agent["games"] += 1
+            for field in ("moves", "loss", "drift", "abs_drift", "drift_moves"):
+                agent[field] += side[field]
+            agent["blunders"] += len(side["blunders"])
+            agent["max_drift"] = max(agent["max_drift"], side["max_drift"])
+            blunders.extend(side["blunders"])
+
+    summary = []
+    for agent in totals.values():
+        moves, drift_moves = max(agent["moves"], 1), agent["drift_moves"]
+        agent["blunder_rate"] = agent["blunders"] / moves
+        agent["mean_loss"] = agent["loss"] / moves
+        agent["mean_drift"] = agent["drift"] / drift_moves if drift_moves else None
+        agent["mean_abs_drift"] = agent["abs_drift"] / drift_moves if drift_moves else None
+        summary.append(agent)
+    summary.sort(key=lambda agent: agent["agent"])
+    blunders.sort(key=lambda blunder: -blunder["loss"])
+    return summary, blunders
+
+
+def print_report(summary, blunders, max_blunders=DEFAULT_REPORTED_BLUNDERS):
+    print("{:<40} {:>6} {:>7} {:>8} {:>8} {:>10} {:>10} {:>10}".format(
+        "agent", "games", "moves", "blunders", "blund%", "loss/move", "drift", "|drift|"))
+    for agent in summary:
+        drift = "-" if agent["mean_drift"] is None else "{:.2f}".format(agent["mean_drift"])
+        abs_drift = "-" if agent["mean_abs_drift"] is None else "{:.2f}".format(agent["mean_abs_drift"])
+        print("{:<40} {:>6} {:>7} {:>8} {:>8.1f} {:>10.3f} {:>10} {:>10}".format(
+            agent["agent"], agent["games"], agent["moves"], agent["blunders"],
+            100 * agent["blunder_rate"], agent["mean_loss"], drift, abs_drift))
+
+    if blunders:
+        print("")
+        print("Worst blunders:")
+        for blunder in blunders[:max_blunders]:
+            player = "Top" if blunder["player"] == TOP else "Bottom"
+            print("game {} ply {}: {} played {} instead of {}, losing {:g}".format(
+                blunder["game"], blunder["ply"], player, blunder["move"], blunder["best_move"], blunder["loss"]))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="MancalaGameRecords",
+        description="Search the positions of recorded Mancala games again to find blunders and evaluation drift"
+    )
+    parser.add_argument("files", nargs="+",
+                        help="Game record files, from the --record option of mancala_cmdline.py or tournament.py.")
+    parser.add_argument("-l", "--limit", type=int, default=DEFAULT_ANALYSIS_DEPTH,
+                        help="Depth to search each position to. Default is {}.".format(DEFAULT_ANALYSIS_DEPTH))
+    parser.add_argument("-u", "--heuristic", type=str, default="basic",
+                        help="Heuristic to search with. Options are [basic, advanced, weighted]. Default is basic.")
+    parser.add_argument("-w", "--weights", type=str,
+                        help="(Optional) Weights file from evaluation.py for the weighted heuristic.")
+    parser.add_argument("-b", "--blunder", type=float, default=DEFAULT_BLUNDER_THRESHOLD,
+                        help="Loss from which a move is a blunder. Default is {}.".format(DEFAULT_BLUNDER_THRESHOLD))
+    parser.add_argument("-p", "--processes", type=int,
+                        help="Worker processes. Default is the number of CPUs.")
+    parser.add_argument("-n", "--blunders", type=int, default=DEFAULT_REPORTED_BLUNDERS,
+                        help="Blunders to list. Default is {}.".format(DEFAULT_REPORTED_BLUNDERS))
+    parser.add_argument("-j", "--json", type=str,
+                        help="(Optional) File to write the summary and all blunders to.")
+    args = parser.parse_args()
+
+    if args.heuristic not in HEURISTICS:
+        parser.error("Heuristic not recognized. Options are [basic, advanced, weighted].")
+    heuristic = HEURISTICS[args.heuristic]
+    if args.weights is not None:
+        heuristic = WeightedHeuristic.load(args.weights)
+
+    def all_records():
+        for filename in args.files:
+            yield from read_records(filename)
+
+    time_start = time.perf_counter()
+    games = analyze_records(all_records(), heuristic, args.limit, args.blunder, args.processes)
+    summary, blunders = summarize(games)
+    print_report(summary, blunders, args.blunders)
+    print("{} games in {:.1f}s".format(len(games), time.perf_counter() - time_start))
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "blunders": blunders}, f, indent=2)
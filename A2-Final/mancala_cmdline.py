@@ -9,20 +9,36 @@
 import argparse
 import sys
 import random
+import time
+import uuid
 from datetime import datetime
 
-from agent_alphabeta import run_alphabeta
+from agent_alphabeta import run_alphabeta, run_alphabeta_id
+from agent_mcts import run_mcts
 from agent_minimax import run_minimax
+from agent_parallel import run_alphabeta_parallel
+from agent_pvs import run_pvs
 from agent_random import run_random
+from endgame_db import EndgameDatabase
+from evaluation import WeightedHeuristic
+from game_record import GameRecord, write_records
 from mancala_game import *
+from opening_book import OpeningBook
+from search_stats import SearchStats
 from utils import *
 
 class MancalaCommandLine(object):
 
-    def __init__(self, dimension, initial_board, player1, player2):
-        self.board = create_initial_board(dimension, initial_board)
+    def __init__(self, dimension, initial_board, player1, player2, extra_turn=False, agents=(None, None)):
+        self.board = create_initial_board(dimension, initial_board, extra_turn)
         self.players = [player1, player2]
         self.curr_player = TOP
+        # search statistics of each player over the game, for players that collect them
+        self.game_stats = [SearchStats(), SearchStats()]
+        # the moves of the game, with the names of the agents, None for humans.
+        # The id has a random suffix so that games started in the same second differ
+        game_id = "{}-{}".format(datetime.now().isoformat(timespec="seconds"), uuid.uuid4().hex[:8])
+        self.record = GameRecord(self.board, agents, game_id=game_id)
 
     def user_input_move(self):
         player = "Bottom Player" if self.curr_player == BOTTOM else "Top Player"
@@ -46,13 +62,17 @@ class MancalaCommandLine(object):
         if move_num not in self.board.get_possible_moves(self.curr_player):
             raise InvalidMoveError
 
-        self.board = play_move(self.board, self.curr_player, move_num)
-        self.curr_player = get_opponent(self.curr_player)
+        self.record.add_move(move_num)
+        self.board, self.curr_player = play_turn(self.board, self.curr_player, move_num)
     
     def ai_move(self):
         player_obj = self.players[self.curr_player]
-        move, value = player_obj.get_move(self.board, self.curr_player)
+        time_start = time.perf_counter()
+        move, value, stats = player_obj.search(self.board, self.curr_player)
+        move_time = time.perf_counter() - time_start
         player = "Bottom Player" if self.curr_player == BOTTOM else "Top Player"
+        if stats is not None:
+            self.game_stats[self.curr_player].merge(stats)
 
         if move is not None: 
             move_view = int(move)
@@ -64,8 +84,8 @@ class MancalaCommandLine(object):
             # print("{}: {} ({})".format(player, move_view, move))
             print("{} Move: {}".format(player, move_view))
             print("")
-            self.board = play_move(self.board, self.curr_player, move)
-            self.curr_player = get_opponent(self.curr_player)
+            self.record.add_move(move, value, None if stats is None else stats.nodes, move_time)
+            self.board, self.curr_player = play_turn(self.board, self.curr_player, move)
         else:
             print("Returned None for move, this shouldn't be possible")
             raise InvalidMoveError
@@ -84,13 +104,8 @@ class MancalaCommandLine(object):
 
             success = True
             if isinstance(self.players[self.curr_player], AiPlayerInterface):
-                # call AI to make a move, if timeout then end game
-                try:
-                    self.ai_move()
-                except AiTimeoutError:
-                    print("{} lost due to timeout".format(self.players[self.curr_player].name))
-                    success = False
-                    break
+                # call AI to make a move, the search plays its best move so far when it runs out of time
+                self.ai_move()
             else:
                 # get move from user, continue if incorrect
                 try:
@@ -108,6 +123,19 @@ class MancalaCommandLine(object):
 
         winner = get_winner(self.board)
         print("GAME OVER: winner is {}".format(winner))
+        self.print_stats()
+
+        for player_obj in self.players:
+            if isinstance(player_obj, AiPlayerInterface):
+                player_obj.save_cache()
+                player_obj.close()
+
+    def print_stats(self):
+        for player, player_obj in zip(("Top Player", "Bottom Player"), self.players):
+            if isinstance(player_obj, AiPlayerInterface) and player_obj.collect_stats:
+                print("")
+                print("{} ({}) search statistics:".format(player, player_obj.name))
+                print(self.game_stats[player_obj.player].format())
     
     def save_board(self, filename):
         data = [
@@ -120,6 +148,12 @@ class MancalaCommandLine(object):
         with open(filename, "w") as f:
             f.writelines(data)
 
+    def save_record(self, filename):
+        """
+        Append the record of the game to a game record file (see game_record.py).
+        """
+        write_records(filename, [self.record])
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -130,13 +164,13 @@ def parse_args():
     parser.add_argument("-d", "--dimension", type=int, default=4,
                         help="Dimension of mancala board. Default is 4.")
     parser.add_argument("-t", "--agentTop", type=str,
-                        help="Algorithm for the top player. Options are [random, minimax, alphabeta]. If not specified, user inputs moves.")
+                        help="Algorithm for the top player. Options are [random, minimax, alphabeta, alphabeta_id, alphabeta_parallel, pvs, mcts]. If not specified, user inputs moves.")
     parser.add_argument("-b", "--agentBottom", type=str,
-                        help="Algorithm for the bottom player. Options are [random, minimax, alphabeta]. If not specified, user inputs moves.")
+                        help="Algorithm for the bottom player. Options are [random, minimax, alphabeta, alphabeta_id, alphabeta_parallel, pvs, mcts]. If not specified, user inputs moves.")
     parser.add_argument("-ht", "--heuristicTop", type=str, default="basic",
-                        help="Heuristic for top player to use. Options are [basic, advanced]. Default is basic.")
+                        help="Heuristic for top player to use. Options are [basic, advanced, weighted]. Default is basic.")
     parser.add_argument("-hb", "--heuristicBottom", type=str, default="basic",
-                        help="Heuristic for bottom player to use. Options are [basic, advanced]. Default is basic.")
+                        help="Heuristic for bottom player to use. Options are [basic, advanced, weighted]. Default is basic.")
 
     parser.add_argument("-l", "--limit", type=int, default=-1,
                         help="(Optional) Depth limit for agent to use. Default is -1, which means no depth limit.")
@@ -147,6 +181,36 @@ def parse_args():
     parser.add_argument("-o", "--optimizations", action="store_true",
                         help="Use flag if agent should use additional optimizations.")
 
+    parser.add_argument("-m", "--moveTime", type=float,
+                        help="(Optional) Time budget in seconds per move for alphabeta_id, pvs and mcts. Turns on optimizations.")
+
+    parser.add_argument("-p", "--processes", type=int,
+                        help="(Optional) Worker processes for alphabeta_parallel and mcts. Default is the number of CPUs for alphabeta_parallel and 1 for mcts.")
+
+    parser.add_argument("-e", "--endgameDb", type=str,
+                        help="(Optional) Endgame database file from endgame_db.py for the agents to use. Turns on optimizations.")
+
+    parser.add_argument("-k", "--openingBook", type=str,
+                        help="(Optional) Opening book file from opening_book.py for the agents to play from.")
+
+    parser.add_argument("-q", "--quiescence", type=int,
+                        help="(Optional) Plies alphabeta and alphabeta_id can search past the depth limit with only captures and mancala moves. Turns on optimizations.")
+
+    parser.add_argument("-x", "--extraTurn", action="store_true",
+                        help="Use flag to play with the extra-turn rule: a player whose last stone lands in their own mancala moves again.")
+
+    parser.add_argument("-w", "--weights", type=str,
+                        help="(Optional) Weights file from evaluation.py for the weighted heuristic. Default is weights equivalent to advanced.")
+
+    parser.add_argument("-f", "--cacheFile", type=str,
+                        help="(Optional) File to load the agents' search caches from at the start and save them to at the end, to warm-start later games. Turns on optimizations.")
+
+    parser.add_argument("-s", "--stats", action="store_true",
+                        help="Use flag to print the agents' search statistics at the end of the game.")
+
+    parser.add_argument("-r", "--record", type=str,
+                        help="(Optional) Game record file to append the game to, with the moves and their search statistics, for game_record.py. Compressed if it ends in .gz.")
+
     args = parser.parse_args()    
     return args
 
@@ -155,18 +219,60 @@ def get_algorithm(algorithm):
         return run_minimax
     elif algorithm == "alphabeta":
         return run_alphabeta
+    elif algorithm == "alphabeta_id":
+        return run_alphabeta_id
+    elif algorithm == "alphabeta_parallel":
+        return run_alphabeta_parallel
+    elif algorithm == "pvs":
+        return run_pvs
+    elif algorithm == "mcts":
+        return run_mcts
     elif algorithm == "random":
         return run_random
     else:
-        raise TypeError("Algorithm not recognized. Options are [random, minimax, alphabeta].")
+        raise TypeError("Algorithm not recognized. Options are [random, minimax, alphabeta, alphabeta_id, alphabeta_parallel, pvs, mcts].")
     
-def get_heuristic(heuristic):
+def get_heuristic(heuristic, weights_file=None):
     if heuristic == "basic":
         return heuristic_basic
     elif heuristic == "advanced":
         return heuristic_advanced
+    elif heuristic == "weighted":
+        if weights_file is not None:
+            return WeightedHeuristic.load(weights_file)
+        return WeightedHeuristic()
     else:
-        raise TypeError("Heuristic not recognized. Options are [basic, advanced].")
+        raise TypeError("Heuristic not recognized. Options are [basic, advanced, weighted].")
+
+def get_agent_name(algorithm, heuristic, args):
+    """
+    Return the name of an agent in game records, with every setting that
+    changes how it plays, so that differently configured agents are told apart.
+    The name is in the form tournament.py takes agents in, with the keys
+    egdb, book and processes added for the settings only this program has.
+    """
+    if algorithm is None:
+        return None
+
+    parts = [algorithm, "heuristic={}".format(heuristic)]
+    if heuristic == "weighted" and args.weights is not None:
+        parts.append("weights={}".format(args.weights))
+    parts.append("limit={}".format(args.limit))
+    if args.optimizations:
+        parts.append("opt=1")
+    if args.moveTime is not None:
+        parts.append("time={}".format(args.moveTime))
+    if args.quiescence is not None:
+        parts.append("quiescence={}".format(args.quiescence))
+    if args.cacheFile is not None:
+        parts.append("cache={}".format(args.cacheFile))
+    if args.endgameDb is not None:
+        parts.append("egdb={}".format(args.endgameDb))
+    if args.openingBook is not None:
+        parts.append("book={}".format(args.openingBook))
+    if args.processes is not None:
+        parts.append("processes={}".format(args.processes))
+    return ":".join(parts)
 
 def main():
     random.seed(datetime.now().timestamp())
@@ -176,18 +282,29 @@ def main():
         print('Please provide a valid dimension or a valid initial board.')
         sys.exit(2)
     
+    endgame_db = None
+    if args.endgameDb is not None:
+        endgame_db = EndgameDatabase(args.endgameDb)
+    opening_book = None
+    if args.openingBook is not None:
+        opening_book = OpeningBook(args.openingBook)
+
     if args.agentTop != None:
-        p1 = AiPlayerInterface(TOP, get_algorithm(args.agentTop), args.limit, args.optimizations, get_heuristic(args.heuristicTop))
+        p1 = AiPlayerInterface(TOP, get_algorithm(args.agentTop), args.limit, args.optimizations, get_heuristic(args.heuristicTop, args.weights), args.moveTime, args.processes, endgame_db, opening_book, args.stats, args.quiescence, args.cacheFile)
     else:
         p1 = Player(TOP)
 
     if args.agentBottom != None:
-        p2 = AiPlayerInterface(BOTTOM, get_algorithm(args.agentBottom), args.limit, args.optimizations, get_heuristic(args.heuristicBottom))
+        p2 = AiPlayerInterface(BOTTOM, get_algorithm(args.agentBottom), args.limit, args.optimizations, get_heuristic(args.heuristicBottom, args.weights), args.moveTime, args.processes, endgame_db, opening_book, args.stats, args.quiescence, args.cacheFile)
     else:
         p2 = Player(BOTTOM)
         
-    cmdline = MancalaCommandLine(args.dimension, args.initialBoard, p1, p2) 
+    agents = (get_agent_name(args.agentTop, args.heuristicTop, args),
+              get_agent_name(args.agentBottom, args.heuristicBottom, args))
+    cmdline = MancalaCommandLine(args.dimension, args.initialBoard, p1, p2, args.extraTurn, agents)
     cmdline.run()
+    if args.record is not None:
+        cmdline.save_record(args.record)
 
 
 if __name__ == "__main__":
@@ -6,8 +6,16 @@
 # version 2.0
 ##########################################################
 
+import time
+
+from cache_manager import SearchCache, get_snapshot_key, load_snapshot, new_generation, save_snapshot
+from move_ordering import MoveOrderer
+from transposition import TranspositionTable
 from utils import *
 
+# Stones in each pocket of a new board
+INITIAL_STONES = 4
+
 
 # Reading initial board from file
 def read_initial_board(init_board):
@@ -57,14 +65,22 @@ def read_initial_board_file(filename):
     return dimension, Board(pockets, mancalas)
 
 
-def create_initial_board(dimension=None, initial_board=None):
+def create_initial_board(dimension=None, initial_board=None, extra_turn=False, stones=INITIAL_STONES):
+    """
+    Create the starting board from a dimension or an initial board.
+
+    :param extra_turn: whether a player whose last stone lands in their own
+        mancala moves again (the Kalah rule).
+    :param stones: the number of stones in each pocket of a board created from a dimension.
+    """
     assert dimension is not None or initial_board is not None
     if initial_board is not None:
         # if dimension is not None:
         #     print("Initializing game from", initial_board, ", dimension parameter ignored.")
         dimension, board = read_initial_board(initial_board)
     elif dimension is not None:
-        board = Board([[4] * dimension, [4] * dimension], [0, 0])
+        board = Board([[stones] * dimension, [stones] * dimension], [0, 0])
+    board.extra_turn = extra_turn
     return board
 
 
@@ -73,21 +89,30 @@ class Board(object):
     Board class that represents a Mancala board
     """
 
-    def __init__(self, pockets, mancalas):
+    def __init__(self, pockets, mancalas, extra_turn=False):
         """
         Create a Mancala game board.
+
+        extra_turn is the rule flag for the game played on this board: if set,
+        a player whose last stone lands in their own mancala moves again.
+        It is carried over to the boards that play_move returns.
         """
         self.dimension = len(pockets[TOP])
         self.pockets = pockets
         self.mancalas = mancalas
+        self.extra_turn = extra_turn
 
     def __eq__(self, other):
-        return self.pockets == other.pockets and self.mancalas == other.mancalas
+        return self.get_key() == other.get_key()
 
     def __hash__(self):
-        self.pockets = tuple(tuple(sublist) for sublist in self.pockets)
-        self.mancalas = tuple(self.mancalas)
-        return hash((self.pockets, self.mancalas))
+        return hash(self.get_key())
+
+    def get_key(self):
+        """
+        Get the position as nested tuples, whether the rows are lists or tuples.
+        """
+        return tuple(tuple(sublist) for sublist in self.pockets), tuple(self.mancalas)
     
     def draw_board(self, return_str=False):
         """
@@ -178,79 +203,149 @@ def get_winner(board):
         return "Tie"
 
 
-def play_move(board, player, move):
+# Sowing tables, built lazily once per board dimension
+_sowing_paths = {}
+
+
+def get_sowing_paths(dimension):
     """
-    Play a move on the current board. 
-    :param board: the current board
-    :param player: the player to move.
-    :param move: the move to perform. the index of the pocket.
-    """  
-    side = player
+    Return the sowing table for the given board dimension.
+
+    The board is treated as a flat list of cells: the top pockets, the bottom
+    pockets, the top mancala and the bottom mancala. paths[player][move] lists,
+    in order, the cells that the stones from that pocket land in. Both players
+    sow counter-clockwise (leftwards along the top row, rightwards along the
+    bottom row) and skip the opponent's mancala, so each path visits all
+    2 * dimension + 1 other cells once and ends at the emptied pocket.
+    """
+    if dimension not in _sowing_paths:
+        d = dimension
+        top_store, bottom_store = 2 * d, 2 * d + 1
+        ring = list(range(d - 1, -1, -1)) + [top_store] + list(range(d, 2 * d)) + [bottom_store]
+
+        paths = []
+        for player in (TOP, BOTTOM):
+            skipped = bottom_store if player == TOP else top_store
+            own_ring = [cell for cell in ring if cell != skipped]
+            player_paths = []
+            for move in range(d):
+                start = own_ring.index(player * d + move) + 1
+                player_paths.append(own_ring[start:] + own_ring[:start])
+            paths.append(player_paths)
+
+        _sowing_paths[dimension] = paths
+    return _sowing_paths[dimension]
+
+
+def sow(cells, path, dimension, player, move):
+    """
+    Sow the stones of a pocket in a flat list of cells (see get_sowing_paths),
+    including the capture check. Modifies the cells.
 
-    new_board = []
-    for row in board.pockets: 
-        new_board.append(list(row[:]))
-    new_mancalas = [board.mancalas[TOP], board.mancalas[BOTTOM]]
+    Instead of dropping one stone at a time, every cell on the path gets one
+    stone per full lap, and the first cells get the remainder, so the cost
+    does not grow with the number of stones.
+
+    :param cells: the flat list of cells.
+    :param path: the sowing path for the player and move, from get_sowing_paths.
+    :return: the number of stones sown, the cell the last stone landed in,
+        and the number of stones captured (None if there was no capture).
+    """
+    pocket = player * dimension + move
+    stone_count = cells[pocket]
+    cells[pocket] = 0
+
+    if stone_count < len(path):
+        for cell in path[:stone_count]:
+            cells[cell] += 1
+        last = path[stone_count - 1]
+    else:
+        laps, remainder = divmod(stone_count, len(path))
+        for cell in path:
+            cells[cell] += laps
+        for cell in path[:remainder]:
+            cells[cell] += 1
+        last = path[(stone_count - 1) % len(path)]
+
+    #do we have a capture?
+    captured = None
+    if last < 2 * dimension and last // dimension == player and cells[last] == 1:
+        opposite = last + dimension if player == TOP else last - dimension
+        captured = cells[opposite]
+        cells[opposite] = 0
+        cells[2 * dimension + player] += captured
+
+    return stone_count, last, captured
 
-    stone_count = board.pockets[side][move] # find the number of stones in the pocket
-    new_board[side][move] = 0 # set to 0
 
-    if (player == BOTTOM):
-        direction = True
-        ind = move + 1
+def unsow(cells, path, dimension, player, move, stone_count, last, captured):
+    """
+    Undo sow on a flat list of cells, given the values it returned.
+    """
+    if captured is not None:
+        opposite = last + dimension if player == TOP else last - dimension
+        cells[opposite] = captured
+        cells[2 * dimension + player] -= captured
+
+    if stone_count < len(path):
+        for cell in path[:stone_count]:
+            cells[cell] -= 1
     else:
-        direction = False
-        ind = move - 1
-
-    while stone_count > 0: #deposit stones around the board
-        # we are at the end of the board
-        if ind > (len(board.pockets[side])-1) or ind < 0:
-            # swap side and change direction
-            side = TOP if side == BOTTOM else BOTTOM 
-            direction = not direction 
-
-            #if we are at the end of the board, 
-            #deposit stone in a mancala before we continue
-            if ind > (len(board.pockets[side]) - 1): 
-                if player == BOTTOM:
-                    stone_count -= 1
-                    new_mancalas[player] += 1
-                ind = len(board.pockets[side])-1
-            else:
-                if player == TOP:
-                    stone_count -= 1
-                    new_mancalas[player] += 1
-                ind = 0
-
-        # ran out of stones
-        if stone_count == 0: 
-            break
-
-        #but if not, put a stone in a pocket and decrement stone count
-        new_board[side][ind] = new_board[side][ind] + 1
-        stone_count -= 1
-
-        #do we have a capture?
-        if stone_count == 0 and new_board[side][ind] == 1 and side == player: 
-            captures = new_board[get_opponent(side)][ind] #if yes capture stones in the opposite pit
-            new_board[get_opponent(side)][ind] = 0
-            new_mancalas[player] += captures
-
-        if direction: 
-            ind += 1
-        else: 
-            ind -= 1
+        laps, remainder = divmod(stone_count, len(path))
+        for cell in path:
+            cells[cell] -= laps
+        for cell in path[:remainder]:
+            cells[cell] -= 1
+    cells[player * dimension + move] = stone_count
+
+
+def get_next_player(dimension, player, last, extra_turn):
+    """
+    Return the player to move after the player's last stone landed in the cell last.
+
+    :param extra_turn: whether the extra-turn rule applies to this move.
+        It should be False once the move has ended the game.
+    """
+    if extra_turn and last == 2 * dimension + player:
+        return player
+    return get_opponent(player)
+
+
+def play_turn(board, player, move):
+    """
+    Play a move on the current board, and report who moves next.
+    With the board's extra_turn rule, that is the same player when their last
+    stone landed in their own mancala and the game is not over; otherwise it
+    is the opponent.
+
+    :param board: the current board
+    :param player: the player to move.
+    :param move: the move to perform. the index of the pocket.
+    :return: the new board and the player to move next.
+    """
+    d = board.dimension
+    cells = list(board.pockets[TOP]) + list(board.pockets[BOTTOM]) + [board.mancalas[TOP], board.mancalas[BOTTOM]]
+    _, last, _ = sow(cells, get_sowing_paths(d)[player][move], d, player, move)
 
     # make rows tuples
-    final_pockets = []
-    for row in new_board: 
-        final_pockets.append(tuple(row))
-    final_board = Board(final_pockets, new_mancalas)
+    final_board = Board([tuple(cells[0:d]), tuple(cells[d:2 * d])], cells[2 * d:], board.extra_turn)
 
     # end the game if done
-    if sum(new_board[TOP]) == 0 or sum(new_board[BOTTOM]) == 0:
+    game_over = sum(final_board.pockets[TOP]) == 0 or sum(final_board.pockets[BOTTOM]) == 0
+    if game_over:
         final_board = end_game(final_board)
 
+    return final_board, get_next_player(d, player, last, board.extra_turn and not game_over)
+
+
+def play_move(board, player, move):
+    """
+    Play a move on the current board. 
+    :param board: the current board
+    :param player: the player to move.
+    :param move: the move to perform. the index of the pocket.
+    """  
+    final_board, _ = play_turn(board, player, move)
     return final_board
 
 
@@ -300,27 +395,126 @@ class Player(object):
 
 
 class AiPlayerInterface(Player):
-    def __init__(self, player, algorithm, limit, optimizations, heuristic):
+    def __init__(self, player, algorithm, limit, optimizations, heuristic, time_budget=None, processes=None, endgame_db=None, opening_book=None, collect_stats=False, quiescence=None, cache_file=None):
         """
         Initializes an AI player that uses minimax or alphabeta.
 
         player    str: for notation 
-        algorithm str: [random, minimax, alphabeta]
+        algorithm str: [random, minimax, alphabeta, alphabeta_id, alphabeta_parallel, pvs, mcts]
         limit     int: >0 -> using depth limit
         optimizations  bool: whether to use additional optimizations
         heuristic str: [basic, advanced] 
+        time_budget  float: seconds per move for the time-managed agents (alphabeta_id, pvs, mcts),
+                     turns on optimizations so the tables are kept between moves
+        processes    int: worker processes for alphabeta_parallel and mcts, turns on
+                     optimizations so the pool is kept between moves
+        endgame_db   EndgameDatabase: exact values for positions with few stones
+                     left, used by the optimized searches
+        opening_book OpeningBook: moves to play without searching in the opening
+        collect_stats  bool: whether to count the nodes, cutoffs, heuristic calls and
+                     cache lookups of each search, which slows the search down
+        quiescence   int: plies the optimized alpha-beta searches can go past the depth
+                     limit with captures and mancala moves, turns on optimizations
+        cache_file   str: snapshot file the caches are loaded from before the first move
+                     and saved to by save_cache, turns on optimizations
         """
         super().__init__(player, algorithm.__name__)
         self.algorithm = algorithm
         self.hfunc = heuristic
 
         self.limit = limit
-        if optimizations:
+        if optimizations or time_budget is not None or processes is not None or endgame_db is not None or quiescence is not None or cache_file is not None:
             self.optimizations = {}
-            self.optimizations["cache"] = {}
+            self.optimizations["cache"] = SearchCache()
+            self.optimizations["tt"] = TranspositionTable()
+            self.optimizations["ordering"] = MoveOrderer()
+            if time_budget is not None:
+                self.optimizations["time_budget"] = time_budget
+            if processes is not None:
+                self.optimizations["processes"] = processes
+            if endgame_db is not None:
+                self.optimizations["egdb"] = endgame_db
+            if quiescence is not None:
+                self.optimizations["quiescence"] = quiescence
         else:
             self.optimizations = None
+        self.opening_book = opening_book
+        self.collect_stats = collect_stats
+        self.last_stats = None
+        self.cache_file = cache_file
+        self.snapshot_key = None
         
     def get_move(self, board, player):
-        move, value = self.algorithm(board, player, self.limit, self.optimizations, self.hfunc)
+        move, value, _ = self.search(board, player)
         return move, value
+
+    def search(self, board, player):
+        """
+        Return the move to play, its value and the SearchStats of the search,
+        which are None if the player does not collect them or played from the
+        opening book. The statistics are also kept as last_stats.
+        """
+        self.last_stats = None
+        if self.opening_book is not None:
+            entry = self.opening_book.lookup(board, player)
+            if entry is not None:
+                return entry[0], entry[1], None
+
+        if self.optimizations is not None:
+            # the rules are only known from the board, so the snapshot is loaded at the first move
+            if self.cache_file is not None and self.snapshot_key is None:
+                self.snapshot_key = get_snapshot_key(self.algorithm, self.hfunc, self.player, board.extra_turn,
+                                                     self.optimizations.get("quiescence"))
+                load_snapshot(self.cache_file, self.snapshot_key, self.optimizations)
+            new_generation(self.optimizations)
+
+        if not self.collect_stats:
+            move, value = self.algorithm(board, player, self.limit, self.optimizations, self.hfunc)
+            return move, value, None
+
+        # imported here because search_stats builds on mancala_state, which imports this module
+        from search_stats import CountingHeuristic, InstrumentedState, SearchStats
+
+        stats = SearchStats()
+        state = InstrumentedState(board, stats)
+        table = self.optimizations["tt"] if self.optimizations is not None else None
+        if table is not None:
+            table_before = table.get_stats()
+            self.optimizations["stats"] = stats
+
+        time_start = time.perf_counter()
+        try:
+            move, value = self.algorithm(state, player, self.limit, self.optimizations, CountingHeuristic(self.hfunc, stats))
+        finally:
+            stats.time = time.perf_counter() - time_start
+            stats.searches = 1
+            state.finish()
+            if table is not None:
+                del self.optimizations["stats"]
+                table_after = table.get_stats()
+                stats.cache_hits += table_after["hits"] - table_before["hits"]
+                stats.cache_misses += table_after["misses"] - table_before["misses"]
+                stats.cache_overwrites += table_after["overwrites"] - table_before["overwrites"]
+            self.last_stats = stats
+
+        return move, value, stats
+
+    def close(self):
+        """
+        Shut down the worker pools the searches keep between moves, if any.
+        Call it once the player is done.
+        """
+        if self.optimizations is None:
+            return
+        # imported here because the agents import this module
+        from agent_mcts import close_mcts_pool
+        from agent_parallel import close_search_pool
+        close_mcts_pool(self.optimizations)
+        close_search_pool(self.optimizations)
+
+    def save_cache(self):
+        """
+        Save the caches to the cache file, if the player has one and has searched.
+        """
+        if self.cache_file is not None and self.snapshot_key is not None:
+            save_snapshot(self.cache_file, self.snapshot_key, self.optimizations)
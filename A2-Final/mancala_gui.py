@@ -16,16 +16,22 @@ from datetime import datetime
 from tkinter import *
 from tkinter import scrolledtext
 
-from agent_alphabeta import run_alphabeta
+from agent_alphabeta import run_alphabeta, run_alphabeta_id
+from agent_mcts import run_mcts
 from agent_minimax import run_minimax
+from agent_parallel import run_alphabeta_parallel
+from agent_pvs import run_pvs
 from agent_random import run_random
+from endgame_db import EndgameDatabase
+from evaluation import WeightedHeuristic
 from mancala_game import *
+from opening_book import OpeningBook
 from utils import *
 
 class MancalaGui(object):
 
-    def __init__(self, dimension, initial_board, player1, player2):
-        self.board = create_initial_board(dimension, initial_board)
+    def __init__(self, dimension, initial_board, player1, player2, extra_turn=False):
+        self.board = create_initial_board(dimension, initial_board, extra_turn)
         self.players = [player1, player2]
         self.curr_player = TOP
 
@@ -75,8 +81,7 @@ class MancalaGui(object):
             raise InvalidMoveError("Invalid move: Not the current player.")
 
         # play move and display
-        self.board = play_move(self.board, self.curr_player, i - 1)
-        self.curr_player = get_opponent(self.curr_player)
+        self.board, self.curr_player = play_turn(self.board, self.curr_player, i - 1)
         self.draw_board()
 
         # check if game is over
@@ -99,20 +104,14 @@ class MancalaGui(object):
         """
         # get the ai move
         player_obj = self.players[self.curr_player]
-        try:
-            move, value = player_obj.get_move(self.board, self.curr_player)
-        except AiTimeoutError:
-            self.log("Game Over, {} lost (timeout)".format(player_obj.name))
-            self.shutdown("Game Over, {} lost (timeout)".format(player_obj.name))
-            return
+        move, value = player_obj.get_move(self.board, self.curr_player)
 
         # log
         player = "Bottom Player" if self.curr_player == BOTTOM else "Top Player"
         self.log("{}: {}".format(player, move))
         
         # play move and display
-        self.board = play_move(self.board, self.curr_player, move)
-        self.curr_player = get_opponent(self.curr_player)
+        self.board, self.curr_player = play_turn(self.board, self.curr_player, move)
         self.draw_board()
 
         # check if game is over
@@ -139,6 +138,10 @@ class MancalaGui(object):
         self.draw_board()
         self.canvas.mainloop()
 
+        for player_obj in self.players:
+            if isinstance(player_obj, AiPlayerInterface):
+                player_obj.close()
+
     def draw_board(self):
         self.draw_pits()
         self.draw_stones()
@@ -210,19 +213,33 @@ def parse_args():
     parser.add_argument("-d", "--dimension", type=int, default=4,
                         help="Dimension of mancala board.")
     parser.add_argument("-t", "--agentTop", type=str,
-                        help="Algorithm for the top player. If not specified, user inputs moves. [random, minimax, alphabeta]")
+                        help="Algorithm for the top player. If not specified, user inputs moves. [random, minimax, alphabeta, alphabeta_id, alphabeta_parallel, pvs, mcts]")
     parser.add_argument("-b", "--agentBottom", type=str,
-                        help="Algorithm for the bottom player. If not specified, user inputs moves. [random, minimax, alphabeta]")
+                        help="Algorithm for the bottom player. If not specified, user inputs moves. [random, minimax, alphabeta, alphabeta_id, alphabeta_parallel, pvs, mcts]")
     parser.add_argument("-ht", "--heuristicTop", type=str, default="basic",
-                        help="Heuristic for top player to use. [basic, advanced]")
+                        help="Heuristic for top player to use. [basic, advanced, weighted]")
     parser.add_argument("-hb", "--heuristicBottom", type=str, default="basic",
-                        help="Heuristic for bottom player to use. [basic, advanced]")
+                        help="Heuristic for bottom player to use. [basic, advanced, weighted]")
     parser.add_argument("-c", "--caching", action="store_true",
                         help="Use flag if agent should use caching.")
     parser.add_argument("-l", "--limit", type=int, default=-1,
                         help="(Optional) Depth limit for agent to use.")
     parser.add_argument("-i", "--initialBoard", type=str,
                         help="File storing the initial state of the board. Overwrites dimension.")
+    parser.add_argument("-m", "--moveTime", type=float,
+                        help="(Optional) Time budget in seconds per move for alphabeta_id, pvs and mcts. Turns on caching.")
+    parser.add_argument("-p", "--processes", type=int,
+                        help="(Optional) Worker processes for alphabeta_parallel and mcts. Default is the number of CPUs for alphabeta_parallel and 1 for mcts.")
+    parser.add_argument("-e", "--endgameDb", type=str,
+                        help="(Optional) Endgame database file from endgame_db.py for the agents to use. Turns on optimizations.")
+    parser.add_argument("-k", "--openingBook", type=str,
+                        help="(Optional) Opening book file from opening_book.py for the agents to play from.")
+    parser.add_argument("-w", "--weights", type=str,
+                        help="(Optional) Weights file from evaluation.py for the weighted heuristic.")
+    parser.add_argument("-q", "--quiescence", type=int,
+                        help="(Optional) Plies alphabeta and alphabeta_id can search past the depth limit with only captures and mancala moves. Turns on caching.")
+    parser.add_argument("-x", "--extraTurn", action="store_true",
+                        help="Use flag to play with the extra-turn rule: a player whose last stone lands in their own mancala moves again.")
 
     args = parser.parse_args()    
     return args
@@ -232,18 +249,30 @@ def get_algorithm(algorithm):
         return run_minimax
     elif algorithm == "alphabeta":
         return run_alphabeta
+    elif algorithm == "alphabeta_id":
+        return run_alphabeta_id
+    elif algorithm == "alphabeta_parallel":
+        return run_alphabeta_parallel
+    elif algorithm == "pvs":
+        return run_pvs
+    elif algorithm == "mcts":
+        return run_mcts
     elif algorithm == "random":
         return run_random
     else:
-        raise TypeError("Algorithm not recognized (only minimax or alphabeta)")
+        raise TypeError("Algorithm not recognized (only minimax, alphabeta, alphabeta_id, alphabeta_parallel, pvs or mcts)")
     
-def get_heuristic(heuristic):
+def get_heuristic(heuristic, weights_file=None):
     if heuristic == "basic":
         return heuristic_basic
     elif heuristic == "advanced":
         return heuristic_advanced
+    elif heuristic == "weighted":
+        if weights_file is not None:
+            return WeightedHeuristic.load(weights_file)
+        return WeightedHeuristic()
     else:
-        raise TypeError("Heuristic not recognized (only basic or advanced)")
+        raise TypeError("Heuristic not recognized (only basic, advanced or weighted)")
 
 def main():
     random.seed(datetime.now().timestamp())
@@ -253,17 +282,24 @@ def main():
         print('Please provide a valid board size (at least 1).')
         sys.exit(2)
     
+    endgame_db = None
+    if args.endgameDb is not None:
+        endgame_db = EndgameDatabase(args.endgameDb)
+    opening_book = None
+    if args.openingBook is not None:
+        opening_book = OpeningBook(args.openingBook)
+
     if args.agentTop != None:
-        p1 = AiPlayerInterface(TOP, get_algorithm(args.agentTop), args.limit, args.caching, get_heuristic(args.heuristicTop))
+        p1 = AiPlayerInterface(TOP, get_algorithm(args.agentTop), args.limit, args.caching, get_heuristic(args.heuristicTop, args.weights), args.moveTime, args.processes, endgame_db, opening_book, quiescence=args.quiescence)
     else:
         p1 = Player(TOP)
 
     if args.agentBottom != None:
-        p2 = AiPlayerInterface(BOTTOM, get_algorithm(args.agentBottom), args.limit, args.caching, get_heuristic(args.heuristicBottom))
+        p2 = AiPlayerInterface(BOTTOM, get_algorithm(args.agentBottom), args.limit, args.caching, get_heuristic(args.heuristicBottom, args.weights), args.moveTime, args.processes, endgame_db, opening_book, quiescence=args.quiescence)
     else:
         p2 = Player(BOTTOM)
         
-    gui = MancalaGui(args.dimension, args.initialBoard, p1, p2) 
+    gui = MancalaGui(args.dimension, args.initialBoard, p1, p2, args.extraTurn) 
     gui.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,253 @@
+##########################################################
+# This module contains a compact Mancala state for the search agents.
+# Moves are applied and undone in place, so searching does not build
+# a new Board for every child.
+#
+# CSC 384 Assignment 2
+# version 2.0
+##########################################################
+
+from mancala_game import Board, get_next_player, get_sowing_paths, sow, unsow
+from utils import *
+
+# Cache of get_row_counts tables, by dimension
+_row_counts = {}
+
+
+def get_row_counts(dimension):
+    """
+    Return, for every sowing path (see get_sowing_paths), how many of its
+    first k cells are top pockets and bottom pockets:
+    counts[player][move][k] = (top, bottom). With it, the stones a move adds
+    to each row are known without looking at the cells.
+    """
+    if dimension not in _row_counts:
+        d = dimension
+        counts = []
+        for player_paths in get_sowing_paths(d):
+            player_counts = []
+            for path in player_paths:
+                prefix = [(0, 0)]
+                for cell in path:
+                    top, bottom = prefix[-1]
+                    prefix.append((top + (cell < d), bottom + (d <= cell < 2 * d)))
+                player_counts.append(prefix)
+            counts.append(player_counts)
+        _row_counts[dimension] = counts
+    return _row_counts[dimension]
+
+
+class _Rows(object):
+    """
+    Read-only view of a state's pockets, indexed like Board.pockets.
+    """
+
+    def __init__(self, state):
+        self.state = state
+
+    def __getitem__(self, player):
+        d = self.state.dimension
+        return self.state.cells[player * d:(player + 1) * d]
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        return iter((self[TOP], self[BOTTOM]))
+
+
+class _Stores(object):
+    """
+    Read-only view of a state's mancalas, indexed like Board.mancalas.
+    """
+
+    def __init__(self, state):
+        self.state = state
+
+    def __getitem__(self, player):
+        return self.state.cells[2 * self.state.dimension + player]
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        return iter((self[TOP], self[BOTTOM]))
+
+
+class MancalaState(object):
+    """
+    A Mancala position stored in a single flat list, with make/unmake moves.
+
+    The list holds the top pockets, the bottom pockets, the top mancala and
+    the bottom mancala, in that order. A plain list is used rather than an
+    array('B'): indexing an array boxes every value it reads, which made the
+    search measurably slower than with a list.
+
+    The pockets and mancalas attributes are read-only views with the same
+    indexing as a Board, so the heuristic functions work on either.
+    extra_turn is the same rule flag as on a Board.
+
+    row_sums holds the number of stones in each row. make and unmake keep it
+    up to date from the sowing path, so the end of the game and the stone
+    counts the heuristics use are known without summing the rows.
+
+    deadline is the Deadline of the search running on the state, if any.
+    make polls it, so every search stops in time without checking the
+    clock itself.
+    """
+
+    deadline = None
+
+    def __init__(self, pockets, mancalas, extra_turn=False):
+        dimension = len(pockets[TOP])
+
+        self.dimension = dimension
+        self.extra_turn = extra_turn
+        self.cells = list(pockets[TOP]) + list(pockets[BOTTOM]) + list(mancalas)
+        self.paths = get_sowing_paths(dimension)
+        self.row_counts = get_row_counts(dimension)
+        self.pockets = _Rows(self)
+        self.mancalas = _Stores(self)
+        self.update_row_sums()
+
+    @classmethod
+    def from_board(cls, board):
+        return cls(board.pockets, board.mancalas, board.extra_turn)
+
+    def to_board(self):
+        """
+        Return a Board with the same position.
+        """
+        d = self.dimension
+        return Board([tuple(self.cells[0:d]), tuple(self.cells[d:2 * d])], list(self.cells[2 * d:]), self.extra_turn)
+
+    def copy(self):
+        state = MancalaState.__new__(MancalaState)
+        state.dimension = self.dimension
+        state.extra_turn = self.extra_turn
+        state.cells = self.cells[:]
+        state.paths = self.paths
+        state.row_counts = self.row_counts
+        state.pockets = _Rows(state)
+        state.mancalas = _Stores(state)
+        state.row_sums = self.row_sums[:]
+        return state
+
+    def update_row_sums(self):
+        """
+        Recompute the row sums, after the cells were changed other than by make and unmake.
+        """
+        d = self.dimension
+        self.row_sums = [sum(self.cells[0:d]), sum(self.cells[d:2 * d])]
+
+    def restore(self, cells):
+        """
+        Put back the cells copied earlier, after a search was stopped
+        between a make and its unmake.
+        """
+        self.cells[:] = cells
+        self.update_row_sums()
+
+    def key(self):
+        """
+        Return a hashable key that uniquely identifies the position.
+        """
+        return tuple(self.cells)
+
+    def get_possible_moves(self, player):
+        """
+        Return a list of all possible indices (representing pockets) that the
+        current player can play on the current board.
+        """
+        cells = self.cells
+        base = player * self.dimension
+        return [j for j in range(self.dimension) if cells[base + j] > 0]
+
+    def make(self, player, move):
+        """
+        Play a move in place, with the same rules as play_turn.
+        Return the undo record to pass to unmake. Its last element is
+        the player to move next.
+
+        :param player: the player to move.
+        :param move: the move to perform. the index of the pocket.
+        """
+        deadline = self.deadline
+        if deadline is not None:
+            deadline.poll()
+
+        cells = self.cells
+        d = self.dimension
+        path = self.paths[player][move]
+        stone_count, last, captured = sow(cells, path, d, player, move)
+
+        row_sums = self.row_sums
+        counts = self.row_counts[player][move]
+        if stone_count < len(path):
+            top, bottom = counts[stone_count]
+        else:
+            laps, remainder = divmod(stone_count, len(path))
+            top, bottom = counts[-1]
+            top_remainder, bottom_remainder = counts[remainder]
+            top, bottom = laps * top + top_remainder, laps * bottom + bottom_remainder
+        row_sums[player] -= stone_count
+        row_sums[TOP] += top
+        row_sums[BOTTOM] += bottom
+        if captured is not None:
+            row_sums[get_opponent(player)] -= captured
+
+        # end the game if done
+        swept = None
+        if row_sums[TOP] == 0 or row_sums[BOTTOM] == 0:
+            swept = cells[0:2 * d]
+            cells[2 * d] += row_sums[TOP]
+            cells[2 * d + 1] += row_sums[BOTTOM]
+            cells[0:2 * d] = [0] * (2 * d)
+            row_sums[TOP] = row_sums[BOTTOM] = 0
+
+        next_player = get_next_player(d, player, last, self.extra_turn and swept is None)
+        return player, move, stone_count, last, captured, swept, next_player
+
+    def unmake(self, undo):
+        """
+        Undo a move played with make.
+
+        :param undo: the undo record returned by make.
+        """
+        player, move, stone_count, last, captured, swept, _ = undo
+        cells = self.cells
+        d = self.dimension
+        row_sums = self.row_sums
+
+        if swept is not None:
+            cells[0:2 * d] = swept
+            row_sums[TOP] = sum(swept[0:d])
+            row_sums[BOTTOM] = sum(swept[d:2 * d])
+            cells[2 * d] -= row_sums[TOP]
+            cells[2 * d + 1] -= row_sums[BOTTOM]
+
+        path = self.paths[player][move]
+        unsow(cells, path, d, player, move, stone_count, last, captured)
+
+        counts = self.row_counts[player][move]
+        if stone_count < len(path):
+            top, bottom = counts[stone_count]
+        else:
+            laps, remainder = divmod(stone_count, len(path))
+            top, bottom = counts[-1]
+            top_remainder, bottom_remainder = counts[remainder]
+            top, bottom = laps * top + top_remainder, laps * bottom + bottom_remainder
+        row_sums[player] += stone_count
+        row_sums[TOP] -= top
+        row_sums[BOTTOM] -= bottom
+        if captured is not None:
+            row_sums[get_opponent(player)] += captured
+
+
+def as_state(board):
+    """
+    Return the board as a MancalaState, converting it if it is a Board.
+    """
+    if isinstance(board, MancalaState):
+        return board
+    return MancalaState.from_board(board)
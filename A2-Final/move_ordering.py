@@ -0,0 +1,176 @@
+###############################################################################
+# This file implements move ordering for the alpha-beta agents.
+#
+# Alpha-beta prunes the most when the best move is searched first, so moves
+# are tried in this order:
+#   1. the hash move, the best move stored in the transposition table
+#   2. the move on the previous iteration's principal variation
+#   3. moves whose last stone lands in the player's own mancala
+#   4. captures, largest first
+#   5. killer moves, which recently caused a cutoff at the same depth
+#   6. the rest, by their history score
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+from utils import *
+
+### Ordering scores ###
+HASH_MOVE_SCORE = 1 << 30
+PV_MOVE_SCORE = 1 << 29
+MANCALA_MOVE_SCORE = 1 << 28
+CAPTURE_SCORE = 1 << 27
+KILLER_SCORE = 1 << 26
+
+# Killer moves kept per depth
+KILLER_SLOTS = 2
+
+
+class MoveOrderer(object):
+    """
+    Orders moves for the alpha-beta search, and counts nodes and cutoffs so
+    the effect of the ordering can be measured.
+
+    Killer moves are indexed by the remaining depth, which identifies the ply
+    within one search. History scores are indexed by player and pocket.
+    """
+
+    def __init__(self, enabled=True):
+        """
+        :param enabled: if False, moves keep pocket order (after the hash move),
+            which gives a baseline for the statistics.
+        """
+        self.enabled = enabled
+        self.killers = {}
+        self.history = [{}, {}]
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        """
+        Prepare for searching a new position: killers are forgotten and
+        history scores are halved so recent searches count the most.
+        """
+        self.killers = {}
+        for history in self.history:
+            for move in history:
+                history[move] //= 2
+
+    def order(self, board, player, moves, depth, hash_move=None, pv_move=None):
+        """
+        Return the moves in the order they should be searched.
+
+        :param board: the current MancalaState
+        :param player: the player to move
+        :param moves: the legal moves
+        :param depth: the remaining depth
+        :param hash_move: the best move from the transposition table, if any
+        :param pv_move: the move on the previous principal variation, if any
+        """
+        self.nodes += 1
+
+        if not self.enabled:
+            if hash_move in moves:
+                moves = [hash_move] + [move for move in moves if move != hash_move]
+            return moves
+
+        cells = board.cells
+        d = board.dimension
+        base = player * d
+        own_mancala = 2 * d + player
+        paths = board.paths[player]
+        killers = self.killers.get(depth, ())
+        history = self.history[player]
+
+        scores = {}
+        for move in moves:
+            if move == hash_move:
+                scores[move] = HASH_MOVE_SCORE
+                continue
+            if move == pv_move:
+                scores[move] = PV_MOVE_SCORE
+                continue
+
+            stone_count = cells[base + move]
+            path = paths[move]
+            last = path[(stone_count - 1) % len(path)]
+            if last == own_mancala:
+                scores[move] = MANCALA_MOVE_SCORE
+            elif stone_count < len(path) and base <= last < base + d and cells[last] == 0:
+                opposite = last + d if player == TOP else last - d
+                scores[move] = CAPTURE_SCORE + cells[opposite]
+            elif move in killers:
+                scores[move] = KILLER_SCORE
+            else:
+                scores[move] = history.get(move, 0)
+
+        # sorted is stable, so equal scores stay in pocket order
+        return sorted(moves, key=lambda move: -scores[move])
+
+    def record_cutoff(self, player, move, depth, index):
+        """
+        Record that the move caused a cutoff, and was the index-th move searched.
+        """
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+
+        killers = self.killers.setdefault(depth, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[KILLER_SLOTS:]
+
+        history = self.history[player]
+        history[move] = history.get(move, 0) + depth * depth
+
+    def get_stats(self):
+        """
+        Return the node and cutoff counts since the last reset.
+        first_move_rate is the share of cutoffs caused by the first move
+        searched, which is 1.0 for a perfectly ordered search.
+        """
+        return {
+            "nodes": self.nodes,
+            "cutoffs": self.cutoffs,
+            "first_move_cutoffs": self.first_move_cutoffs,
+            "first_move_rate": self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+        }
+
+
+def get_noisy_moves(board, player):
+    """
+    Return the moves that capture stones or end in the player's own mancala,
+    which are the moves the quiescence search keeps searching. Captures come
+    first, largest first, then the mancala moves, each in pocket order.
+
+    :param board: the current MancalaState
+    :param player: the player to move
+    """
+    cells = board.cells
+    d = board.dimension
+    base = player * d
+    own_mancala = 2 * d + player
+    paths = board.paths[player]
+
+    scores = []
+    for move in range(d):
+        stone_count = cells[base + move]
+        if stone_count == 0:
+            continue
+        path = paths[move]
+        last = path[(stone_count - 1) % len(path)]
+        if last == own_mancala:
+            scores.append((0, move))
+        elif stone_count < len(path) and base <= last < base + d and cells[last] == 0:
+            opposite = last + d if player == TOP else last - d
+            if cells[opposite] > 0:
+                scores.append((cells[opposite], move))
+
+    # sort is stable, so equal scores stay in pocket order
+    scores.sort(key=lambda score: -score[0])
+    return [move for _, move in scores]
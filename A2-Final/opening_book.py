@@ -0,0 +1,160 @@
+###############################################################################
+# This file builds and reads an opening book for Mancala.
+#
+# The book is built offline by searching every position reachable from the
+# starting board in the first few plies, and stores the best move and value
+# found for each. AiPlayerInterface looks positions up in the book before
+# searching, so the first moves of a game cost no search at all.
+#
+# The file is a header followed by three arrays: the sorted 64 bit hashes of
+# the positions, their book moves, and their values.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+import argparse
+import hashlib
+import struct
+from array import array
+from bisect import bisect_left
+
+from agent_alphabeta import alphabeta_iterative_deepening
+from mancala_game import create_initial_board, play_turn
+from utils import *
+
+HEADER = struct.Struct("<6sBBBxI")
+MAGIC = b"MOBK01"
+
+DEFAULT_BOOK_PLIES = 3
+DEFAULT_BOOK_DEPTH = 8
+
+
+def get_position_hash(board, player):
+    """
+    Return a 64 bit hash of the position, the player to move and the extra-turn rule.
+    """
+    text = "{}|{}|{}|{}|{}".format(
+        ",".join(str(x) for x in board.pockets[TOP]),
+        ",".join(str(x) for x in board.pockets[BOTTOM]),
+        ",".join(str(x) for x in board.mancalas),
+        player,
+        int(board.extra_turn))
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+def build_opening_book(dimension, plies=DEFAULT_BOOK_PLIES, depth=DEFAULT_BOOK_DEPTH,
+                       heuristic_func=heuristic_advanced, extra_turn=False, filename=None):
+    """
+    Search every position reachable from the starting board in at most the
+    given number of plies, and return the book as a dictionary from position
+    hash to (move, value). If a filename is given, also write the book to it.
+
+    All moves of both players are expanded, so the book has an answer to any
+    opening the opponent plays.
+
+    :param dimension: the number of pockets per player
+    :param plies: the number of plies to cover
+    :param depth: the depth of the search for each position
+    :param heuristic_func: the heuristic function
+    :param extra_turn: whether the book is for the extra-turn rule
+    :param filename: the file to write the book to
+    """
+    book = {}
+    # the searches for each player share their tables, so later positions
+    # reuse earlier work (values are for the player at the root, so the two
+    # players cannot share them)
+    optimizations = [{}, {}]
+
+    level = [(create_initial_board(dimension, extra_turn=extra_turn), TOP)]
+    for ply in range(plies):
+        next_level = []
+        for board, player in level:
+            key = get_position_hash(board, player)
+            if key in book or not board.get_possible_moves(player):
+                continue
+
+            move, value = alphabeta_iterative_deepening(board, player, heuristic_func, float("Inf"), depth, optimizations[player])
+            book[key] = move, value
+
+            for move in board.get_possible_moves(player):
+                next_level.append(play_turn(board, player, move))
+        level = next_level
+
+    if filename is not None:
+        write_opening_book(book, dimension, plies, extra_turn, filename)
+    return book
+
+
+def write_opening_book(book, dimension, plies, extra_turn, filename):
+    """
+    Write a book from build_opening_book to the given file.
+    """
+    keys = sorted(book)
+    with open(filename, "wb") as f:
+        f.write(HEADER.pack(MAGIC, dimension, plies, int(extra_turn), len(keys)))
+        array('Q', keys).tofile(f)
+        array('b', [book[key][0] for key in keys]).tofile(f)
+        array('i', [int(book[key][1]) for key in keys]).tofile(f)
+
+
+class OpeningBook(object):
+    """
+    An opening book written by build_opening_book. Positions are found by
+    binary search over the sorted hashes.
+    """
+
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            magic, self.dimension, self.plies, extra_turn, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("{} is not an opening book".format(filename))
+            self.extra_turn = bool(extra_turn)
+
+            self.keys = array('Q')
+            self.keys.fromfile(f, count)
+            self.moves = array('b')
+            self.moves.fromfile(f, count)
+            self.values = array('i')
+            self.values.fromfile(f, count)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, board, player):
+        """
+        Return the book move and its value for the position,
+        or None if the position is not in the book.
+        """
+        key = get_position_hash(board, player)
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+
+        # a hash collision could give an illegal move
+        move = self.moves[i]
+        if move not in board.get_possible_moves(player):
+            return None
+        return move, self.values[i]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The file to write the opening book to."
+    )
+    parser.add_argument("--dimension", type=int, default=6, help="The number of pockets per player.")
+    parser.add_argument("--plies", type=int, default=DEFAULT_BOOK_PLIES, help="The number of plies the book covers.")
+    parser.add_argument("--depth", type=int, default=DEFAULT_BOOK_DEPTH, help="The search depth for each position.")
+    parser.add_argument("--heuristic", type=str, default="advanced", choices=["basic", "advanced"],
+                        help="The heuristic to search with.")
+    parser.add_argument("--extraTurn", action="store_true", help="Build the book for the extra-turn rule.")
+    args = parser.parse_args()
+
+    heuristic = heuristic_basic if args.heuristic == "basic" else heuristic_advanced
+    book = build_opening_book(args.dimension, args.plies, args.depth, heuristic, args.extraTurn, args.outputfile)
+    print("Wrote {} positions".format(len(book)))
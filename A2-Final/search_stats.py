@@ -0,0 +1,207 @@
+###############################################################################
+# This file collects statistics about the searches the agents run.
+#
+# The searches are not changed to collect them: AiPlayerInterface hands the
+# search an InstrumentedState, which counts the nodes it is moved through,
+# and a CountingHeuristic, which counts evaluations. Cache statistics come
+# from the transposition table and the minimax cache.
+#
+# Only the search in this process is counted: the workers of
+# alphabeta_parallel and mcts search copies of the board.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+from mancala_state import MancalaState
+from utils import *
+
+# Precision of the effective branching factor
+BRANCHING_FACTOR_TOLERANCE = 1e-6
+
+
+class SearchStats(object):
+    """
+    Counters for one or more searches.
+
+    nodes_by_ply[i] is the number of nodes visited i plies below the root.
+    A cutoff is a node where some but not all of the moves were searched.
+    Cache hits and misses are lookups that did or did not find a usable
+    entry, and overwrites are entries replaced by a different position.
+    """
+
+    def __init__(self):
+        self.nodes_by_ply = []
+        self.cutoffs = 0
+        self.heuristic_calls = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_overwrites = 0
+        self.time = 0.0
+        self.searches = 0
+
+    @property
+    def nodes(self):
+        return sum(self.nodes_by_ply)
+
+    def count_node(self, ply):
+        nodes_by_ply = self.nodes_by_ply
+        while len(nodes_by_ply) <= ply:
+            nodes_by_ply.append(0)
+        nodes_by_ply[ply] += 1
+
+    def get_branching_factor(self):
+        """
+        Return the effective branching factor b: the branching factor of a
+        uniform tree as deep as the deepest node visited, with as many nodes
+        below the root as were visited, N = b + b^2 + ... + b^d.
+        """
+        depth = len(self.nodes_by_ply) - 1
+        if depth <= 0:
+            return 0.0
+
+        # the root is counted once per search
+        target = self.nodes - self.nodes_by_ply[0]
+        low, high = 0.0, max(float(target), 1.0)
+        while high - low > BRANCHING_FACTOR_TOLERANCE:
+            b = (low + high) / 2
+            if sum(b ** i for i in range(1, depth + 1)) < target:
+                low = b
+            else:
+                high = b
+        return (low + high) / 2
+
+    def merge(self, other):
+        """
+        Add the counters of another SearchStats to these.
+        """
+        for ply, count in enumerate(other.nodes_by_ply):
+            while len(self.nodes_by_ply) <= ply:
+                self.nodes_by_ply.append(0)
+            self.nodes_by_ply[ply] += count
+        self.cutoffs += other.cutoffs
+        self.heuristic_calls += other.heuristic_calls
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        self.cache_overwrites += other.cache_overwrites
+        self.time += other.time
+        self.searches += other.searches
+
+    def to_dict(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "searches": self.searches,
+            "nodes": self.nodes,
+            "nodes_by_ply": list(self.nodes_by_ply),
+            "cutoffs": self.cutoffs,
+            "branching_factor": self.get_branching_factor(),
+            "heuristic_calls": self.heuristic_calls,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_overwrites": self.cache_overwrites,
+            "cache_hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            "time": self.time,
+            "time_per_search": self.time / self.searches if self.searches else 0.0,
+        }
+
+    def format(self):
+        """
+        Return a short multi-line report of the counters.
+        """
+        stats = self.to_dict()
+        lines = [
+            "searches: {}, time: {:.3f}s ({:.4f}s per search)".format(
+                stats["searches"], stats["time"], stats["time_per_search"]),
+            "nodes: {}, cutoffs: {}, effective branching factor: {:.2f}".format(
+                stats["nodes"], stats["cutoffs"], stats["branching_factor"]),
+            "nodes by ply: {}".format(" ".join(str(count) for count in stats["nodes_by_ply"])),
+            "heuristic calls: {}".format(stats["heuristic_calls"]),
+            "cache hits: {}, misses: {}, overwrites: {} (hit rate {:.1%})".format(
+                stats["cache_hits"], stats["cache_misses"], stats["cache_overwrites"], stats["cache_hit_rate"]),
+        ]
+        return "\n".join(lines)
+
+
+class InstrumentedState(MancalaState):
+    """
+    A MancalaState that counts the nodes a search visits and its cutoffs.
+
+    The depth of the current node is the number of moves made and not yet
+    undone. A node's cutoff is recorded when the move into it is undone, if
+    its moves were generated and only some of them were searched.
+    """
+
+    def __init__(self, board, stats):
+        super().__init__(board.pockets, board.mancalas, board.extra_turn)
+        self.stats = stats
+        self.ply = 0
+        self.expanded = [None]
+        self.searched = [0]
+        stats.count_node(0)
+
+    def get_possible_moves(self, player):
+        moves = super().get_possible_moves(player)
+        self.expanded[self.ply] = len(moves)
+        return moves
+
+    def make(self, player, move):
+        self.searched[self.ply] += 1
+        self.ply += 1
+        ply = self.ply
+        if len(self.expanded) <= ply:
+            self.expanded.append(None)
+            self.searched.append(0)
+        else:
+            self.expanded[ply] = None
+            self.searched[ply] = 0
+        self.stats.count_node(ply)
+        return super().make(player, move)
+
+    def unmake(self, undo):
+        super().unmake(undo)
+        self.count_cutoff(self.ply)
+        self.ply -= 1
+
+    def copy(self):
+        # searches that work on a copy of the board, like mcts, are counted too
+        state = super().copy()
+        state.__class__ = InstrumentedState
+        state.stats = self.stats
+        state.ply = 0
+        state.expanded = [None]
+        state.searched = [0]
+        return state
+
+    def restore(self, cells):
+        # the cells are copied at the root of the search
+        super().restore(cells)
+        self.ply = 0
+
+    def count_cutoff(self, ply):
+        expanded = self.expanded[ply]
+        if expanded is not None and 0 < self.searched[ply] < expanded:
+            self.stats.cutoffs += 1
+
+    def finish(self):
+        """
+        Record the root's cutoff, if any, once the search is over.
+        """
+        self.count_cutoff(0)
+
+
+class CountingHeuristic(object):
+    """
+    A heuristic function that counts its calls. It is a class rather than a
+    closure so it can still be sent to worker processes.
+    """
+
+    def __init__(self, heuristic_func, stats):
+        self.heuristic_func = heuristic_func
+        self.stats = stats
+        self.__name__ = heuristic_func.__name__
+        self.score_difference = getattr(heuristic_func, "score_difference", False)
+        self.symmetric = getattr(heuristic_func, "symmetric", False)
+
+    def __call__(self, board, player):
+        self.stats.heuristic_calls += 1
+        return self.heuristic_func(board, player)
@@ -0,0 +1,353 @@
+###############################################################################
+# Play a headless tournament between Mancala agents.
+#
+# Every pair of agents plays the same number of games. Games come in pairs
+# that start from the same seeded random opening with the agents on
+# opposite sides. Games are played in worker processes with no drawing and
+# no delays, and the results are summarized per agent: wins, draws, losses,
+# Elo rating, nodes searched per move and time per move.
+#
+# Agents are given as "algorithm[:key=value...]", for example
+#   alphabeta:heuristic=advanced:limit=4:opt=1
+#   pvs:heuristic=advanced:limit=-1:time=0.2
+#   random
+# with the keys heuristic (basic, advanced or weighted), weights (a weights
+# file from evaluation.py, for the weighted heuristic), limit (the depth
+# limit, or for mcts the iteration limit, which is off by default), opt (0 or 1),
+# time (seconds per move for the time-managed agents), quiescence (plies
+# the optimized alpha-beta agents can search past the depth limit) and cache
+# (a snapshot file the agent's caches are warm-started from and saved to
+# after each game; with several processes the last game to finish wins).
+#
+# The games can also be appended to a game record file (see game_record.py),
+# to be analyzed for blunders later.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import time
+import uuid
+
+import agent_random
+from agent_alphabeta import run_alphabeta, run_alphabeta_id
+from agent_mcts import run_mcts
+from agent_minimax import run_minimax
+from agent_pvs import run_pvs
+from agent_random import run_random
+from evaluation import WeightedHeuristic
+from game_record import GameRecord, write_records
+from mancala_game import *
+from utils import *
+
+ALGORITHMS = {
+    "minimax": run_minimax,
+    "alphabeta": run_alphabeta,
+    "alphabeta_id": run_alphabeta_id,
+    "pvs": run_pvs,
+    "mcts": run_mcts,
+    "random": run_random,
+}
+HEURISTICS = {
+    "basic": heuristic_basic,
+    "advanced": heuristic_advanced,
+    "weighted": WeightedHeuristic(),
+}
+
+DEFAULT_LIMIT = 4
+# mcts reads the limit as its iteration limit, so it is only capped by time by default
+DEFAULT_MCTS_LIMIT = -1
+DEFAULT_OPENING_PLIES = 2
+ELO_ITERATIONS = 200
+
+
+def parse_agent(spec):
+    """
+    Return the settings of an agent given as "algorithm[:key=value...]".
+    """
+    parts = spec.split(":")
+    if parts[0] not in ALGORITHMS:
+        raise ValueError("Algorithm not recognized in {}. Options are {}.".format(spec, sorted(ALGORITHMS)))
+
+    agent = {"name": spec, "algorithm": parts[0], "heuristic": "basic",
+             "limit": DEFAULT_MCTS_LIMIT if parts[0] == "mcts" else DEFAULT_LIMIT, "opt": False, "time": None, "weights": None, "quiescence": None, "cache": None}
+    for part in parts[1:]:
+        key, _, value = part.partition("=")
+        if key == "heuristic":
+            if value not in HEURISTICS:
+                raise ValueError("Heuristic not recognized in {}. Options are [basic, advanced, weighted].".format(spec))
+            agent["heuristic"] = value
+        elif key == "weights":
+            agent["heuristic"] = "weighted"
+            agent["weights"] = value
+        elif key == "limit":
+            agent["limit"] = int(value)
+        elif key == "opt":
+            agent["opt"] = value not in ("", "0")
+        elif key == "time":
+            agent["time"] = float(value)
+        elif key == "quiescence":
+            agent["quiescence"] = int(value)
+        elif key == "cache":
+            agent["cache"] = value
+        else:
+            raise ValueError("Unknown setting {} in {}".format(key, spec))
+    return agent
+
+
+def create_player(agent, player):
+    """
+    Return an AiPlayerInterface for the agent settings from parse_agent,
+    which counts the nodes of its searches.
+    """
+    if agent["weights"] is not None:
+        heuristic = WeightedHeuristic.load(agent["weights"])
+    else:
+        heuristic = HEURISTICS[agent["heuristic"]]
+    return AiPlayerInterface(player, ALGORITHMS[agent["algorithm"]], agent["limit"], agent["opt"],
+                             heuristic, agent["time"], collect_stats=True, quiescence=agent["quiescence"], cache_file=agent["cache"])
+
+
+def play_opening(board, plies, rng, record=None):
+    """
+    Play random moves from the starting board, adding them to the GameRecord if any.
+    Return the board and the player to move.
+    """
+    player = TOP
+    for _ in range(plies):
+        moves = board.get_possible_moves(player)
+        if not moves:
+            break
+        move = rng.choice(moves)
+        if record is not None:
+            record.add_move(move)
+            record.opening += 1
+        board, player = play_turn(board, player, move)
+    return board, player
+
+
+def play_game(game, agents, dimension, extra_turn, opening_plies, seed, record=False, tournament_id=None):
+    """
+    Play one game of the tournament and return its result.
+
+    :param game: the game's number; game pairs share an opening and swap sides
+    :param agents: the settings of the TOP and BOTTOM agents
+    :param record: whether to add the GameRecord of the game to the result, under "record"
+    :param tournament_id: a random suffix for the game ids, so games of different
+        tournaments with the same seed can be told apart in a record file
+    """
+    agent_random.MOVE_DELAY = 0
+    random.seed(seed * 1000003 + game)
+
+    board = create_initial_board(dimension, extra_turn=extra_turn)
+    game_record = None
+    if record:
+        game_id = "{}-{}".format(seed, game) if tournament_id is None else "{}-{}-{}".format(seed, game, tournament_id)
+        game_record = GameRecord(board, [agents[TOP]["name"], agents[BOTTOM]["name"]], game_id=game_id)
+    board, player = play_opening(board, opening_plies, random.Random(seed * 1000003 + game // 2), game_record)
+    players = [create_player(agents[TOP], TOP), create_player(agents[BOTTOM], BOTTOM)]
+
+    moves = [0, 0]
+    times = [0.0, 0.0]
+    nodes = [0, 0]
+    counted = [True, True]
+    while board.get_possible_moves(player):
+        player_obj = players[player]
+        time_start = time.perf_counter()
+        move, value, stats = player_obj.search(board, player)
+        move_time = time.perf_counter() - time_start
+        times[player] += move_time
+        moves[player] += 1
+
+        move_nodes = stats.nodes if stats is not None else None
+        if move_nodes is None:
+            counted[player] = False
+        else:
+            nodes[player] += move_nodes
+
+        if game_record is not None:
+            game_record.add_move(move, value, move_nodes, move_time)
+
+        board, player = play_turn(board, player, move)
+
+    for player_obj in players:
+        player_obj.save_cache()
+        player_obj.close()
+
+    if board.mancalas[TOP] != board.mancalas[BOTTOM]:
+        winner = TOP if board.mancalas[TOP] > board.mancalas[BOTTOM] else BOTTOM
+    else:
+        winner = None
+
+    result = {
+        "game": game,
+        "agents": [agents[TOP]["name"], agents[BOTTOM]["name"]],
+        "winner": winner,
+        "mancalas": list(board.mancalas),
+        "moves": moves,
+        "times": times,
+        "nodes": [nodes[p] if counted[p] else None for p in (TOP, BOTTOM)],
+    }
+    if game_record is not None:
+        result["record"] = game_record
+    return result
+
+
+def get_elo_ratings(names, results):
+    """
+    Return Elo ratings fitted to the game results with the Bradley-Terry model,
+    relative to the first agent at 0. A draw counts as half a win for each side,
+    and every pair of agents gets one extra draw so that an agent that won or
+    lost every game still has a finite rating.
+    """
+    index = {name: i for i, name in enumerate(names)}
+    n = len(names)
+    scores = [0.0] * n
+    games = [[0.0] * n for _ in range(n)]
+
+    for i, j in itertools.combinations(range(n), 2):
+        scores[i] += 0.5
+        scores[j] += 0.5
+        games[i][j] += 1
+        games[j][i] += 1
+    for result in results:
+        top, bottom = index[result["agents"][TOP]], index[result["agents"][BOTTOM]]
+        games[top][bottom] += 1
+        games[bottom][top] += 1
+        if result["winner"] is None:
+            scores[top] += 0.5
+            scores[bottom] += 0.5
+        else:
+            scores[top if result["winner"] == TOP else bottom] += 1
+
+    strengths = [1.0] * n
+    for _ in range(ELO_ITERATIONS):
+        for i in range(n):
+            denominator = sum(games[i][j] / (strengths[i] + strengths[j]) for j in range(n) if j != i)
+            if denominator > 0:
+                strengths[i] = scores[i] / denominator
+
+    return [400 * math.log10(strength / strengths[0]) for strength in strengths]
+
+
+def summarize(names, results):
+    """
+    Return the per-agent statistics of a tournament.
+    """
+    summary = []
+    for name, elo in zip(names, get_elo_ratings(names, results)):
+        stats = {"agent": name, "games": 0, "wins": 0, "draws": 0, "losses": 0,
+                 "moves": 0, "time": 0.0, "nodes": 0, "counted_moves": 0, "elo": elo}
+        for result in results:
+            for side in (TOP, BOTTOM):
+                if result["agents"][side] != name:
+                    continue
+                stats["games"] += 1
+                if result["winner"] is None:
+                    stats["draws"] += 1
+                elif result["winner"] == side:
+                    stats["wins"] += 1
+                else:
+                    stats["losses"] += 1
+                stats["moves"] += result["moves"][side]
+                stats["time"] += result["times"][side]
+                if result["nodes"][side] is not None:
+                    stats["nodes"] += result["nodes"][side]
+                    stats["counted_moves"] += result["moves"][side]
+
+        games = max(stats["games"], 1)
+        stats["win_rate"] = stats["wins"] / games
+        stats["draw_rate"] = stats["draws"] / games
+        stats["time_per_move"] = stats["time"] / max(stats["moves"], 1)
+        stats["nodes_per_move"] = stats["nodes"] / stats["counted_moves"] if stats["counted_moves"] else None
+        summary.append(stats)
+    return summary
+
+
+def run_tournament(specs, games_per_pair, dimension=6, extra_turn=False,
+                   opening_plies=DEFAULT_OPENING_PLIES, seed=0, processes=None, record_file=None):
+    """
+    Play a round-robin tournament and return the game results and the summary.
+
+    :param specs: the agents, as "algorithm[:key=value...]" strings
+    :param games_per_pair: the games each pair of agents plays, rounded up to an even number
+    :param processes: the number of worker processes, the number of CPUs if None
+    :param record_file: a game record file to append the games to, if any
+    """
+    agents = [parse_agent(spec) for spec in specs]
+    names = [agent["name"] for agent in agents]
+    if len(set(names)) != len(names):
+        raise ValueError("Each agent should be given once")
+
+    tournament_id = uuid.uuid4().hex[:8]
+    tasks = []
+    game = 0
+    for first, second in itertools.combinations(agents, 2):
+        for _ in range((games_per_pair + 1) // 2):
+            tasks.append((game, [first, second], dimension, extra_turn, opening_plies, seed, record_file is not None, tournament_id))
+            tasks.append((game + 1, [second, first], dimension, extra_turn, opening_plies, seed, record_file is not None, tournament_id))
+            game += 2
+
+    if processes == 1:
+        results = [play_game(*task) for task in tasks]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(play_game, tasks, 1)
+
+    if record_file is not None:
+        write_records(record_file, [result.pop("record") for result in results])
+
+    return results, summarize(names, results)
+
+
+def print_summary(summary):
+    print("{:<40} {:>6} {:>6} {:>6} {:>6} {:>7} {:>7} {:>8} {:>12} {:>10}".format(
+        "agent", "games", "wins", "draws", "losses", "win%", "draw%", "elo", "nodes/move", "s/move"))
+    for stats in summary:
+        nodes = "-" if stats["nodes_per_move"] is None else "{:.1f}".format(stats["nodes_per_move"])
+        print("{:<40} {:>6} {:>6} {:>6} {:>6} {:>7.1f} {:>7.1f} {:>8.1f} {:>12} {:>10.4f}".format(
+            stats["agent"], stats["games"], stats["wins"], stats["draws"], stats["losses"],
+            100 * stats["win_rate"], 100 * stats["draw_rate"], stats["elo"], nodes, stats["time_per_move"]))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="MancalaTournament",
+        description="Play a headless round-robin tournament between Mancala agents"
+    )
+    parser.add_argument("agents", nargs="+",
+                        help="The agents, as algorithm[:heuristic=..][:weights=..][:limit=..][:opt=1][:time=..][:quiescence=..][:cache=..].")
+    parser.add_argument("-g", "--games", type=int, default=10,
+                        help="Games per pair of agents, rounded up to an even number. Default is 10.")
+    parser.add_argument("-d", "--dimension", type=int, default=6,
+                        help="Dimension of mancala board. Default is 6.")
+    parser.add_argument("-x", "--extraTurn", action="store_true",
+                        help="Use flag to play with the extra-turn rule.")
+    parser.add_argument("-r", "--openingPlies", type=int, default=DEFAULT_OPENING_PLIES,
+                        help="Random moves played before the agents take over. Default is {}.".format(DEFAULT_OPENING_PLIES))
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="Seed for the random openings. Default is 0.")
+    parser.add_argument("-p", "--processes", type=int,
+                        help="Worker processes. Default is the number of CPUs.")
+    parser.add_argument("-j", "--json", type=str,
+                        help="(Optional) File to write the game results and summary to.")
+    parser.add_argument("-R", "--record", type=str,
+                        help="(Optional) Game record file to append the games to, for game_record.py. Compressed if it ends in .gz.")
+    args = parser.parse_args()
+
+    time_start = time.perf_counter()
+    results, summary = run_tournament(args.agents, args.games, args.dimension, args.extraTurn,
+                                      args.openingPlies, args.seed, args.processes, args.record)
+    print_summary(summary)
+    print("{} games in {:.1f}s".format(len(results), time.perf_counter() - time_start))
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({"results": results, "summary": summary}, f, indent=2)
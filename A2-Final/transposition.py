@@ -0,0 +1,130 @@
+###############################################################################
+# This file implements a fixed-size transposition table for the search agents.
+#
+# CSC 384 Assignment 2
+# version 2.0
+###############################################################################
+
+### Bound types ###
+EXACT = 0        # the stored value is the exact value of the position
+LOWER_BOUND = 1  # the search failed high, the true value is at least the stored value
+UPPER_BOUND = 2  # the search failed low, the true value is at most the stored value
+
+DEFAULT_TT_SIZE = 1 << 16
+
+
+def get_bound(value, alpha, beta):
+    """
+    Return the bound type of a value returned by a search with the window (alpha, beta).
+    """
+    if value <= alpha:
+        return UPPER_BOUND
+    if value >= beta:
+        return LOWER_BOUND
+    return EXACT
+
+
+class TranspositionTable(object):
+    """
+    A transposition table with a fixed number of buckets, so its memory
+    stays bounded however long it is used.
+
+    Each bucket has two slots. The first keeps the entry searched to the
+    greatest depth (depth-preferred), the second always takes the newest
+    entry that did not qualify for the first (always-replace). Entries are
+    tuples (key, depth, value, bound, best_move).
+
+    The table is kept between moves, so the depth-preferred slot also
+    records the generation (see new_generation) it was written in: an
+    entry from an earlier search can be replaced by a shallower one, so old
+    deep entries do not fill the table, but is still used until then.
+
+    The table counts probes that found an entry (hits) or not (misses), and
+    stores that displaced the entry of another position (overwrites).
+    """
+
+    def __init__(self, size=DEFAULT_TT_SIZE):
+        """
+        :param size: the number of buckets, rounded up to a power of two.
+        """
+        buckets = 1
+        while buckets < size:
+            buckets *= 2
+
+        self.mask = buckets - 1
+        self.slots = [None] * (2 * buckets)
+        self.generation = 0
+        self.generations = [0] * buckets
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.overwrites = 0
+
+    def probe(self, key):
+        """
+        Return the entry stored for the key, or None if there is none.
+        """
+        i = (hash(key) & self.mask) << 1
+        entry = self.slots[i]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        entry = self.slots[i + 1]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, value, bound, best_move):
+        """
+        Store the result of searching the position with the given key to the given depth.
+        """
+        i = (hash(key) & self.mask) << 1
+        slots = self.slots
+        entry = (key, depth, value, bound, best_move)
+
+        deepest = slots[i]
+        bucket = i >> 1
+        if (deepest is None or deepest[0] == key or depth >= deepest[1]
+                or self.generations[bucket] != self.generation):
+            # the entry we displace is still useful, so keep it in the other slot
+            if deepest is not None and deepest[0] != key:
+                displaced = slots[i + 1]
+                slots[i + 1] = deepest
+            else:
+                displaced = None
+            slots[i] = entry
+            self.generations[bucket] = self.generation
+        else:
+            displaced = slots[i + 1]
+            slots[i + 1] = entry
+
+        if displaced is not None and displaced[0] != key:
+            self.overwrites += 1
+
+    def new_generation(self):
+        """
+        Start a new search: entries stored so far can be replaced by any new entry.
+        """
+        self.generation += 1
+
+    def entries(self):
+        """
+        Return the stored entries, deepest first.
+        """
+        return sorted((entry for entry in self.slots if entry is not None), key=lambda entry: -entry[1])
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+
+    def get_stats(self):
+        """
+        Return the probe and store counts since the last reset.
+        """
+        return {"hits": self.hits, "misses": self.misses, "overwrites": self.overwrites}
+
+    def __len__(self):
+        return sum(1 for entry in self.slots if entry is not None)
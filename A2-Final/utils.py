@@ -35,6 +35,16 @@ def get_opponent(player):
 ### DO NOT MODIFY THE CODE ABOVE
 ###############################################################################
 
+# Default per-move time budget in seconds for the time-managed agents
+DEFAULT_MOVE_TIME = 5
+
+class SearchTimeout(RuntimeError):
+    """
+    Raised inside a search when its deadline has passed,
+    so the search unwinds to the driver that set the deadline.
+    """
+    pass
+
 
 def heuristic_basic(board, player):
     """
@@ -60,6 +70,10 @@ def heuristic_advanced(board, player):
     :param player: the current player.
     :return: an estimated heuristic value of the current board for the current player.
     """
+
+    # a MancalaState keeps its row sums up to date
+    if hasattr(board, "row_sums"):
+        return heuristic_advanced_state(board, player)
     
     opponent = get_opponent(player)
     own_pockets = board.pockets[player]
@@ -95,4 +109,44 @@ def heuristic_advanced(board, player):
         3 * basic +
         2 * stone_diff +
         5 * capture_potential
-    )
\ No newline at end of file
+    )
+
+
+def heuristic_advanced_state(state, player):
+    """
+    Compute heuristic_advanced on a MancalaState. The stone difference comes
+    from the row sums the state keeps as moves are made and unmade, and the
+    capture scan reads the flat list of cells, so no row is copied or summed.
+
+    :param state: the current MancalaState.
+    :param player: the current player.
+    :return: the same value as heuristic_advanced.
+    """
+
+    opponent = get_opponent(player)
+    cells = state.cells
+    d = state.dimension
+    own_base, opp_base = player * d, opponent * d
+    laps = 2 * d + 1
+
+    capture_potential = 0
+    for i in range(d):
+        stones = cells[own_base + i]
+        if stones == 0:
+            continue
+        end = (i + stones) % laps
+        if end < d and cells[own_base + end] == 0 and cells[opp_base + end] > capture_potential:
+            capture_potential = cells[opp_base + end]
+
+    return (
+        3 * (cells[2 * d + player] - cells[2 * d + opponent]) +
+        2 * (state.row_sums[player] - state.row_sums[opponent]) +
+        5 * capture_potential
+    )
+
+
+# What the heuristics depend on, so the searches can share cache entries
+# between positions they cannot tell apart (see canonical.py)
+heuristic_basic.score_difference = True
+heuristic_basic.symmetric = True
+heuristic_advanced.score_difference = True